@@ -1,24 +1,23 @@
+import asyncio
 import threading
 
 from ib_insync import *
 from datetime import datetime, date, timedelta
+from MarketDataSubscriptionManager import MarketDataSubscriptionManager, SubscriptionPriority
+from OpenOrderIndex import OpenOrderIndex
+from OptionAnalyticsCache import OptionAnalyticsCache, AVG_24HR, HIGH_24HR, AVG_15DAY, HIGH_15DAY, DTE, \
+    ESTIMATED_THETA, STRIKE
+from StrikeSelector import StrikeSelector
 from TradeManager import TradeManager
 from TradeStrategy import TradeStrategy
 
 
-AVG_24HR = "avg_24hr"
-HIGH_24HR = "high_24hr"
-AVG_15DAY = "avg_15day"
-HIGH_15DAY = "high_15day"
-DTE = "dte"
-ESTIMATED_THETA = "estimated_theta"
-STRIKE = "strike"
-
-
 # On start-up, scan the account positions related to this ticker; register callback to handle event accordingly
 # data_stream -> callback -> buy_sell_decision -> trade_event -> trade_event_callback
 class CoveredCallOperation:
-    def __init__(self, stock_symbol: str, ib_client: IB, trade_strategy: TradeStrategy, short_term_dte=30):
+    def __init__(self, stock_symbol: str, ib_client: IB, trade_strategy: TradeStrategy, short_term_dte=30,
+                 open_order_index: OpenOrderIndex = None, option_analytics_cache: OptionAnalyticsCache = None,
+                 market_data_manager: MarketDataSubscriptionManager = None):
         self.symbol = stock_symbol
         self.ib = ib_client
         # Position tracker for the symbol
@@ -29,18 +28,37 @@ class CoveredCallOperation:
         self.short_term_call_position = None
 
         self.stock_1day_df = None
+        # date the 1 day bars were loaded; they are loaded again once it changes
+        self.stock_1day_df_date = None
+        self.stock_1day_df_task = None
 
         # Managing analytics
         self.short_term_dte_limit = short_term_dte  # need to be less than a month
         self.existing_option_analytics_map = {}
         self.option_analytics_map = {}
+        # the option data is fetched in the background, so the tick handlers never wait for it; the cache is shared
+        # with the other operations on the same symbol
+        if option_analytics_cache is None:
+            option_analytics_cache = OptionAnalyticsCache.get_shared_cache(self.ib, stock_symbol)
+        self.option_analytics_cache = option_analytics_cache
+        self.strike_selector = StrikeSelector.get_shared_selector(self.ib)
         # Managing trade activities
         self.trade_strategy = trade_strategy
-        self.trade_manager_to_buyback_calls = TradeManager(self.ib, to_sell=False, to_buy=True)
-        self.trade_manager_to_sell_calls = TradeManager(self.ib, to_sell=True, to_buy=False)
-
-        # Managing subscription; un/subscribe to the ticker data streams
-        self.stock_ticker = None
+        # open trades kept current from the order events; shared by the operations of all the symbols
+        if open_order_index is None:
+            open_order_index = OpenOrderIndex.get_shared_index(self.ib)
+        self.open_order_index = open_order_index
+        self.trade_manager_to_buyback_calls = TradeManager(self.ib, to_sell=False, to_buy=True,
+                                                           open_order_index=open_order_index)
+        self.trade_manager_to_sell_calls = TradeManager(self.ib, to_sell=True, to_buy=False,
+                                                        open_order_index=open_order_index)
+
+        # Managing subscription; un/subscribe to the ticker data streams. The market data lines are budgeted across
+        # the operations of all the symbols
+        if market_data_manager is None:
+            market_data_manager = MarketDataSubscriptionManager.get_shared_manager(self.ib)
+        self.market_data_manager = market_data_manager
+        self.stock_contract = Stock(self.symbol, "SMART", currency="USD")
         self.short_term_call_data_sub_list = []
         self.subscribe_to_stock_data_streams()
         self.subscribe_option_data_streams()
@@ -53,11 +71,11 @@ class CoveredCallOperation:
         self.ib.positionEvent += self.on_position_event
 
     def on_ib_disconnect(self):
-        self.unsubscribe_option_data_streams()
+        # the market data manager requests the lines again on connect
         return
 
     def on_ib_connect(self):
-        self.stock_1day_df = self.req_1day_data()
+        self.set_1day_data(self.req_1day_data())
         self.subscribe_to_stock_data_streams()
         self.subscribe_option_data_streams()
         return
@@ -94,35 +112,42 @@ class CoveredCallOperation:
         return
 
     def subscribe_to_stock_data_streams(self):
-        stk_contract = Stock(self.symbol, "SMART", currency="USD")
-        self.stock_ticker = self.ib.reqMktData(stk_contract)
-        self.stock_ticker.updateEvent += self.share_price_update_callback
+        self.market_data_manager.subscribe(self.stock_contract, self.share_price_update_callback,
+                                           SubscriptionPriority.STOCK)
         return
 
+    # the ticker of the stock's current line, None while it waits for one; looked up when it is needed, as the line
+    # gets a new ticker after an eviction or a reconnect
+    def get_stock_ticker(self):
+        return self.market_data_manager.get_ticker(self.stock_contract)
+
+    # only the contracts that changed since the last call are subscribed or unsubscribed
     def subscribe_option_data_streams(self):
-        # Reset subscription
-        self.unsubscribe_option_data_streams()
         self.refresh_ticker_positions()
         if self.short_term_call_position is None:
+            self.unsubscribe_option_data_streams()
             return
         if self.short_term_call_position.position != 0:
             print("Found short term short call position. Let's see if we need to buy back")
-            st_ticker = self.ib.reqMktData(self.short_term_call_contract)
-            st_ticker.updateEvent += self.buy_short_term_call_callback
-            self.short_term_call_data_sub_list.append(self.short_term_call_contract)
+            self.short_term_call_data_sub_list = [self.short_term_call_contract]
+            self.market_data_manager.set_subscriptions(self.sell_short_term_call_callback, [])
+            self.market_data_manager.set_subscriptions(self.buy_short_term_call_callback,
+                                                       self.short_term_call_data_sub_list,
+                                                       SubscriptionPriority.OPEN_POSITION)
         else:
             # subscribe to candidate stream positions
             print("More short term positions can be open. Let's see if we can sell some")
-            st_call_contracts = self.get_covered_call_candidates(CoveredCallOperation.get_next_n_fridays(4))
-            for st_call_contract in st_call_contracts:
-                st_ticker = self.ib.reqMktData(st_call_contract)
-                st_ticker.updateEvent += self.sell_short_term_call_callback
-                self.short_term_call_data_sub_list.append(st_call_contract)
+            self.short_term_call_data_sub_list = \
+                self.get_covered_call_candidates(CoveredCallOperation.get_next_n_fridays(4))
+            self.market_data_manager.set_subscriptions(self.buy_short_term_call_callback, [])
+            self.market_data_manager.set_subscriptions(self.sell_short_term_call_callback,
+                                                       self.short_term_call_data_sub_list,
+                                                       SubscriptionPriority.CANDIDATE)
         return
 
     def unsubscribe_option_data_streams(self):
-        for st_contract in self.short_term_call_data_sub_list:
-            self.ib.cancelMktData(st_contract)
+        self.market_data_manager.set_subscriptions(self.buy_short_term_call_callback, [])
+        self.market_data_manager.set_subscriptions(self.sell_short_term_call_callback, [])
         # reset the subscription list
         self.short_term_call_data_sub_list = []
         return
@@ -143,8 +168,11 @@ class CoveredCallOperation:
         bid = ticker_event.bid
         expected_price = (ask + bid)/2
 
-        if key not in self.option_analytics_map:
-            self.get_option_contract_analytics_data(option_contract)
+        # no analytics yet: they are being fetched, decide on one of the next ticks
+        analytics = self.option_analytics_cache.get_analytics(option_contract)
+        if analytics is None:
+            return
+        self.option_analytics_map[key] = analytics
 
         dte = self.option_analytics_map[key][DTE]
 
@@ -186,8 +214,10 @@ class CoveredCallOperation:
         assert self.get_contract_key(option_contract) == self.get_contract_key(self.short_term_call_contract)
 
         key = CoveredCallOperation.get_contract_key(option_contract)
-        if key not in self.existing_option_analytics_map:
-            self.get_option_contract_analytics_data(self.short_term_call_contract)
+        analytics = self.option_analytics_cache.get_analytics(self.short_term_call_contract)
+        if analytics is None:
+            return
+        self.existing_option_analytics_map[key] = analytics
 
         expected_price = (ask + bid) / 2
         dte = self.existing_option_analytics_map[key][DTE]
@@ -207,51 +237,41 @@ class CoveredCallOperation:
 
     # Todo: here - we need to consider the scenario of potential double trade
     def place_sell_order(self, call_contract, quantity, current_ask, minimum_ask):
-        open_trades = self.ib.openTrades()
-        self.ib.sleep(1)
-        for open_trade in open_trades:
-            if open_trade.contract.symbol == self.symbol \
-                    and open_trade.orderStatus not in OrderStatus.DoneStates \
-                    and isinstance(open_trade.contract, Option):
-                expiration_date = datetime.strptime(open_trade.contract.lastTradeDateOrContractMonth, "%Y%m%d")
-                today_date = datetime.now()
-                if (expiration_date - today_date).days <= self.short_term_dte_limit \
-                        and open_trade.contract.right in ['C', "CALL"]:
-                    print("There are other pending call option trades for short term; won't proceed")
-                    return
+        if self.open_order_index.has_open_option_trade_within_dte(self.symbol, 'C', self.short_term_dte_limit):
+            print("There are other pending call option trades for short term; won't proceed")
+            return
         if self.trade_manager_to_sell_calls.is_trade_manager_busy():
             print("Trade manager is busy. Need to wait until trade manager finishes the work. Exit for now")
             return
+        stock_ticker = self.get_stock_ticker()
+        if stock_ticker is None:
+            print("No market data line for " + self.symbol + " yet. Won't trade for now")
+            return
         # Todo: can add callback to current trade object
         current_trade = self.trade_manager_to_sell_calls.execute_trade(
             self.symbol,
             call_contract,
-            self.stock_ticker,
+            stock_ticker,
             quantity,
             minimum_ask,
             current_ask)
         return current_trade
 
     def place_buy_order(self, call_contract, quantity, maximum_bid, current_bid):
-        open_trades = self.ib.openTrades()
-        self.ib.sleep(1)
-        for open_trade in open_trades:
-            if open_trade.contract.symbol == self.symbol \
-                    and open_trade.orderStatus not in OrderStatus.DoneStates \
-                    and isinstance(open_trade.contract, Option):
-                expiration_date = datetime.strptime(open_trade.contract.lastTradeDateOrContractMonth, "%Y%m%d")
-                today_date = datetime.now()
-                if (expiration_date - today_date).days <= self.short_term_dte_limit \
-                        and open_trade.contract.right in ['C', "CALL"]:
-                    print("There are other pending call option trades for short term; won't proceed")
-                    return
+        if self.open_order_index.has_open_option_trade_within_dte(self.symbol, 'C', self.short_term_dte_limit):
+            print("There are other pending call option trades for short term; won't proceed")
+            return
         if self.trade_manager_to_buyback_calls.is_trade_manager_busy():
             print("Trade manager is busy. Need to wait until trade manager finishes the work. Exit for now")
             return
+        stock_ticker = self.get_stock_ticker()
+        if stock_ticker is None:
+            print("No market data line for " + self.symbol + " yet. Won't trade for now")
+            return
         current_trade = self.trade_manager_to_buyback_calls.execute_trade(
             self.symbol,
             call_contract,
-            self.stock_ticker,
+            stock_ticker,
             quantity,
             current_bid,
             maximum_bid)
@@ -276,60 +296,64 @@ class CoveredCallOperation:
 
     def reset_option_trade(self):
         self.refresh_ticker_positions()
-        self.unsubscribe_option_data_streams()
         self.subscribe_option_data_streams()
         return
 
     # Todo: this needs to be replaced by the strategy class
     def get_covered_call_candidates(self, date_str_list):
-        # to return a list of short term call contract
-        price_list = self.stock_ticker["close"].values.tolist()
-        adaptive_pred = [0] * len(price_list)
-        for i in range(40, len(price_list)):
-            if price_list[i] >= price_list[i - 30] * 1.35:
-                adaptive_pred[i] = 1.1 * price_list[i]
-            elif price_list[i] >= price_list[i - 10] * 1.15:
-                adaptive_pred[i] = 1.15 * price_list[i]
-            else:
-                adaptive_pred[i] = 1.2 * price_list[i]
-
-        potential_strike_price_list = [int(adaptive_pred[-1]/5) * 5 + k*5 for k in range(1, 4)]
-
-        st_contracts = []
-        for date_str in date_str_list:
-            for strike_price in potential_strike_price_list:
-                st_contracts.append(Option(symbol=self.symbol,
-                                           lastTradeDateOrContractMonth=date_str,
-                                           strike=strike_price,
-                                           right='C',
-                                           exchange='SMART',
-                                           currency="USD"))
-
-        for st_contract in st_contracts:
-            self.get_option_contract_analytics_data(st_contract)
+        # to return a list of short term call contract, listed ones only. The 1 day bars and the option chain are
+        # fetched in the background once a day; the candidates are picked again once they arrive
+        if self.stock_1day_df is None or self.stock_1day_df_date != date.today():
+            self.load_1day_data()
+            return []
+        st_contracts = self.strike_selector.get_candidate_contracts(self.symbol,
+                                                                    self.stock_1day_df["close"].to_numpy(),
+                                                                    date_str_list,
+                                                                    self.on_option_chain)
+
+        # all the candidates are fetched concurrently; the sell callback waits for the analytics of its contract
+        self.option_analytics_cache.prefetch(st_contracts)
 
         return st_contracts
 
+    def on_option_chain(self, symbol):
+        self.subscribe_option_data_streams()
+        return
+
+    def load_1day_data(self):
+        if self.stock_1day_df_task is not None and not self.stock_1day_df_task.done():
+            return
+        self.stock_1day_df_task = asyncio.ensure_future(self.req_1day_data_async())
+        self.stock_1day_df_task.add_done_callback(self.on_1day_data)
+        return
+
+    def on_1day_data(self, task):
+        try:
+            df = task.result()
+        except Exception as e:
+            print("Failed to fetch the 1 day data of " + self.symbol + ": " + str(e))
+            return
+        if df is None or len(df) == 0:
+            print("No 1 day data for " + self.symbol + ". No covered call candidates")
+            return
+        self.set_1day_data(df)
+        self.subscribe_option_data_streams()
+        return
+
+    def set_1day_data(self, df):
+        self.stock_1day_df = df
+        self.stock_1day_df_date = date.today()
+        return
+
     def get_option_contract_analytics_data(self, option_contract: Option):
         expiration_date = datetime.strptime(option_contract.lastTradeDateOrContractMonth, "%Y%m%d")
         today_date = datetime.now()
         dte = (expiration_date - today_date).days
         assert dte > 0
         option_df = self.req_15day_1hour_option_data(option_contract)
-        high_list = option_df["high"].values.tolist()
-        avg_24hr = sum(high_list[-24:]) / len(high_list[-24:])
-        high_24hr = max(high_list[-24:])
-        avg_15day = sum(high_list) / len(high_list)
-        high_15day = max(high_list)
+        self.option_analytics_cache.add_bars(option_contract, option_df)
         key = CoveredCallOperation.get_contract_key(option_contract)
-        self.option_analytics_map[key] = {}
-        self.option_analytics_map[key][AVG_24HR] = avg_24hr
-        self.option_analytics_map[key][HIGH_24HR] = high_24hr
-        self.option_analytics_map[key][AVG_15DAY] = avg_15day
-        self.option_analytics_map[key][HIGH_15DAY] = high_15day
-        self.option_analytics_map[key][DTE] = dte
-        self.option_analytics_map[key][ESTIMATED_THETA] = avg_15day/dte
-        self.option_analytics_map[key][STRIKE] = option_contract.strike
+        self.option_analytics_map[key] = self.option_analytics_cache.get_analytics(option_contract)
         return
 
     def req_15day_1hour_option_data(self, option_contract: Option):
@@ -351,6 +375,16 @@ class CoveredCallOperation:
         df = util.df(bars)
         return df
 
+    async def req_1day_data_async(self):
+        stock_contract = Stock(self.symbol, 'SMART', currency='USD')
+        bars = await self.ib.reqHistoricalDataAsync(stock_contract,
+                                                    endDateTime='',
+                                                    durationStr='120 D',
+                                                    barSizeSetting='1 day',
+                                                    whatToShow='TRADES',
+                                                    useRTH=True)
+        return util.df(bars)
+
     def get_existing_contract_cache(self):
         return self.existing_option_analytics_map
 
@@ -0,0 +1,171 @@
+from ib_insync import *
+
+
+class SubscriptionPriority:
+    CANDIDATE = 1
+    STOCK = 2
+    OPEN_POSITION = 3
+
+
+# One wanted market data line: the contract it was requested with, its ticker while it holds a line, and the
+# subscribers sharing it as callback -> priority. The line's priority is the highest of theirs.
+class MarketDataSubscription:
+    def __init__(self, contract: Contract, sequence_number):
+        self.contract = contract
+        self.sequence_number = sequence_number
+        self.ticker = None
+        self.callback_map = {}
+
+    def is_active(self):
+        return self.ticker is not None
+
+    def get_priority(self):
+        return max(self.callback_map.values())
+
+
+# Market data lines shared by the operations of all the symbols (see get_shared_manager), under one budget of
+# max_lines concurrent reqMktData lines.
+#  - A line is requested once per contract and shared by its subscribers, each identified by its callback on the
+#    ticker's updateEvent; it is cancelled when the last one unsubscribes.
+#  - set_subscriptions replaces a subscriber's contracts by requesting and cancelling only the difference.
+#  - Over the budget, the lines of the lowest priority (the latest subscribed among equals) wait without a ticker,
+#    and get one as lines free up. A subscriber knows it has no line yet from get_ticker returning None.
+#  - After a reconnect the lines holding a ticker are requested again.
+class MarketDataSubscriptionManager:
+    # id(ib client) -> MarketDataSubscriptionManager
+    shared_manager_map = {}
+
+    def __init__(self, ib_client: IB, max_lines=100):
+        self.ib = ib_client
+        self.max_lines = max_lines
+        # contract key -> MarketDataSubscription
+        self.subscription_map = {}
+        self.sequence_number = 0
+        self.active_line_count = 0
+        # churn metrics
+        self.request_count = 0
+        self.cancel_count = 0
+        self.reuse_count = 0
+        self.eviction_count = 0
+        self.peak_line_count = 0
+
+        self.ib.disconnectedEvent += self.on_ib_disconnect
+        self.ib.connectedEvent += self.on_ib_connect
+
+    @staticmethod
+    def get_shared_manager(ib_client: IB, max_lines=100):
+        if id(ib_client) not in MarketDataSubscriptionManager.shared_manager_map:
+            MarketDataSubscriptionManager.shared_manager_map[id(ib_client)] = \
+                MarketDataSubscriptionManager(ib_client, max_lines)
+        return MarketDataSubscriptionManager.shared_manager_map[id(ib_client)]
+
+    # the contract's ticker, None until it has a line
+    def subscribe(self, contract: Contract, callback, priority=SubscriptionPriority.CANDIDATE):
+        self.add_subscriber(contract, callback, priority)
+        self.rebalance()
+        return self.get_ticker(contract)
+
+    def unsubscribe(self, contract: Contract, callback):
+        self.remove_subscriber(MarketDataSubscriptionManager.get_contract_key(contract), callback)
+        self.rebalance()
+
+    # subscribe callback to exactly these contracts; the ones it keeps keep their lines untouched
+    def set_subscriptions(self, callback, contracts, priority=SubscriptionPriority.CANDIDATE):
+        new_contract_map = {MarketDataSubscriptionManager.get_contract_key(contract): contract
+                            for contract in contracts}
+        for key in self.get_subscription_keys(callback):
+            if key not in new_contract_map:
+                self.remove_subscriber(key, callback)
+        for contract in new_contract_map.values():
+            self.add_subscriber(contract, callback, priority)
+        self.rebalance()
+
+    def get_ticker(self, contract: Contract):
+        subscription = self.subscription_map.get(MarketDataSubscriptionManager.get_contract_key(contract))
+        if subscription is None:
+            return None
+        return subscription.ticker
+
+    def get_subscription_keys(self, callback):
+        return [key for key, subscription in self.subscription_map.items() if callback in subscription.callback_map]
+
+    def add_subscriber(self, contract: Contract, callback, priority):
+        key = MarketDataSubscriptionManager.get_contract_key(contract)
+        subscription = self.subscription_map.get(key)
+        if subscription is None:
+            subscription = MarketDataSubscription(contract, self.sequence_number)
+            self.sequence_number += 1
+            self.subscription_map[key] = subscription
+        elif callback not in subscription.callback_map:
+            self.reuse_count += 1
+        if callback not in subscription.callback_map and subscription.is_active():
+            subscription.ticker.updateEvent += callback
+        subscription.callback_map[callback] = priority
+
+    def remove_subscriber(self, key, callback):
+        subscription = self.subscription_map.get(key)
+        if subscription is None or callback not in subscription.callback_map:
+            return
+        del subscription.callback_map[callback]
+        if subscription.is_active():
+            subscription.ticker.updateEvent -= callback
+        if len(subscription.callback_map) == 0:
+            if subscription.is_active():
+                self.cancel(subscription)
+            del self.subscription_map[key]
+
+    # give the max_lines highest priority subscriptions a line; among equals the ones holding a line keep it
+    def rebalance(self):
+        if not self.ib.isConnected():
+            return
+        subscriptions = sorted(self.subscription_map.values(),
+                               key=lambda subscription: (-subscription.get_priority(),
+                                                         not subscription.is_active(),
+                                                         subscription.sequence_number))
+        for subscription in subscriptions[self.max_lines:]:
+            if subscription.is_active():
+                self.cancel(subscription)
+                self.eviction_count += 1
+        for subscription in subscriptions[:self.max_lines]:
+            if not subscription.is_active():
+                self.request(subscription)
+        self.peak_line_count = max(self.peak_line_count, self.active_line_count)
+
+    def request(self, subscription: MarketDataSubscription):
+        subscription.ticker = self.ib.reqMktData(subscription.contract)
+        for callback in subscription.callback_map:
+            subscription.ticker.updateEvent += callback
+        self.active_line_count += 1
+        self.request_count += 1
+
+    def cancel(self, subscription: MarketDataSubscription, to_cancel_line=True):
+        for callback in subscription.callback_map:
+            subscription.ticker.updateEvent -= callback
+        if to_cancel_line:
+            self.ib.cancelMktData(subscription.contract)
+            self.cancel_count += 1
+        subscription.ticker = None
+        self.active_line_count -= 1
+
+    # the lines are gone with the connection; they are requested again on connect
+    def on_ib_disconnect(self):
+        for subscription in self.subscription_map.values():
+            if subscription.is_active():
+                self.cancel(subscription, to_cancel_line=False)
+
+    def on_ib_connect(self):
+        self.rebalance()
+
+    def get_churn_metrics(self):
+        return {"active_line_count": self.active_line_count,
+                "waiting_count": len(self.subscription_map) - self.active_line_count,
+                "peak_line_count": self.peak_line_count,
+                "request_count": self.request_count,
+                "cancel_count": self.cancel_count,
+                "reuse_count": self.reuse_count,
+                "eviction_count": self.eviction_count}
+
+    @staticmethod
+    def get_contract_key(contract: Contract):
+        return contract.symbol + "_" + contract.secType + "_" + str(contract.right) + "_" + str(contract.strike) + \
+            "_" + str(contract.lastTradeDateOrContractMonth)
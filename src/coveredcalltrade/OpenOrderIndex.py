@@ -0,0 +1,127 @@
+from datetime import datetime
+
+from ib_insync import *
+
+
+# In-memory index of the open trades, kept current from the IB order events so that the pending trade checks
+# are dictionary lookups instead of ib.openTrades() followed by ib.sleep() inside a ticker callback.
+# Trades are keyed by (symbol, right, expiry); right is "C"/"P" for options and "" for anything else, expiry the
+# lastTradeDateOrContractMonth string. A trade leaves the index once its status is one of OrderStatus.DoneStates.
+class OpenOrderIndex:
+    # id(ib client) -> OpenOrderIndex
+    shared_index_map = {}
+
+    def __init__(self, ib_client: IB):
+        self.ib = ib_client
+        # (symbol, right, expiry) -> {id(trade): trade}
+        self.trade_map = {}
+        # symbol -> set of the (symbol, right, expiry) keys with open trades
+        self.symbol_key_map = {}
+        # id(trade) -> the key the trade is filed under
+        self.trade_key_map = {}
+        self.refresh()
+
+        # newOrderEvent covers our own orders before TWS acknowledges them with an openOrderEvent
+        self.ib.newOrderEvent += self.on_trade_update
+        self.ib.openOrderEvent += self.on_trade_update
+        self.ib.orderStatusEvent += self.on_trade_update
+        self.ib.execDetailsEvent += self.on_exec_details
+        self.ib.connectedEvent += self.refresh
+
+    # one index and one set of event handlers for all the operations on the client
+    @staticmethod
+    def get_shared_index(ib_client: IB):
+        if id(ib_client) not in OpenOrderIndex.shared_index_map:
+            OpenOrderIndex.shared_index_map[id(ib_client)] = OpenOrderIndex(ib_client)
+        return OpenOrderIndex.shared_index_map[id(ib_client)]
+
+    # rebuild from the trades ib_insync already holds; no request is made
+    def refresh(self):
+        self.trade_map = {}
+        self.symbol_key_map = {}
+        self.trade_key_map = {}
+        for trade in self.ib.openTrades():
+            self.on_trade_update(trade)
+
+    def on_exec_details(self, trade: Trade, fill: Fill):
+        self.on_trade_update(trade)
+
+    def on_trade_update(self, trade: Trade):
+        trade_id = id(trade)
+        self.remove_trade(trade_id)
+        if trade.orderStatus.status in OrderStatus.DoneStates:
+            return
+        key = OpenOrderIndex.get_key(trade.contract)
+        if key not in self.trade_map:
+            self.trade_map[key] = {}
+            self.symbol_key_map.setdefault(key[0], set()).add(key)
+        self.trade_map[key][trade_id] = trade
+        self.trade_key_map[trade_id] = key
+
+    def remove_trade(self, trade_id):
+        key = self.trade_key_map.pop(trade_id, None)
+        if key is None:
+            return
+        trades = self.trade_map[key]
+        del trades[trade_id]
+        if len(trades) == 0:
+            del self.trade_map[key]
+            symbol_keys = self.symbol_key_map[key[0]]
+            symbol_keys.discard(key)
+            if len(symbol_keys) == 0:
+                del self.symbol_key_map[key[0]]
+
+    def has_open_trade(self, symbol, right, expiry):
+        return (symbol, OpenOrderIndex.normalize_right(right), expiry) in self.trade_map
+
+    def get_open_trades(self, symbol, right, expiry):
+        return list(self.trade_map.get((symbol, OpenOrderIndex.normalize_right(right), expiry), {}).values())
+
+    # open option trades of the symbol, of any right and expiry
+    def get_open_option_trades(self, symbol):
+        open_trades = []
+        for key in self.symbol_key_map.get(symbol, set()):
+            if key[1] != "":
+                open_trades.extend(self.trade_map[key].values())
+        return open_trades
+
+    # is there an open option trade of the symbol and right expiring within max_dte days from now
+    def has_open_option_trade_within_dte(self, symbol, right, max_dte):
+        right = OpenOrderIndex.normalize_right(right)
+        today_date = datetime.now()
+        for key in self.symbol_key_map.get(symbol, set()):
+            if key[1] != right:
+                continue
+            expiration_date = datetime.strptime(key[2], "%Y%m%d")
+            if (expiration_date - today_date).days <= max_dte:
+                return True
+        return False
+
+    # is there an open option trade of the symbol, of any right, expiring within max_days_apart days of expiry with
+    # a strike within max_strike_diff of strike
+    def has_open_option_trade_near(self, symbol, expiry, strike, max_days_apart=30, max_strike_diff=15):
+        expiration_date = datetime.strptime(expiry, "%Y%m%d")
+        for key in self.symbol_key_map.get(symbol, set()):
+            if key[1] == "":
+                continue
+            if abs((datetime.strptime(key[2], "%Y%m%d") - expiration_date).days) > max_days_apart:
+                continue
+            for open_trade in self.trade_map[key].values():
+                if abs(open_trade.contract.strike - strike) <= max_strike_diff:
+                    return True
+        return False
+
+    @staticmethod
+    def get_key(contract: Contract):
+        if isinstance(contract, Option) or contract.secType in ["OPT", "FOP"]:
+            return contract.symbol, OpenOrderIndex.normalize_right(contract.right), \
+                contract.lastTradeDateOrContractMonth
+        return contract.symbol, "", ""
+
+    @staticmethod
+    def normalize_right(right):
+        if right in ["C", "CALL"]:
+            return "C"
+        if right in ["P", "PUT"]:
+            return "P"
+        return right
@@ -0,0 +1,218 @@
+import math
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+from ib_insync import *
+
+from OptionAnalyticsPrefetcher import OptionAnalyticsPrefetcher
+
+
+AVG_24HR = "avg_24hr"
+HIGH_24HR = "high_24hr"
+AVG_15DAY = "avg_15day"
+HIGH_15DAY = "high_15day"
+DTE = "dte"
+ESTIMATED_THETA = "estimated_theta"
+STRIKE = "strike"
+
+
+# Max and average of a sliding window of values: a monotonic deque holds the candidates for the max, a running
+# sum gives the average, so pushing and evicting are amortized O(1)
+class RollingMaxAvg:
+    def __init__(self):
+        # (sequence number, bar date, value)
+        self.items = deque()
+        # (sequence number, value), values decreasing from the left
+        self.max_items = deque()
+        self.value_sum = 0.
+        self.sequence_number = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, bar_date, value):
+        while len(self.max_items) > 0 and self.max_items[-1][1] <= value:
+            self.max_items.pop()
+        self.max_items.append((self.sequence_number, value))
+        self.items.append((self.sequence_number, bar_date, value))
+        self.value_sum += value
+        self.sequence_number += 1
+
+    def pop_left(self):
+        sequence_number, _, value = self.items.popleft()
+        if self.max_items[0][0] == sequence_number:
+            self.max_items.popleft()
+        # an empty window starts over from an exact 0
+        self.value_sum = self.value_sum - value if len(self.items) > 0 else 0.
+
+    def evict_to_count(self, max_count):
+        while len(self.items) > max_count:
+            self.pop_left()
+
+    def evict_before(self, bar_date):
+        while len(self.items) > 0 and self.items[0][1] < bar_date:
+            self.pop_left()
+
+    # max and avg of the window together with one more value
+    def get_max(self, extra_value):
+        if len(self.max_items) == 0:
+            return extra_value
+        return max(self.max_items[0][1], extra_value)
+
+    def get_avg(self, extra_value):
+        return (self.value_sum + extra_value) / (len(self.items) + 1)
+
+
+# Cached 1 hour bars of one option contract, reduced to the rolling 24 hour (last 24 bars) and 15 day (bars of
+# the last 15 trading days) high windows. The newest bar may still be forming, so it is kept out of the windows
+# until a later bar arrives; a refresh that returns it again replaces it. A refresh that fails or gets no bars (an
+# OTM weekly may not trade for hours) is retried after a backoff doubling from retry_seconds up to the TTL.
+class OptionAnalyticsEntry:
+    BARS_24HR = 24
+    DAYS_15DAY = 15
+
+    def __init__(self, option_contract: Option):
+        self.option_contract = option_contract
+        self.window_24hr = RollingMaxAvg()
+        self.window_15day = RollingMaxAvg()
+        self.last_bar_date = None
+        self.last_bar_high = None
+        self.refreshed_at = None
+        self.failed_at = None
+        self.failure_count = 0
+
+    # bars of a 1 hour reqHistoricalData df, full or incremental; the ones older than the newest cached bar are
+    # already in
+    def add_bars(self, option_df):
+        for bar_date, high in zip(option_df["date"].tolist(), option_df["high"].tolist()):
+            if self.last_bar_date is not None:
+                if bar_date < self.last_bar_date:
+                    continue
+                if bar_date > self.last_bar_date:
+                    self.window_24hr.push(self.last_bar_date, self.last_bar_high)
+                    self.window_15day.push(self.last_bar_date, self.last_bar_high)
+            self.last_bar_date = bar_date
+            self.last_bar_high = high
+        if self.last_bar_date is not None:
+            self.window_24hr.evict_to_count(OptionAnalyticsEntry.BARS_24HR - 1)
+            self.window_15day.evict_before(OptionAnalyticsEntry.get_window_start(self.last_bar_date))
+        self.refreshed_at = time.monotonic()
+        self.failed_at = None
+        self.failure_count = 0
+
+    def add_failure(self):
+        self.failed_at = time.monotonic()
+        self.failure_count += 1
+
+    def has_bars(self):
+        return self.last_bar_date is not None
+
+    def is_expired(self, ttl_seconds, retry_seconds=60):
+        if self.failed_at is not None:
+            backoff_seconds = min(ttl_seconds, retry_seconds * 2 ** min(self.failure_count - 1, 16))
+            return time.monotonic() - self.failed_at >= backoff_seconds
+        return self.refreshed_at is None or time.monotonic() - self.refreshed_at >= ttl_seconds
+
+    # analytics of get_option_contract_analytics_data, DTE as of now, from the cached bars however old they are;
+    # None without bars or once the contract has expired
+    def get_analytics(self):
+        if not self.has_bars():
+            return None
+        expiration_date = datetime.strptime(self.option_contract.lastTradeDateOrContractMonth, "%Y%m%d")
+        dte = (expiration_date - datetime.now()).days
+        if dte <= 0:
+            return None
+        avg_15day = self.window_15day.get_avg(self.last_bar_high)
+        return {AVG_24HR: self.window_24hr.get_avg(self.last_bar_high),
+                HIGH_24HR: self.window_24hr.get_max(self.last_bar_high),
+                AVG_15DAY: avg_15day,
+                HIGH_15DAY: self.window_15day.get_max(self.last_bar_high),
+                DTE: dte,
+                ESTIMATED_THETA: avg_15day / dte,
+                STRIKE: self.option_contract.strike}
+
+    # durationStr of the bars since the newest cached bar, that one included
+    def get_refresh_duration_str(self):
+        if not self.has_bars():
+            return '15 D'
+        last_bar_date = self.last_bar_date
+        if not isinstance(last_bar_date, datetime):
+            return '15 D'
+        seconds = (datetime.now(last_bar_date.tzinfo) - last_bar_date).total_seconds() + 3600
+        if seconds < 86400:
+            return str(max(int(seconds), 60)) + ' S'
+        return str(min(math.ceil(seconds / 86400), OptionAnalyticsEntry.DAYS_15DAY)) + ' D'
+
+    # first day of the 15 trading days ending on the day of bar_date
+    @staticmethod
+    def get_window_start(bar_date):
+        window_start_day = np.busday_offset(np.datetime64(bar_date.date(), "D"),
+                                            -(OptionAnalyticsEntry.DAYS_15DAY - 1), roll="backward")
+        window_start = datetime.combine(window_start_day.astype(datetime), datetime.min.time())
+        if isinstance(bar_date, datetime) and bar_date.tzinfo is not None:
+            window_start = window_start.replace(tzinfo=bar_date.tzinfo)
+        return window_start
+
+
+# Option analytics with a TTL, shared by the CoveredCallOperations trading the same underlying on the same IB client
+# (see get_shared_cache). Reads never block: a missing entry returns None, an expired one its last analytics, and
+# either way a refresh is scheduled through the OptionAnalyticsPrefetcher. Refreshes only request the bars
+# since the newest cached one.
+class OptionAnalyticsCache:
+    # (id(ib client), symbol) -> OptionAnalyticsCache
+    shared_cache_map = {}
+
+    def __init__(self, ib_client: IB, ttl_seconds=3600, prefetcher: OptionAnalyticsPrefetcher = None,
+                 retry_seconds=60):
+        self.ib = ib_client
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        if prefetcher is None:
+            prefetcher = OptionAnalyticsPrefetcher.get_shared_prefetcher(self.ib)
+        self.prefetcher = prefetcher
+        # contract key -> OptionAnalyticsEntry
+        self.entry_map = {}
+
+    @staticmethod
+    def get_shared_cache(ib_client: IB, symbol, ttl_seconds=3600):
+        key = (id(ib_client), symbol)
+        if key not in OptionAnalyticsCache.shared_cache_map:
+            OptionAnalyticsCache.shared_cache_map[key] = OptionAnalyticsCache(
+                ib_client, ttl_seconds, OptionAnalyticsPrefetcher.get_shared_prefetcher(ib_client))
+        return OptionAnalyticsCache.shared_cache_map[key]
+
+    def get_analytics(self, option_contract: Option):
+        entry = self.get_entry(option_contract)
+        if entry.is_expired(self.ttl_seconds, self.retry_seconds):
+            self.refresh([option_contract])
+        return entry.get_analytics()
+
+    # schedule the refresh of the contracts that are missing or expired
+    def prefetch(self, option_contracts):
+        self.refresh([option_contract for option_contract in option_contracts
+                      if self.get_entry(option_contract).is_expired(self.ttl_seconds, self.retry_seconds)])
+
+    def refresh(self, option_contracts):
+        # contracts by durationStr, so that the incremental ones don't fetch 15 days
+        duration_contract_map = {}
+        for option_contract in option_contracts:
+            if self.prefetcher.is_pending(option_contract):
+                continue
+            duration_str = self.get_entry(option_contract).get_refresh_duration_str()
+            duration_contract_map.setdefault(duration_str, []).append(option_contract)
+        for duration_str, contracts in duration_contract_map.items():
+            self.prefetcher.prefetch(contracts, self.add_bars, duration_str, self.add_failure)
+
+    def add_bars(self, option_contract: Option, option_df):
+        self.get_entry(option_contract).add_bars(option_df)
+
+    def add_failure(self, option_contract: Option):
+        self.get_entry(option_contract).add_failure()
+
+    def get_entry(self, option_contract: Option):
+        key = OptionAnalyticsPrefetcher.get_contract_key(option_contract)
+        if key not in self.entry_map:
+            self.entry_map[key] = OptionAnalyticsEntry(option_contract)
+        return self.entry_map[key]
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import deque
+
+from ib_insync import *
+
+
+# Keeps the historical data requests under the IB pacing limit of max_requests per period_seconds
+class HistoricalDataPacer:
+    def __init__(self, max_requests=60, period_seconds=600):
+        self.max_requests = max_requests
+        self.period_seconds = period_seconds
+        self.request_times = deque()
+
+    async def wait(self):
+        while True:
+            now = time.monotonic()
+            while len(self.request_times) > 0 and now - self.request_times[0] >= self.period_seconds:
+                self.request_times.popleft()
+            if len(self.request_times) < self.max_requests:
+                self.request_times.append(now)
+                return
+            await asyncio.sleep(self.period_seconds - (now - self.request_times[0]))
+
+
+# Fetches the 1 hour bars of option contracts (15 days of them unless told otherwise) in the background with
+# reqHistoricalDataAsync, at most max_concurrent_requests at a time and paced by a HistoricalDataPacer, and hands
+# each contract's df to the callbacks registered for it. prefetch() only schedules the requests, so it is safe to
+# call from tick handlers; a contract already being fetched isn't requested again, its new callback just waits for
+# the same bars. IB's pacing and concurrency limits are per connection, so the operations of all the symbols share
+# one prefetcher per client (see get_shared_prefetcher).
+class OptionAnalyticsPrefetcher:
+    # id(ib client) -> OptionAnalyticsPrefetcher
+    shared_prefetcher_map = {}
+
+    def __init__(self, ib_client: IB, max_concurrent_requests=6, pacer: HistoricalDataPacer = None):
+        self.ib = ib_client
+        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        if pacer is None:
+            pacer = HistoricalDataPacer()
+        self.pacer = pacer
+        # contract key -> (on_option_df, on_failure) callbacks waiting for its bars
+        self.pending_callback_map = {}
+
+    @staticmethod
+    def get_shared_prefetcher(ib_client: IB):
+        if id(ib_client) not in OptionAnalyticsPrefetcher.shared_prefetcher_map:
+            OptionAnalyticsPrefetcher.shared_prefetcher_map[id(ib_client)] = OptionAnalyticsPrefetcher(ib_client)
+        return OptionAnalyticsPrefetcher.shared_prefetcher_map[id(ib_client)]
+
+    # schedule the fetch of every contract; on_option_df(option_contract, option_df) is called as each arrives, and
+    # on_failure(option_contract), if given, for the ones that fail or have no bars
+    def prefetch(self, option_contracts, on_option_df, duration_str='15 D', on_failure=None):
+        new_contracts = []
+        for option_contract in option_contracts:
+            key = OptionAnalyticsPrefetcher.get_contract_key(option_contract)
+            if key in self.pending_callback_map:
+                self.pending_callback_map[key].append((on_option_df, on_failure))
+                continue
+            self.pending_callback_map[key] = [(on_option_df, on_failure)]
+            new_contracts.append(option_contract)
+        if len(new_contracts) == 0:
+            return None
+        return asyncio.ensure_future(self.fetch_all(new_contracts, duration_str))
+
+    def is_pending(self, option_contract):
+        return OptionAnalyticsPrefetcher.get_contract_key(option_contract) in self.pending_callback_map
+
+    async def fetch_all(self, option_contracts, duration_str='15 D'):
+        await asyncio.gather(*[self.fetch(option_contract, duration_str) for option_contract in option_contracts])
+
+    async def fetch(self, option_contract: Option, duration_str='15 D'):
+        key = OptionAnalyticsPrefetcher.get_contract_key(option_contract)
+        option_df = None
+        try:
+            async with self.semaphore:
+                await self.pacer.wait()
+                bars = await self.ib.reqHistoricalDataAsync(option_contract, durationStr=duration_str,
+                                                            endDateTime='',
+                                                            barSizeSetting='1 hour',
+                                                            whatToShow='TRADES',
+                                                            useRTH=True)
+            option_df = util.df(bars)
+            if option_df is None or len(option_df) == 0:
+                print("No option data for " + key)
+                option_df = None
+        except Exception as e:
+            print("Failed to fetch the option data of " + key + ": " + str(e))
+        # either way the contract can be requested again from now on
+        callbacks = self.pending_callback_map.pop(key, [])
+        for on_option_df, on_failure in callbacks:
+            try:
+                if option_df is not None:
+                    on_option_df(option_contract, option_df)
+                elif on_failure is not None:
+                    on_failure(option_contract)
+            except Exception as e:
+                print("Failed to process the option data of " + key + ": " + str(e))
+
+    @staticmethod
+    def get_contract_key(option_contract: Contract):
+        return option_contract.symbol + "_" + str(option_contract.right) + "_" + str(option_contract.strike) + "_" + \
+            str(option_contract.lastTradeDateOrContractMonth)
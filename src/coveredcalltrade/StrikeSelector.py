@@ -0,0 +1,162 @@
+import asyncio
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+import numpy as np
+from ib_insync import *
+
+
+# Candidate short term calls of a symbol from its 1 day closes, limited to the listed contracts. The strike target
+# is the momentum rule of the last close only. The option chain is loaded in the background once per symbol per
+# day: reqSecDefOptParams for the listed expiries, then reqContractDetails for the call strikes of each expiry, as
+# the chain's strikes are the union over all its expiries. A symbol whose chain failed to load has no candidates
+# until retry_seconds later. The loaded chains are shared by the operations of all the symbols (see
+# get_shared_selector).
+class StrikeSelector:
+    # id(ib client) -> StrikeSelector
+    shared_selector_map = {}
+
+    def __init__(self, ib_client: IB, strike_step=5, strike_count=3, retry_seconds=3600):
+        self.ib = ib_client
+        self.strike_step = strike_step
+        self.strike_count = strike_count
+        self.retry_seconds = retry_seconds
+        # symbol -> (date loaded, {listed expiry: sorted call strikes})
+        self.option_chain_map = {}
+        # symbol -> time.monotonic() of its last failed load
+        self.failed_at_map = {}
+        self.loading_symbols = set()
+
+    @staticmethod
+    def get_shared_selector(ib_client: IB):
+        if id(ib_client) not in StrikeSelector.shared_selector_map:
+            StrikeSelector.shared_selector_map[id(ib_client)] = StrikeSelector(ib_client)
+        return StrikeSelector.shared_selector_map[id(ib_client)]
+
+    # no candidates while the chain is loading; on_option_chain(symbol) is called once it is loaded
+    def get_candidate_contracts(self, symbol, close_prices, expiries, on_option_chain=None):
+        prediction = StrikeSelector.get_adaptive_prediction(close_prices)
+        if prediction is None:
+            print("Not enough 1 day bars of " + symbol + " to pick the strikes")
+            return []
+        expiry_strikes_map = self.get_option_chain(symbol, expiries, on_option_chain)
+        if expiry_strikes_map is None:
+            return []
+        target_strikes = self.get_target_strikes(prediction)
+
+        candidate_contracts = []
+        for expiry in StrikeSelector.get_listed_expiries(expiries, sorted(expiry_strikes_map.keys())):
+            for strike in StrikeSelector.get_listed_strikes(target_strikes, expiry_strikes_map[expiry]):
+                candidate_contracts.append(Option(symbol=symbol,
+                                                  lastTradeDateOrContractMonth=expiry,
+                                                  strike=strike,
+                                                  right='C',
+                                                  exchange='SMART',
+                                                  currency="USD"))
+        return candidate_contracts
+
+    # price the call strikes are picked above: 1.1x the last close after a 35% rise over 30 days, 1.15x after a 15%
+    # rise over 10 days, 1.2x otherwise; None with fewer than 41 closes
+    @staticmethod
+    def get_adaptive_prediction(close_prices):
+        close_prices = np.asarray(close_prices, dtype=np.float64)
+        if len(close_prices) < 41:
+            return None
+        last_close = close_prices[-1]
+        if last_close >= close_prices[-31] * 1.35:
+            return 1.1 * last_close
+        if last_close >= close_prices[-11] * 1.15:
+            return 1.15 * last_close
+        return 1.2 * last_close
+
+    def get_target_strikes(self, prediction):
+        base_strike = int(prediction / self.strike_step) * self.strike_step
+        return [base_strike + k * self.strike_step for k in range(1, self.strike_count + 1)]
+
+    # {listed expiry: sorted call strikes} of today, None while it is loading or after a failed load
+    def get_option_chain(self, symbol, expiries, on_option_chain=None):
+        if symbol in self.option_chain_map and self.option_chain_map[symbol][0] == date.today():
+            return self.option_chain_map[symbol][1]
+        if symbol in self.loading_symbols:
+            return None
+        if symbol in self.failed_at_map and time.monotonic() - self.failed_at_map[symbol] < self.retry_seconds:
+            return None
+        self.loading_symbols.add(symbol)
+        asyncio.ensure_future(self.load_option_chain(symbol, expiries, on_option_chain))
+        return None
+
+    async def load_option_chain(self, symbol, expiries, on_option_chain=None):
+        expiry_strikes_map = None
+        try:
+            expiry_strikes_map = await self.req_option_chain(symbol, expiries)
+        except Exception as e:
+            print("Failed to load the option chain of " + symbol + ": " + str(e))
+        self.loading_symbols.discard(symbol)
+        if expiry_strikes_map is None:
+            self.failed_at_map[symbol] = time.monotonic()
+            return
+        self.failed_at_map.pop(symbol, None)
+        self.option_chain_map[symbol] = (date.today(), expiry_strikes_map)
+        if on_option_chain is not None:
+            on_option_chain(symbol)
+
+    # {listed expiry: sorted call strikes} for the listed expiries of the requested ones, None if the symbol has no
+    # SMART option chain
+    async def req_option_chain(self, symbol, expiries):
+        stock_contract = Stock(symbol, 'SMART', currency='USD')
+        await self.ib.qualifyContractsAsync(stock_contract)
+        if stock_contract.conId == 0:
+            print("Failed to qualify " + symbol + " for its option chain")
+            return None
+        option_chains = [option_chain for option_chain in
+                         await self.ib.reqSecDefOptParamsAsync(stock_contract.symbol, '', stock_contract.secType,
+                                                               stock_contract.conId)
+                         if option_chain.exchange == 'SMART']
+        if len(option_chains) == 0:
+            print("No option chain for " + symbol)
+            return None
+        # the standard trading class, if there are others
+        option_chain = next((option_chain for option_chain in option_chains if option_chain.tradingClass == symbol),
+                            option_chains[0])
+
+        listed_expiries = StrikeSelector.get_listed_expiries(expiries, sorted(option_chain.expirations))
+        contract_details_lists = await asyncio.gather(*[
+            self.ib.reqContractDetailsAsync(Option(symbol=symbol,
+                                                   lastTradeDateOrContractMonth=expiry,
+                                                   right='C',
+                                                   exchange='SMART',
+                                                   currency="USD",
+                                                   tradingClass=option_chain.tradingClass))
+            for expiry in listed_expiries])
+        expiry_strikes_map = {}
+        for expiry, contract_details_list in zip(listed_expiries, contract_details_lists):
+            strikes = sorted({contract_details.contract.strike for contract_details in contract_details_list})
+            if len(strikes) > 0:
+                expiry_strikes_map[expiry] = strikes
+        return expiry_strikes_map
+
+    # the listed expiry of each requested one, or the last one listed in the 4 days before it (a Friday holiday
+    # moves the expiry to Thursday); requested ones without either are dropped
+    @staticmethod
+    def get_listed_expiries(expiries, listed_expiries):
+        result = []
+        for expiry in expiries:
+            i = bisect_right(listed_expiries, expiry)
+            if i == 0:
+                continue
+            listed_expiry = listed_expiries[i - 1]
+            days_before = (datetime.strptime(expiry, "%Y%m%d") - datetime.strptime(listed_expiry, "%Y%m%d")).days
+            if days_before <= 4 and listed_expiry not in result:
+                result.append(listed_expiry)
+        return result
+
+    # the lowest listed strike at or above each target, without repeats
+    @staticmethod
+    def get_listed_strikes(target_strikes, listed_strikes):
+        result = []
+        for target_strike in target_strikes:
+            i = bisect_left(listed_strikes, target_strike)
+            if i < len(listed_strikes) and listed_strikes[i] not in result:
+                result.append(listed_strikes[i])
+        return result
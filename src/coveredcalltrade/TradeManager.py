@@ -3,6 +3,7 @@ import threading
 
 from datetime import datetime, date, timedelta
 from ib_insync import *
+from OpenOrderIndex import OpenOrderIndex
 # the caller might try to invoke the TradeManager many times when a trade is pending. So we need to use a lock
 # to expose the status. Also this should be run as a separate thread as it will sleep during the bid/ask intervals
 # The first priority is to prevent double trade
@@ -72,8 +73,11 @@ class TradeController:
 
 
 class TradeManager:
-    def __init__(self, ib_client: IB, to_sell=True, to_buy=True):
+    def __init__(self, ib_client: IB, to_sell=True, to_buy=True, open_order_index: OpenOrderIndex = None):
         self.ib = ib_client
+        if open_order_index is None:
+            open_order_index = OpenOrderIndex.get_shared_index(self.ib)
+        self.open_order_index = open_order_index
         self.to_sell = to_sell
         self.to_buy = to_buy
 
@@ -162,22 +166,13 @@ class TradeManager:
 
     def validate_no_pending_trade_for_contract(self, option_contract: Option):
         print("validating no pending trade")
-        open_trades = self.ib.openTrades()
-        self.ib.sleep(1)
-        expiration_date_str = option_contract.lastTradeDateOrContractMonth
-        expiration_date = datetime.strptime(expiration_date_str, "%Y%m%d")
-        symbol_str = option_contract.symbol
-        strike_price = option_contract.strike
         # if symbol, strike price and expire date all match, then we shouldn't trade
-
-        for open_trade in open_trades:
-            if isinstance(open_trade.contract, Option):
-                current_expiration_date = datetime.strptime(open_trade.contract.lastTradeDateOrContractMonth, "%Y%m%d")
-                # no contract should be in pending state with the same symbol while the strike price is within $15/share difference
-                if abs((current_expiration_date - expiration_date).days) <= 30 and \
-                   open_trade.contract.symbol == symbol_str and abs(open_trade.contract.strike - strike_price) <= 15:
-                    print("There is pending trade for this particular contract. Exit")
-                    return False
+        # no contract should be in pending state with the same symbol while the strike price is within $15/share difference
+        if self.open_order_index.has_open_option_trade_near(option_contract.symbol,
+                                                            option_contract.lastTradeDateOrContractMonth,
+                                                            option_contract.strike, 30, 15):
+            print("There is pending trade for this particular contract. Exit")
+            return False
         print("Contract is trade-able")
         return True
 
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+from src.statemachine.dataprocessing.ResolutionAligner import ResolutionAligner
+
+
+class CompactModes:
+    # lossless: columns that round trip exactly go to scaled int32, else float32, else stay float64.
+    # Frames are decoded back to the original float64 values on access.
+    FIXED_POINT = "fixed_point"
+    # every float column as float32, also in the frames handed out; values are off by up to half a float32 ulp
+    FLOAT32 = "float32"
+
+
+# One decorated frame in compact form.
+# columns: name -> (kind, values, original dtype); kind is one of
+#   "date"      int64 epoch nanoseconds, handed out as a datetime64[ns] view
+#   "fixed"     int32 holding round(value * SCALE), FIXED_NAN for NaN
+#   "raw"       the values as they are (float32, downcast ints, ...)
+#   "category"  (codes, categories) of an object column
+class CompactFrame:
+    # indicator columns are rounded to 3 decimals by IndicatorDecorator.round_to_decimal
+    SCALE = 1000
+    FIXED_NAN = np.iinfo(np.int32).min
+
+    def __init__(self, columns, rows, mode):
+        self.columns = columns
+        self.rows = rows
+        self.mode = mode
+
+    @staticmethod
+    def from_df(df, mode=CompactModes.FIXED_POINT, date_col="date"):
+        columns = {}
+        for column_name in df.columns:
+            values = df[column_name].to_numpy()
+            if column_name == date_col:
+                columns[column_name] = ("date", ResolutionAligner.to_epoch_ns(df[column_name]), values.dtype)
+            elif values.dtype.kind == "f":
+                columns[column_name] = CompactFrame.compact_float(values, mode)
+            elif values.dtype.kind in "iu":
+                columns[column_name] = ("raw", CompactFrame.downcast_int(values), values.dtype)
+            elif values.dtype.kind == "O":
+                codes, categories = pd.factorize(values)
+                columns[column_name] = ("category", (codes.astype(np.int32), categories), values.dtype)
+            else:
+                columns[column_name] = ("raw", values, values.dtype)
+        return CompactFrame(columns, len(df), mode)
+
+    @staticmethod
+    def compact_float(values, mode):
+        if mode == CompactModes.FLOAT32:
+            return "raw", values.astype(np.float32), values.dtype
+        fixed = CompactFrame.to_fixed_point(values)
+        if fixed is not None:
+            return "fixed", fixed, values.dtype
+        single = values.astype(np.float32)
+        if np.array_equal(single.astype(values.dtype), values, equal_nan=True):
+            return "raw", single, values.dtype
+        return "raw", values, values.dtype
+
+    # None unless every value survives the int32 round trip bit for bit
+    @staticmethod
+    def to_fixed_point(values):
+        nan_mask = np.isnan(values)
+        finite = values[~nan_mask]
+        if not np.isfinite(finite).all():
+            return None
+        scaled = np.rint(values * CompactFrame.SCALE)
+        if len(finite) > 0 and (np.nanmax(np.abs(scaled)) >= np.iinfo(np.int32).max):
+            return None
+        decoded = scaled / CompactFrame.SCALE
+        if not np.array_equal(decoded[~nan_mask], finite):
+            return None
+        fixed = np.where(nan_mask, CompactFrame.FIXED_NAN, scaled).astype(np.int32)
+        return fixed
+
+    @staticmethod
+    def downcast_int(values):
+        if len(values) == 0:
+            return values
+        for dtype in [np.int8, np.int16, np.int32]:
+            info = np.iinfo(dtype)
+            if values.min() >= info.min and values.max() <= info.max:
+                return values.astype(dtype)
+        return values
+
+    def decode(self, column_name):
+        kind, values, dtype = self.columns[column_name]
+        if kind == "date":
+            return values.view("datetime64[ns]")
+        if kind == "fixed":
+            decoded = values / CompactFrame.SCALE
+            decoded[values == CompactFrame.FIXED_NAN] = np.nan
+            return decoded.astype(dtype, copy=False)
+        if kind == "category":
+            codes, categories = values
+            return np.asarray(categories, dtype=dtype).take(codes)
+        if self.mode == CompactModes.FLOAT32 and values.dtype == np.float32:
+            return values
+        return values.astype(dtype, copy=False)
+
+    def to_df(self, columns=None):
+        if columns is None:
+            columns = list(self.columns.keys())
+        return pd.DataFrame({column_name: self.decode(column_name) for column_name in columns}, columns=columns)
+
+    def get_nbytes(self):
+        nbytes = 0
+        for kind, values, _ in self.columns.values():
+            if kind == "category":
+                codes, categories = values
+                nbytes += codes.nbytes + int(pd.Series(categories).memory_usage(deep=True, index=False))
+            else:
+                nbytes += values.nbytes
+        return nbytes
+
+
+# Compact in-memory store of decorated frames for a whole watchlist.
+# put() compacts a frame, get_df() hands out a plain DataFrame that TrendSeqGenerator/BasicStrategy take as is.
+class CompactFrameStore:
+    def __init__(self, mode=CompactModes.FIXED_POINT):
+        self.mode = mode
+        # symbol -> {resolution: CompactFrame}
+        self.frames = {}
+
+    def put(self, symbol, resolution, df):
+        self.frames.setdefault(symbol, {})[resolution] = CompactFrame.from_df(df, self.mode)
+
+    def get_df(self, symbol, resolution, columns=None):
+        return self.frames[symbol][resolution].to_df(columns)
+
+    def get_frame(self, symbol, resolution):
+        return self.frames[symbol][resolution]
+
+    def contains(self, symbol, resolution):
+        return symbol in self.frames and resolution in self.frames[symbol]
+
+    def remove(self, symbol, resolution=None):
+        if symbol not in self.frames:
+            return
+        if resolution is None:
+            del self.frames[symbol]
+            return
+        self.frames[symbol].pop(resolution, None)
+        if len(self.frames[symbol]) == 0:
+            del self.frames[symbol]
+
+    # {symbol: {resolution: bytes}}
+    def memory_usage(self):
+        return {symbol: {resolution: frame.get_nbytes() for resolution, frame in frames.items()}
+                for symbol, frames in self.frames.items()}
+
+    def get_total_bytes(self):
+        return sum(frame.get_nbytes() for frames in self.frames.values() for frame in frames.values())
+
+    # bytes the same frames take as regular DataFrames, for comparison
+    @staticmethod
+    def get_df_bytes(df):
+        return int(df.memory_usage(deep=True, index=False).sum())
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from src.statemachine.dataprocessing.FusedIndicatorKernel import FusedIndicatorKernel
+from src.statemachine.dataprocessing.IndicatorDecorator import IndicatorDecorator
+from src.statemachine.dataprocessing.IndicatorRegistry import IndicatorRegistry
+from src.statemachine.dataprocessing.ResolutionAligner import AlignModes, ResolutionAligner
+
+
+# Persistent cache of decorated frames, so research runs stop re-decorating the same historical bars.
+# An entry is addressed by a hash of symbol, resolution, indicator config and the first bar, and holds one raw
+# binary file per column that is read back through np.memmap. When the same bars come back with new bars at the
+# end, only the tail is decorated (see IndicatorPlan.execute for the warm-up that keeps it identical to a full
+# decorate) and appended to the column files. Dates come back as datetime64, in their tz if they had one.
+# Entries are evicted least recently used first once the cache exceeds max_bytes.
+class DecoratedFrameCache:
+    INDEX_FILE = "index.json"
+    META_FILE = "meta.json"
+    # number of warm-up rows compared against the cached values before a recomputed tail is trusted
+    OVERLAP_CHECK_ROWS = 64
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self.load_index()
+
+    # df: frame with the resolution prefixed OHLCV columns, as passed to decorate_resolution_df
+    def get_decorated(self, symbol, df, resolution, bb_config_map=None, window_config_map=None, indicators=None,
+                      config_maps=None):
+        if window_config_map is None:
+            window_config_map = IndicatorDecorator.default_window_config_map(resolution)
+        if bb_config_map is None:
+            bb_config_map = IndicatorDecorator.default_bb_config_map(resolution)
+        if indicators is None:
+            indicators = IndicatorDecorator.INDICATORS
+        extra_configs = DecoratedFrameCache.get_extra_configs(resolution, indicators, config_maps)
+        if len(df) == 0:
+            return FusedIndicatorKernel.decorate_resolution_df(df.copy(), resolution, bb_config_map,
+                                                               window_config_map, indicators, config_maps)
+
+        epoch, tz = ResolutionAligner.to_epoch_ns_and_tz(df["date"])
+        key = DecoratedFrameCache.make_key(symbol, resolution, epoch[0], bb_config_map.get(resolution, []),
+                                           window_config_map.get(resolution, []), indicators, extra_configs)
+        entry = self.load_entry(key)
+        if entry is not None:
+            meta, columns = entry
+            cached_rows = meta.get("rows")
+            if meta.get("tz") == DecoratedFrameCache.get_tz_meta(tz) and \
+                    DecoratedFrameCache.is_cached_prefix(columns, df, epoch, resolution, cached_rows):
+                if len(df) == cached_rows:
+                    self.touch(key)
+                    return DecoratedFrameCache.to_df(meta, columns)
+                if self.append_tail(key, meta, columns, df, resolution, bb_config_map, window_config_map,
+                                    indicators, extra_configs):
+                    meta, columns = self.load_entry(key)
+                    return DecoratedFrameCache.to_df(meta, columns)
+            else:
+                print("Cached bars of " + symbol + " " + resolution + " changed. Re-decorating them")
+            self.remove_entry(key)
+
+        decorated = FusedIndicatorKernel.decorate_resolution_df(df.copy(), resolution, bb_config_map,
+                                                                window_config_map, indicators, config_maps)
+        # same date dtype as a cache hit
+        decorated["date"] = pd.to_datetime(decorated["date"])
+        self.write_entry(key, symbol, resolution, decorated)
+        return decorated
+
+    # cached counterpart of IndicatorDecorator.decorate_and_merge
+    def decorate_and_merge(self, symbol, df_5min, df_1hour, df_1day, align_mode=AlignModes.MERGE):
+        df_1day_decorated = self.get_decorated(symbol, IndicatorDecorator.rename_ohlcv_columns(df_1day, "1day"),
+                                               "1day")
+        df_1hour_decorated = self.get_decorated(symbol, IndicatorDecorator.rename_ohlcv_columns(df_1hour, "1hour"),
+                                                "1hour")
+        df_5min_decorated = self.get_decorated(symbol, IndicatorDecorator.rename_ohlcv_columns(df_5min, "5min"),
+                                               "5min")
+        return IndicatorDecorator.align_decorated(df_5min_decorated, df_1hour_decorated, df_1day_decorated, align_mode)
+
+    # drop every entry of a symbol, optionally only one resolution of it
+    def invalidate(self, symbol, resolution=None):
+        for key, info in list(self.index.items()):
+            if info.get("symbol") == symbol and (resolution is None or info.get("resolution") == resolution):
+                self.remove_entry(key)
+
+    def clear(self):
+        for key in list(self.index.keys()):
+            self.remove_entry(key)
+
+    def get_size(self):
+        return sum(info.get("bytes", 0) for info in self.index.values())
+
+    def get_index(self):
+        return self.index
+
+    # {config kind: configs} of the indicators configured by neither bb_config_map nor window_config_map
+    @staticmethod
+    def get_extra_configs(resolution, indicators, config_maps):
+        extra_configs = {}
+        for indicator in indicators:
+            config_kind = IndicatorRegistry.SPECS[indicator].config_kind
+            if config_kind not in ["bb", "window"]:
+                config_map = IndicatorDecorator.get_config_map(config_kind, resolution, None, None, config_maps)
+                extra_configs[config_kind] = config_map.get(resolution, [])
+        return extra_configs
+
+    @staticmethod
+    def make_key(symbol, resolution, first_epoch, bb_configs, window_configs, indicators, extra_configs=None):
+        payload = [symbol, resolution, int(first_epoch),
+                   [[bb_config.get("window"), bb_config.get("window_dev")] for bb_config in bb_configs],
+                   [window_config.get("window") for window_config in window_configs],
+                   list(indicators)]
+        # only part of the key when set, so entries written without TSI/MACD keep their keys
+        if extra_configs:
+            payload.append([[config_kind, [sorted(config.items()) for config in configs]]
+                            for config_kind, configs in sorted(extra_configs.items())])
+        payload = json.dumps(payload)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    # the cached rows are only reused if the incoming frame starts with exactly the same bars
+    @staticmethod
+    def is_cached_prefix(columns, df, epoch, resolution, cached_rows):
+        if len(df) < cached_rows:
+            return False
+        if not np.array_equal(columns["date"], epoch[:cached_rows]):
+            return False
+        for column_name in [IndicatorDecorator.high(resolution), IndicatorDecorator.low(resolution),
+                            IndicatorDecorator.close(resolution), IndicatorDecorator.volume(resolution)]:
+            if column_name not in columns or column_name not in df:
+                return False
+            incoming = np.asarray(df[column_name].to_numpy()[:cached_rows], dtype=np.float64)
+            if not np.array_equal(np.asarray(columns[column_name], dtype=np.float64), incoming, equal_nan=True):
+                return False
+        return True
+
+    def append_tail(self, key, meta, columns, df, resolution, bb_config_map, window_config_map, indicators,
+                    extra_configs=None):
+        cached_rows = meta.get("rows")
+        plan = IndicatorRegistry.get_plan(resolution, bb_config_map.get(resolution, []),
+                                          window_config_map.get(resolution, []), indicators, extra_configs)
+        ohlcv = [np.ascontiguousarray(df[column_name], dtype=np.float64)
+                 for column_name in [IndicatorDecorator.high(resolution), IndicatorDecorator.low(resolution),
+                                     IndicatorDecorator.close(resolution), IndicatorDecorator.volume(resolution)]]
+        if not all(np.isfinite(values).all() for values in ohlcv):
+            return False
+        check_start = max(0, cached_rows - DecoratedFrameCache.OVERLAP_CHECK_ROWS)
+        indicator_columns = plan.execute(*ohlcv, start=check_start)
+
+        # the last cached rows have to come out the same, otherwise the tail can't be trusted either
+        for column_name, values in indicator_columns.items():
+            if not np.array_equal(columns[column_name][check_start:], values[:cached_rows - check_start],
+                                  equal_nan=True):
+                return False
+
+        tail = df.iloc[cached_rows:].reset_index(drop=True)
+        for column_name, values in indicator_columns.items():
+            tail[column_name] = values[cached_rows - check_start:]
+        if list(tail.columns) != meta.get("columns"):
+            return False
+        tail = DecoratedFrameCache.to_storage(tail)
+        if tail is None:
+            return False
+        for column_name, dtype in zip(meta.get("columns"), meta.get("dtypes")):
+            if tail[column_name].dtype != np.dtype(dtype):
+                return False
+
+        entry_dir = self.entry_dir(key)
+        for i, (column_name, dtype) in enumerate(zip(meta.get("columns"), meta.get("dtypes"))):
+            with open(os.path.join(entry_dir, str(i) + ".bin"), "r+b") as f:
+                # bytes past the rows of the meta are from an append that died before writing its meta
+                f.truncate(cached_rows * np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(tail[column_name].tobytes())
+        meta["rows"] = len(df)
+        self.write_meta(key, meta)
+        self.index[key]["bytes"] = DecoratedFrameCache.get_entry_bytes(meta)
+        self.touch(key)
+        self.evict(keep=key)
+        return True
+
+    # {column_name: contiguous array}, dates as int64 epoch nanoseconds; None if a column can't be memory mapped
+    @staticmethod
+    def to_storage(decorated):
+        arrays = {}
+        for column_name in decorated.columns:
+            if column_name == "date":
+                arrays[column_name] = ResolutionAligner.to_epoch_ns(decorated[column_name])
+                continue
+            values = decorated[column_name].to_numpy()
+            if values.dtype.kind not in "iufb":
+                return None
+            arrays[column_name] = np.ascontiguousarray(values)
+        return arrays
+
+    @staticmethod
+    def to_df(meta, columns):
+        data = {}
+        for column_name in meta.get("columns"):
+            if column_name == "date":
+                data[column_name] = ResolutionAligner.from_epoch_ns(columns[column_name],
+                                                                    DecoratedFrameCache.get_tz(meta.get("tz")))
+            else:
+                data[column_name] = columns[column_name]
+        return pd.DataFrame(data, columns=meta.get("columns"))
+
+    # json form of a tz: its name, or the UTC offset in minutes of a fixed offset tz; None for naive dates
+    @staticmethod
+    def get_tz_meta(tz):
+        if tz is None:
+            return None
+        try:
+            pytz.timezone(str(tz))
+            return str(tz)
+        except pytz.UnknownTimeZoneError:
+            return int(tz.utcoffset(None).total_seconds() // 60)
+
+    @staticmethod
+    def get_tz(tz_meta):
+        if tz_meta is None or isinstance(tz_meta, str):
+            return tz_meta
+        return pytz.FixedOffset(tz_meta)
+
+    @staticmethod
+    def get_entry_bytes(meta):
+        return sum(np.dtype(dtype).itemsize * meta.get("rows") for dtype in meta.get("dtypes"))
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def write_entry(self, key, symbol, resolution, decorated):
+        arrays = DecoratedFrameCache.to_storage(decorated)
+        if arrays is None:
+            print("Found non numeric columns. Skip caching " + symbol + " " + resolution)
+            return
+        tz = getattr(decorated["date"].dtype, "tz", None)
+        try:
+            tz_meta = DecoratedFrameCache.get_tz_meta(tz)
+        except (AttributeError, TypeError):
+            print("Found dates in an unsupported tz " + str(tz) + ". Skip caching " + symbol + " " + resolution)
+            return
+        entry_dir = self.entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        column_names = list(decorated.columns)
+        for i, column_name in enumerate(column_names):
+            with open(os.path.join(entry_dir, str(i) + ".bin"), "wb") as f:
+                f.write(arrays[column_name].tobytes())
+        meta = {"symbol": symbol,
+                "resolution": resolution,
+                "rows": len(decorated),
+                "tz": tz_meta,
+                "columns": column_names,
+                "dtypes": [arrays[column_name].dtype.str for column_name in column_names]}
+        self.write_meta(key, meta)
+        self.index[key] = {"symbol": symbol, "resolution": resolution,
+                           "bytes": DecoratedFrameCache.get_entry_bytes(meta), "last_access": time.time()}
+        self.evict(keep=key)
+        self.save_index()
+
+    # written to a temporary file and renamed, so the meta on disk is always a whole one
+    def write_meta(self, key, meta):
+        meta_path = os.path.join(self.entry_dir(key), DecoratedFrameCache.META_FILE)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    # (meta, {column_name: read only memmap}) or None
+    def load_entry(self, key):
+        meta_path = os.path.join(self.entry_dir(key), DecoratedFrameCache.META_FILE)
+        if key not in self.index or not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        columns = {}
+        for i, (column_name, dtype) in enumerate(zip(meta.get("columns"), meta.get("dtypes"))):
+            columns[column_name] = np.memmap(os.path.join(self.entry_dir(key), str(i) + ".bin"),
+                                             dtype=np.dtype(dtype), mode="r", shape=(meta.get("rows"),))
+        return meta, columns
+
+    def remove_entry(self, key):
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+        if key in self.index:
+            del self.index[key]
+            self.save_index()
+
+    def touch(self, key):
+        self.index[key]["last_access"] = time.time()
+        self.save_index()
+
+    # least recently used entries go first; the entry just written is kept even if it alone exceeds the cap
+    def evict(self, keep=None):
+        by_access = sorted(self.index.items(), key=lambda item: item[1].get("last_access", 0))
+        for key, _ in by_access:
+            if self.get_size() <= self.max_bytes:
+                break
+            if key != keep:
+                self.remove_entry(key)
+
+    def load_index(self):
+        index_path = os.path.join(self.cache_dir, DecoratedFrameCache.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return {}
+        with open(index_path, "r") as f:
+            return json.load(f)
+
+    def save_index(self):
+        index_path = os.path.join(self.cache_dir, DecoratedFrameCache.INDEX_FILE)
+        with open(index_path, "w") as f:
+            json.dump(self.index, f)
@@ -0,0 +1,86 @@
+import numpy as np
+
+from src.statemachine.dataprocessing.IndicatorDecorator import IndicatorDecorator
+from src.statemachine.dataprocessing.IndicatorRegistry import IndicatorRegistry
+from src.statemachine.dataprocessing.ResolutionAligner import AlignModes
+
+
+# Drop-in replacement for the IndicatorDecorator.decorate_*_resolution_df functions.
+# Instead of instantiating one ta indicator per window (~28 passes for the default 4-window config), the OHLCV
+# columns are pulled out once as contiguous float64 arrays, the per-bar inputs (close diff, typical price, signed
+# money flow, keltner band prices) are derived once, and every indicator sharing a window is computed from one
+# 2D block in a single call:
+#   - close and both keltner band prices go through one rolling mean per window
+#   - close and volume go through one ewm per window (EMA and volume EMA), the up/down moves through another (RSI)
+#   - the money flow sums and donchian extremes are window views over the shared arrays
+#   - the opt-in TSI/MACD/VWAP read the same stacked ewm and rolling sum blocks, ATR/ADX the shared true range
+#     and directional movement arrays
+# The rolling/ewm calls use the same pandas kernels ta uses, so the rounded output is identical to the ta path.
+# The intermediates and the window calls are planned by the IndicatorRegistry once per resolution and config.
+class FusedIndicatorKernel:
+
+    @staticmethod
+    def decorate_1day_resolution_df(df, bb_config_map=None, window_config_map=None):
+        return FusedIndicatorKernel.decorate_resolution_df(df, "1day", bb_config_map, window_config_map)
+
+    @staticmethod
+    def decorate_1hour_resolution_df(df, bb_config_map=None, window_config_map=None):
+        return FusedIndicatorKernel.decorate_resolution_df(df, "1hour", bb_config_map, window_config_map)
+
+    @staticmethod
+    def decorate_5min_resolution_df(df, bb_config_map=None, window_config_map=None):
+        return FusedIndicatorKernel.decorate_resolution_df(df, "5min", bb_config_map, window_config_map)
+
+    @staticmethod
+    def decorate_resolution_df(df, resolution, bb_config_map=None, window_config_map=None, indicators=None,
+                               config_maps=None):
+        if window_config_map is None:
+            window_config_map = IndicatorDecorator.default_window_config_map(resolution)
+        if bb_config_map is None:
+            bb_config_map = IndicatorDecorator.default_bb_config_map(resolution)
+
+        high = np.ascontiguousarray(df[IndicatorDecorator.high(resolution)], dtype=np.float64)
+        low = np.ascontiguousarray(df[IndicatorDecorator.low(resolution)], dtype=np.float64)
+        close = np.ascontiguousarray(df[IndicatorDecorator.close(resolution)], dtype=np.float64)
+        volume = np.ascontiguousarray(df[IndicatorDecorator.volume(resolution)], dtype=np.float64)
+
+        # the window views assume gap-free bars; let ta's NaN aware rolling windows handle anything else
+        if not (np.isfinite(high).all() and np.isfinite(low).all() and
+                np.isfinite(close).all() and np.isfinite(volume).all()):
+            print("Found missing OHLCV values. Fall back to the ta based decorator for " + resolution)
+            return IndicatorDecorator.decorate_resolution_df(df, resolution, bb_config_map, window_config_map,
+                                                             indicators, config_maps)
+
+        indicator_columns = FusedIndicatorKernel.compute_indicator_columns(high, low, close, volume, resolution,
+                                                                           bb_config_map.get(resolution, []),
+                                                                           window_config_map.get(resolution, []),
+                                                                           indicators,
+                                                                           FusedIndicatorKernel.get_extra_configs(
+                                                                               resolution, config_maps))
+        for column_name, values in indicator_columns.items():
+            df[column_name] = values
+        return df
+
+    @staticmethod
+    def decorate_and_merge(df_5min, df_1hour, df_1day, align_mode=AlignModes.MERGE):
+        rn_1day_df = IndicatorDecorator.rename_ohlcv_columns(df_1day, "1day")
+        rn_1hour_df = IndicatorDecorator.rename_ohlcv_columns(df_1hour, "1hour")
+        rn_5min_df = IndicatorDecorator.rename_ohlcv_columns(df_5min, "5min")
+        df_1day_decorated = FusedIndicatorKernel.decorate_1day_resolution_df(rn_1day_df)
+        df_1hour_decorated = FusedIndicatorKernel.decorate_1hour_resolution_df(rn_1hour_df)
+        df_5min_decorated = FusedIndicatorKernel.decorate_5min_resolution_df(rn_5min_df)
+        return IndicatorDecorator.align_decorated(df_5min_decorated, df_1hour_decorated, df_1day_decorated, align_mode)
+
+    # returns {column_name: rounded float64 array}, ordered like the columns of the ta based decorator
+    @staticmethod
+    def compute_indicator_columns(high, low, close, volume, resolution, bb_configs, window_configs, indicators=None,
+                                  extra_configs=None):
+        plan = IndicatorRegistry.get_plan(resolution, bb_configs, window_configs, indicators, extra_configs)
+        return plan.execute(high, low, close, volume)
+
+    # {config kind: configs of the resolution} out of IndicatorDecorator style config_maps
+    @staticmethod
+    def get_extra_configs(resolution, config_maps):
+        if config_maps is None:
+            return None
+        return {config_kind: config_map.get(resolution, []) for config_kind, config_map in config_maps.items()}
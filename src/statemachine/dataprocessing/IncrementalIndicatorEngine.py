@@ -0,0 +1,574 @@
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from src.statemachine.dataprocessing.IndicatorDecorator import IndicatorDecorator
+
+
+# Streaming counterpart of IndicatorDecorator.decorate_*_resolution_df: one bar in, one row of indicators out.
+# Each state below replays the exact floating point update pandas uses for the same window function
+# (ewm(adjust=False), rolling mean/std with Kahan compensation), so after rounding the streaming values are
+# identical to the ta-based batch columns.
+
+# ewm(adjust=False).mean(), as used by ta for EMA (alpha = 2 / (window + 1)) and RSI (alpha = 1 / window)
+class EmaState:
+    def __init__(self, alpha, min_periods):
+        self.alpha = alpha
+        self.old_wt_factor = 1. - alpha
+        self.min_periods = min_periods
+        self.old_wt = 1.
+        self.weighted = math.nan
+        self.nobs = 0
+
+    def update(self, value):
+        is_observation = value == value
+        self.nobs += is_observation
+        if self.weighted == self.weighted:
+            self.old_wt *= self.old_wt_factor
+            if is_observation:
+                # avoid numerical errors on constant series
+                if self.weighted != value:
+                    self.weighted = (self.old_wt * self.weighted + self.alpha * value) / (self.old_wt + self.alpha)
+                self.old_wt = 1.
+        elif is_observation:
+            self.weighted = value
+        return self.value()
+
+    def value(self):
+        if self.nobs < self.min_periods:
+            return math.nan
+        return self.weighted
+
+
+# rolling(window, min_periods).mean()
+class RollingMeanState:
+    def __init__(self, window, min_periods):
+        self.window = window
+        self.min_periods = min_periods
+        self.values = deque()
+        self.nobs = 0
+        self.neg_ct = 0
+        self.sum_x = 0.
+        self.compensation_add = 0.
+        self.compensation_remove = 0.
+        self.num_consecutive_same_value = 0
+        self.prev_value = None
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            self._remove(self.values.popleft())
+        self.values.append(value)
+        self._add(value)
+        return self.value()
+
+    def _add(self, value):
+        if self.prev_value is None:
+            self.prev_value = value
+        if value != value:
+            return
+        self.nobs += 1
+        y = value - self.compensation_add
+        t = self.sum_x + y
+        self.compensation_add = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1., value) < 0:
+            self.neg_ct += 1
+        if value == self.prev_value:
+            self.num_consecutive_same_value += 1
+        else:
+            self.num_consecutive_same_value = 1
+        self.prev_value = value
+
+    def _remove(self, value):
+        if value != value:
+            return
+        self.nobs -= 1
+        y = -value - self.compensation_remove
+        t = self.sum_x + y
+        self.compensation_remove = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1., value) < 0:
+            self.neg_ct -= 1
+
+    def value(self):
+        if self.nobs < self.min_periods or self.nobs == 0:
+            return math.nan
+        result = self.sum_x / self.nobs
+        if self.num_consecutive_same_value >= self.nobs:
+            return self.prev_value
+        if self.neg_ct == 0 and result < 0:
+            return 0.
+        if self.neg_ct == self.nobs and result > 0:
+            return 0.
+        return result
+
+
+# rolling(window, min_periods).std(ddof=0), Welford's online variance with Kahan compensation
+class RollingStdState:
+    def __init__(self, window, min_periods, ddof=0):
+        self.window = window
+        self.min_periods = min_periods
+        self.ddof = ddof
+        self.values = deque()
+        self.nobs = 0
+        self.mean_x = 0.
+        self.ssqdm_x = 0.
+        self.compensation_add = 0.
+        self.compensation_remove = 0.
+        self.num_consecutive_same_value = 0
+        self.prev_value = None
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            self._remove(self.values.popleft())
+        self.values.append(value)
+        self._add(value)
+        return self.value()
+
+    def _add(self, value):
+        if self.prev_value is None:
+            self.prev_value = value
+        if value != value:
+            return
+        self.nobs += 1
+        if value == self.prev_value:
+            self.num_consecutive_same_value += 1
+        else:
+            self.num_consecutive_same_value = 1
+        self.prev_value = value
+        prev_mean = self.mean_x - self.compensation_add
+        y = value - self.compensation_add
+        t = y - self.mean_x
+        self.compensation_add = t + self.mean_x - y
+        self.mean_x = self.mean_x + t / self.nobs
+        self.ssqdm_x = self.ssqdm_x + (value - prev_mean) * (value - self.mean_x)
+
+    def _remove(self, value):
+        if value != value:
+            return
+        self.nobs -= 1
+        if self.nobs == 0:
+            self.mean_x = 0.
+            self.ssqdm_x = 0.
+            return
+        prev_mean = self.mean_x - self.compensation_remove
+        y = value - self.compensation_remove
+        t = y - self.mean_x
+        self.compensation_remove = t + self.mean_x - y
+        self.mean_x = self.mean_x - t / self.nobs
+        self.ssqdm_x = self.ssqdm_x - (value - prev_mean) * (value - self.mean_x)
+
+    def value(self):
+        if self.nobs < self.min_periods or self.nobs <= self.ddof:
+            return math.nan
+        if self.nobs == 1 or self.num_consecutive_same_value >= self.nobs:
+            return 0.
+        variance = self.ssqdm_x / (self.nobs - self.ddof)
+        if variance < 0:
+            return 0.
+        return math.sqrt(variance)
+
+
+# rolling(window, min_periods).max()/.min() with a monotonic deque of (index, value)
+class RollingExtremeState:
+    def __init__(self, window, min_periods, is_max=True):
+        self.window = window
+        self.min_periods = min_periods
+        self.is_max = is_max
+        self.candidates = deque()
+        self.count = 0
+
+    def update(self, value):
+        idx = self.count
+        self.count += 1
+        while len(self.candidates) > 0 and self.candidates[0][0] <= idx - self.window:
+            self.candidates.popleft()
+        if self.is_max:
+            while len(self.candidates) > 0 and self.candidates[-1][1] <= value:
+                self.candidates.pop()
+        else:
+            while len(self.candidates) > 0 and self.candidates[-1][1] >= value:
+                self.candidates.pop()
+        self.candidates.append((idx, value))
+        return self.value()
+
+    def value(self):
+        if min(self.count, self.window) < self.min_periods:
+            return math.nan
+        return self.candidates[0][1]
+
+
+# sum of the non-negative and of the negative money flows within the window, as ta's MFIIndicator does
+class RollingSignedSumState:
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.positive_sum = 0.
+        self.negative_sum = 0.
+        self.positive_ct = 0
+        self.negative_ct = 0
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            self._apply(self.values.popleft(), -1)
+        self.values.append(value)
+        self._apply(value, 1)
+        return self.value()
+
+    def _apply(self, value, direction):
+        if value > 0:
+            self.positive_sum += direction * value
+            self.positive_ct += direction
+        elif value < 0:
+            self.negative_sum += direction * value
+            self.negative_ct += direction
+
+    def value(self):
+        if len(self.values) < self.window:
+            return math.nan, math.nan
+        # snap back to exact zero once every contributing flow left the window
+        positive_sum = self.positive_sum if self.positive_ct > 0 else 0.
+        negative_sum = abs(self.negative_sum) if self.negative_ct > 0 else 0.
+        return positive_sum, negative_sum
+
+
+# rolling(window, min_periods).sum(): the same Kahan add/remove as the mean, without the division
+class RollingSumState(RollingMeanState):
+    def value(self):
+        if self.nobs == 0 == self.min_periods:
+            return 0.
+        if self.nobs < self.min_periods:
+            return math.nan
+        if self.num_consecutive_same_value >= self.nobs:
+            return self.prev_value * self.nobs
+        return self.sum_x
+
+
+# ta's TSIIndicator: the close diff and its absolute value, each through a slow and then a fast ewm
+class TsiState:
+    def __init__(self, window_slow, window_fast):
+        self.diff_slow = EmaState(2. / (window_slow + 1), window_slow)
+        self.diff_fast = EmaState(2. / (window_fast + 1), window_fast)
+        self.abs_diff_slow = EmaState(2. / (window_slow + 1), window_slow)
+        self.abs_diff_fast = EmaState(2. / (window_fast + 1), window_fast)
+
+    def update(self, diff):
+        smoothed = self.diff_fast.update(self.diff_slow.update(diff))
+        smoothed_abs = self.abs_diff_fast.update(self.abs_diff_slow.update(abs(diff)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (np.float64(smoothed) / np.float64(smoothed_abs)) * 100
+
+
+# ta's MACD: fast - slow EMA of the close, its signal EMA and the difference of both
+class MacdState:
+    def __init__(self, window_fast, window_slow, window_sign):
+        self.ema_fast = EmaState(2. / (window_fast + 1), window_fast)
+        self.ema_slow = EmaState(2. / (window_slow + 1), window_slow)
+        self.signal = EmaState(2. / (window_sign + 1), window_sign)
+
+    def update(self, close):
+        macd = self.ema_fast.update(close) - self.ema_slow.update(close)
+        macd_signal = self.signal.update(macd)
+        return macd, macd_signal, macd - macd_signal
+
+
+# ta's AverageTrueRange: 0 until the first window is full, then seeded with its mean and smoothed by 1 / window.
+# Unlike the batch decorator, which leaves frames shorter than the window NaN, the leading rows are 0 as in
+# any longer frame.
+class AtrState:
+    def __init__(self, window):
+        self.window = window
+        self.seed_values = []
+        self.atr = 0.
+
+    def update(self, true_range):
+        if len(self.seed_values) < self.window:
+            self.seed_values.append(true_range)
+            if len(self.seed_values) == self.window:
+                self.atr = pd.Series(self.seed_values).mean()
+            return self.atr
+        self.atr = (self.atr * (self.window - 1) + true_range) / float(self.window)
+        return self.atr
+
+
+# ta's ADXIndicator: Wilder sums of the true range and the directional movement seeded with the sums of bars
+# 1..window, the directional index over them, and adx seeded with the mean of the first window of it.
+# adx_pos/adx_neg are 0 up to bar window, adx up to bar 2 * window - 2; as with AtrState, frames too short for the
+# batch decorator get these zeros instead of NaN.
+class AdxState:
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self.seed_values = []
+        self.trs = self.dip = self.din = math.nan
+        self.directional_index = []
+        self.adx = 0.
+
+    # bar 0 has no previous bar and doesn't count into the sums
+    def update(self, true_range, plus_dm, minus_dm):
+        bar = self.count
+        self.count += 1
+        if bar == 0:
+            return 0., 0., 0.
+        if bar <= self.window:
+            self.seed_values.append((true_range, plus_dm, minus_dm))
+            if bar < self.window:
+                return 0., 0., 0.
+            seeds = np.array(self.seed_values)
+            self.trs = pd.Series(seeds[:, 0]).sum()
+            self.dip = pd.Series(seeds[:, 1]).sum()
+            self.din = pd.Series(seeds[:, 2]).sum()
+            self.seed_values = []
+        else:
+            self.trs = self.trs - (self.trs / float(self.window)) + true_range
+            self.dip = self.dip - (self.dip / float(self.window)) + plus_dm
+            self.din = self.din - (self.din / float(self.window)) + minus_dm
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dip_pct = 100 * (np.float64(self.dip) / self.trs)
+            din_pct = 100 * (np.float64(self.din) / self.trs)
+            directional_index = 100 * np.abs((dip_pct - din_pct) / (dip_pct + din_pct))
+        if len(self.directional_index) < self.window:
+            self.directional_index.append(directional_index)
+            if len(self.directional_index) == self.window:
+                self.adx = np.array(self.directional_index).mean()
+        else:
+            self.adx = ((self.adx * (self.window - 1)) + directional_index) / float(self.window)
+        if bar == self.window:
+            return self.adx, 0., 0.
+        return self.adx, dip_pct, din_pct
+
+
+class IncrementalIndicatorEngine:
+    # indicators/config_maps as for IndicatorDecorator.decorate_resolution_df; states are only kept for the
+    # indicators asked for
+    def __init__(self, resolution, bb_config_map=None, window_config_map=None, indicators=None, config_maps=None):
+        self.resolution = resolution
+        if indicators is None:
+            indicators = IndicatorDecorator.INDICATORS
+        self.indicators = indicators
+        self.bb_configs = IndicatorDecorator.get_config_map("bb", resolution, bb_config_map, window_config_map,
+                                                            config_maps).get(resolution, [])
+        self.window_configs = IndicatorDecorator.get_config_map("window", resolution, bb_config_map,
+                                                                window_config_map, config_maps).get(resolution, [])
+        self.tsi_configs = IndicatorDecorator.get_config_map("tsi", resolution, bb_config_map, window_config_map,
+                                                             config_maps).get(resolution, [])
+        self.macd_configs = IndicatorDecorator.get_config_map("macd", resolution, bb_config_map, window_config_map,
+                                                              config_maps).get(resolution, [])
+
+        # column names of the incoming bar
+        self.high_col = IndicatorDecorator.high(resolution)
+        self.low_col = IndicatorDecorator.low(resolution)
+        self.close_col = IndicatorDecorator.close(resolution)
+        self.volume_col = IndicatorDecorator.volume(resolution)
+
+        self.bollinger_states = []
+        for bb_config in (self.bb_configs if "bollinger" in indicators else []):
+            window = bb_config.get("window")
+            window_dev = bb_config.get("window_dev")
+            self.bollinger_states.append((IndicatorDecorator.bollinger_high(resolution, str(window), str(window_dev)),
+                                          IndicatorDecorator.bollinger_low(resolution, str(window), str(window_dev)),
+                                          window_dev,
+                                          RollingMeanState(window, window),
+                                          RollingStdState(window, window)))
+
+        self.ema_states = []
+        self.rsi_states = []
+        self.mfi_states = []
+        self.donchian_states = []
+        self.keltner_states = []
+        self.volume_ema_states = []
+        self.atr_states = []
+        self.adx_states = []
+        self.vwap_states = []
+        for window_config in self.window_configs:
+            window = window_config.get("window")
+            if "ema" in indicators:
+                self.ema_states.append((IndicatorDecorator.ema(resolution, str(window)),
+                                        EmaState(2. / (window + 1), window)))
+            if "rsi" in indicators:
+                self.rsi_states.append((IndicatorDecorator.rsi(resolution, str(window)),
+                                        EmaState(1. / window, window),
+                                        EmaState(1. / window, window)))
+            if "mfi" in indicators:
+                self.mfi_states.append((IndicatorDecorator.mfi(resolution, str(window)),
+                                        RollingSignedSumState(window)))
+            if "donchian" in indicators:
+                self.donchian_states.append((IndicatorDecorator.donchian_high(resolution, str(window)),
+                                             IndicatorDecorator.donchian_low(resolution, str(window)),
+                                             RollingExtremeState(window, window, is_max=True),
+                                             RollingExtremeState(window, window, is_max=False)))
+            # ta computes the keltner bands with min_periods=0, so they are defined from the first bar on
+            if "keltner" in indicators:
+                self.keltner_states.append((IndicatorDecorator.keltner_high(resolution, str(window)),
+                                            IndicatorDecorator.keltner_low(resolution, str(window)),
+                                            RollingMeanState(window, 0),
+                                            RollingMeanState(window, 0)))
+            if "volume_ema" in indicators:
+                self.volume_ema_states.append((IndicatorDecorator.volume_ema(resolution, str(window)),
+                                               EmaState(2. / (window + 1), window)))
+            if "atr" in indicators:
+                self.atr_states.append((IndicatorDecorator.atr(resolution, str(window)), AtrState(window)))
+            if "adx" in indicators:
+                self.adx_states.append((IndicatorDecorator.adx(resolution, str(window)),
+                                        IndicatorDecorator.adx_pos(resolution, str(window)),
+                                        IndicatorDecorator.adx_neg(resolution, str(window)),
+                                        AdxState(window)))
+            if "vwap" in indicators:
+                self.vwap_states.append((IndicatorDecorator.vwap(resolution, str(window)),
+                                         RollingSumState(window, window),
+                                         RollingSumState(window, window)))
+
+        self.tsi_states = []
+        for tsi_config in (self.tsi_configs if "tsi" in indicators else []):
+            window_slow = tsi_config.get("window_slow")
+            window_fast = tsi_config.get("window_fast")
+            self.tsi_states.append((IndicatorDecorator.tsi(resolution, str(window_slow), str(window_fast)),
+                                    TsiState(window_slow, window_fast)))
+
+        self.macd_states = []
+        for macd_config in (self.macd_configs if "macd" in indicators else []):
+            window_names = [str(macd_config.get("window_fast")), str(macd_config.get("window_slow")),
+                            str(macd_config.get("window_sign"))]
+            self.macd_states.append((IndicatorDecorator.macd(resolution, *window_names),
+                                     IndicatorDecorator.macd_signal(resolution, *window_names),
+                                     IndicatorDecorator.macd_diff(resolution, *window_names),
+                                     MacdState(macd_config.get("window_fast"), macd_config.get("window_slow"),
+                                               macd_config.get("window_sign"))))
+
+        self.prev_high = math.nan
+        self.prev_low = math.nan
+        self.prev_close = math.nan
+        self.prev_typical_price = math.nan
+        self.bar_count = 0
+        self.latest_values = {}
+
+    # bar: dict/Series keyed by the resolution prefixed column names, i.e. "5min_close"
+    def update(self, bar):
+        high = float(bar[self.high_col])
+        low = float(bar[self.low_col])
+        close = float(bar[self.close_col])
+        volume = float(bar[self.volume_col])
+
+        # inputs shared by every window
+        diff = close - self.prev_close
+        up_direction = diff if diff > 0 else 0.
+        down_direction = -diff if diff < 0 else -0.
+        typical_price = (high + low + close) / 3.0
+        if typical_price > self.prev_typical_price:
+            up_down = 1
+        elif typical_price < self.prev_typical_price:
+            up_down = -1
+        else:
+            up_down = 0
+        money_flow = typical_price * volume * up_down
+        keltner_high_price = ((4 * high) - (2 * low) + close) / 3.0
+        keltner_low_price = ((-2 * high) + (4 * low) + close) / 3.0
+        # true range and directional movement of ATR/ADX; the first bar has no previous close, its range is high - low
+        if self.prev_close != self.prev_close:
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        up_move = high - self.prev_high
+        down_move = self.prev_low - low
+        plus_dm = up_move if up_move > down_move and up_move > 0 else 0.
+        minus_dm = down_move if down_move > up_move and down_move > 0 else 0.
+        self.prev_high = high
+        self.prev_low = low
+        self.prev_close = close
+        self.prev_typical_price = typical_price
+        self.bar_count += 1
+
+        values = {}
+        for bb_h, bb_l, window_dev, mean_state, std_state in self.bollinger_states:
+            mavg = mean_state.update(close)
+            mstd = std_state.update(close)
+            values[bb_h] = IncrementalIndicatorEngine.round_value(mavg + window_dev * mstd)
+            values[bb_l] = IncrementalIndicatorEngine.round_value(mavg - window_dev * mstd)
+
+        for ema, ema_state in self.ema_states:
+            values[ema] = IncrementalIndicatorEngine.round_value(ema_state.update(close))
+
+        for rsi, emaup_state, emadn_state in self.rsi_states:
+            emaup = emaup_state.update(up_direction)
+            emadn = emadn_state.update(down_direction)
+            if emadn == 0:
+                rsi_val = 100.
+            elif emadn != emadn:
+                rsi_val = math.nan
+            else:
+                rsi_val = 100 - (100 / (1 + emaup / emadn))
+            values[rsi] = IncrementalIndicatorEngine.round_value(rsi_val)
+
+        for mfi, signed_sum_state in self.mfi_states:
+            positive_mf, negative_mf = signed_sum_state.update(money_flow)
+            values[mfi] = IncrementalIndicatorEngine.round_value(
+                IncrementalIndicatorEngine.money_flow_index(positive_mf, negative_mf))
+
+        for dc_h, dc_l, high_state, low_state in self.donchian_states:
+            values[dc_h] = IncrementalIndicatorEngine.round_value(high_state.update(high))
+            values[dc_l] = IncrementalIndicatorEngine.round_value(low_state.update(low))
+
+        for kl_h, kl_l, high_state, low_state in self.keltner_states:
+            values[kl_h] = IncrementalIndicatorEngine.round_value(high_state.update(keltner_high_price))
+            values[kl_l] = IncrementalIndicatorEngine.round_value(low_state.update(keltner_low_price))
+
+        for volume_ema, ema_state in self.volume_ema_states:
+            values[volume_ema] = IncrementalIndicatorEngine.round_value(ema_state.update(volume))
+
+        for tsi, tsi_state in self.tsi_states:
+            values[tsi] = IncrementalIndicatorEngine.round_value(tsi_state.update(diff))
+
+        for atr, atr_state in self.atr_states:
+            values[atr] = IncrementalIndicatorEngine.round_value(atr_state.update(true_range))
+
+        for adx, adx_pos, adx_neg, adx_state in self.adx_states:
+            adx_val, adx_pos_val, adx_neg_val = adx_state.update(true_range, plus_dm, minus_dm)
+            values[adx] = IncrementalIndicatorEngine.round_value(adx_val)
+            values[adx_pos] = IncrementalIndicatorEngine.round_value(adx_pos_val)
+            values[adx_neg] = IncrementalIndicatorEngine.round_value(adx_neg_val)
+
+        for macd, macd_signal, macd_diff, macd_state in self.macd_states:
+            macd_val, macd_signal_val, macd_diff_val = macd_state.update(close)
+            values[macd] = IncrementalIndicatorEngine.round_value(macd_val)
+            values[macd_signal] = IncrementalIndicatorEngine.round_value(macd_signal_val)
+            values[macd_diff] = IncrementalIndicatorEngine.round_value(macd_diff_val)
+
+        for vwap, pv_state, volume_state in self.vwap_states:
+            pv_sum = pv_state.update(typical_price * volume)
+            volume_sum = volume_state.update(volume)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values[vwap] = IncrementalIndicatorEngine.round_value(np.float64(pv_sum) / volume_sum)
+
+        self.latest_values = values
+        return values
+
+    # replay the history so that the next update() continues from the last bar of df
+    def warm_up(self, df):
+        columns = [self.high_col, self.low_col, self.close_col, self.volume_col]
+        for high, low, close, volume in df[columns].itertuples(index=False, name=None):
+            self.update({self.high_col: high, self.low_col: low, self.close_col: close, self.volume_col: volume})
+        return self.latest_values
+
+    def get_latest_values(self):
+        return self.latest_values
+
+    def get_bar_count(self):
+        return self.bar_count
+
+    @staticmethod
+    def money_flow_index(positive_mf, negative_mf):
+        if positive_mf != positive_mf or negative_mf != negative_mf:
+            return math.nan
+        if negative_mf == 0:
+            if positive_mf == 0:
+                return math.nan
+            return 100.
+        return 100 - (100 / (1 + positive_mf / negative_mf))
+
+    # same numpy rounding the batch path applies to the whole column
+    @staticmethod
+    def round_value(value):
+        return IndicatorDecorator.round_to_decimal(np.float64(value))
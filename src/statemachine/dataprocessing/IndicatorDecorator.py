@@ -2,8 +2,11 @@ from ta.trend import *
 from ta.volume import *
 from ta.volatility import *
 from ta.momentum import *
+import numpy as np
 import pandas as pd
 
+from src.statemachine.dataprocessing.ResolutionAligner import AlignModes, ResolutionAligner
+
 
 class DatasetResolutions:
     ONE_MIN = "one_min"
@@ -14,6 +17,48 @@ class DatasetResolutions:
     ONE_WEEK = "one_week"
 
 
+# per resolution settings: the column prefix and the default look back windows.
+# Adding a resolution to the decorators, the fused kernel and the incremental engine only takes an entry here.
+class ResolutionRegistry:
+    RESOLUTIONS = {DatasetResolutions.FIVE_MIN: {"prefix": "5min", "windows": [3, 6, 12, 24], "window_dev": 2},
+                   DatasetResolutions.THIRTY_MIN: {"prefix": "30min", "windows": [3, 6, 12, 24], "window_dev": 2},
+                   DatasetResolutions.ONE_HOUR: {"prefix": "1hour", "windows": [3, 6, 12, 24], "window_dev": 2},
+                   DatasetResolutions.ONE_DAY: {"prefix": "1day", "windows": [3, 5, 10, 15], "window_dev": 2},
+                   DatasetResolutions.ONE_WEEK: {"prefix": "1week", "windows": [3, 5, 10, 15], "window_dev": 2}}
+
+    # defaults of the indicators that are not configured by a single look back window; a resolution entry can
+    # override them with its own "tsi"/"macd" list
+    DEFAULT_CONFIGS = {"tsi": [{"window_slow": 25, "window_fast": 13}],
+                       "macd": [{"window_slow": 26, "window_fast": 12, "window_sign": 9}]}
+
+    # accepts either a DatasetResolutions value or a column prefix such as "5min"
+    @staticmethod
+    def get_config(resolution):
+        if resolution in ResolutionRegistry.RESOLUTIONS:
+            return ResolutionRegistry.RESOLUTIONS[resolution]
+        for config in ResolutionRegistry.RESOLUTIONS.values():
+            if config.get("prefix") == resolution:
+                return config
+        return {}
+
+    @staticmethod
+    def get_prefix(resolution):
+        return ResolutionRegistry.get_config(resolution).get("prefix", resolution)
+
+    @staticmethod
+    def get_windows(resolution):
+        return ResolutionRegistry.get_config(resolution).get("windows", [])
+
+    @staticmethod
+    def get_window_dev(resolution):
+        return ResolutionRegistry.get_config(resolution).get("window_dev", 2)
+
+    @staticmethod
+    def get_default_configs(resolution, config_kind):
+        return ResolutionRegistry.get_config(resolution).get(config_kind,
+                                                             ResolutionRegistry.DEFAULT_CONFIGS.get(config_kind, []))
+
+
 class Columns:
     DATE = "date"
     OPEN = "open"
@@ -48,97 +93,114 @@ class Columns:
 # dataset should be pre-processed already
 class IndicatorDecorator:
 
+    # default indicators, in the column order of a decorated frame
+    INDICATORS = ["bollinger", "ema", "rsi", "mfi", "donchian", "keltner", "volume_ema"]
+    # opt-in momentum/volatility indicators, e.g. indicators=INDICATORS + MOMENTUM_INDICATORS
+    MOMENTUM_INDICATORS = ["tsi", "atr", "adx", "macd", "vwap"]
+    # indicator name -> (config kind, ta based decorator)
+    REFERENCE_DECORATORS = {"bollinger": ("bb", "add_bollinger"),
+                            "ema": ("window", "add_ema"),
+                            "rsi": ("window", "add_rsi"),
+                            "mfi": ("window", "add_moneyflow"),
+                            "donchian": ("window", "add_donchian"),
+                            "keltner": ("window", "add_keltner"),
+                            "volume_ema": ("window", "add_volume_ema"),
+                            "tsi": ("tsi", "add_tsi"),
+                            "atr": ("window", "add_atr"),
+                            "adx": ("window", "add_adx"),
+                            "macd": ("macd", "add_macd"),
+                            "vwap": ("window", "add_vwap")}
+
+    @staticmethod
+    def default_window_config_map(resolution):
+        windows = ResolutionRegistry.get_windows(resolution)
+        return {resolution: [{"window": window} for window in windows]}
+
+    @staticmethod
+    def default_bb_config_map(resolution):
+        windows = ResolutionRegistry.get_windows(resolution)
+        window_dev = ResolutionRegistry.get_window_dev(resolution)
+        return {resolution: [{"window": window, "window_dev": window_dev} for window in windows]}
+
+    # {"1hour": [{"window_slow": 25, "window_fast": 13}]} for config_kind "tsi"
+    @staticmethod
+    def default_config_map(config_kind, resolution):
+        if config_kind == "bb":
+            return IndicatorDecorator.default_bb_config_map(resolution)
+        if config_kind == "window":
+            return IndicatorDecorator.default_window_config_map(resolution)
+        return {resolution: ResolutionRegistry.get_default_configs(resolution, config_kind)}
+
+    # config_maps: {config kind: config map} for the kinds other than "bb" and "window"
+    @staticmethod
+    def get_config_map(config_kind, resolution, bb_config_map, window_config_map, config_maps=None):
+        if config_kind == "bb":
+            config_map = bb_config_map
+        elif config_kind == "window":
+            config_map = window_config_map
+        else:
+            config_map = (config_maps or {}).get(config_kind)
+        if config_map is None:
+            config_map = IndicatorDecorator.default_config_map(config_kind, resolution)
+        return config_map
+
     @staticmethod
     def decorate_1day_resolution_df(df, bb_config_map=None, window_config_map=None):
-        if window_config_map is None:
-            kl_config_map = dc_config_map = mfi_config_map = rsi_config_map = ema_config_map = \
-                {"1day": [{"window": 3}, {"window": 5}, {"window": 10}, {"window": 15}]}
-        else:
-            kl_config_map = dc_config_map = mfi_config_map = rsi_config_map = ema_config_map = window_config_map
-        if bb_config_map is None:
-            bb_config_map = {
-                "1day": [{"window": 3, "window_dev": 2}, {"window": 5, "window_dev": 2},
-                         {"window": 10, "window_dev": 2},
-                         {"window": 15, "window_dev": 2}]}
-
-        resolution = "1day"
-        df_0 = IndicatorDecorator.add_bollinger(df, resolution, bb_config_map)
-        df_1 = IndicatorDecorator.add_ema(df_0, resolution, ema_config_map)
-        df_2 = IndicatorDecorator.add_rsi(df_1, resolution, rsi_config_map)
-        df_3 = IndicatorDecorator.add_moneyflow(df_2, resolution, mfi_config_map)
-        df_4 = IndicatorDecorator.add_donchian(df_3, resolution, dc_config_map)
-        df_5 = IndicatorDecorator.add_keltner(df_4, resolution, kl_config_map)
-        df_6 = IndicatorDecorator.add_volume_ema(df_5, resolution, ema_config_map)
-        return df_6
+        return IndicatorDecorator.decorate_resolution_df(df, "1day", bb_config_map, window_config_map)
 
     @staticmethod
     def decorate_1hour_resolution_df(df, bb_config_map=None, window_config_map=None):
-        if window_config_map is None:
-            kl_config_map = dc_config_map = mfi_config_map = rsi_config_map = ema_config_map = {
-                "1hour": [{"window": 3}, {"window": 6}, {"window": 12}, {"window": 24}]}
-        else:
-            kl_config_map = dc_config_map = mfi_config_map = rsi_config_map = ema_config_map = window_config_map
-        if bb_config_map is None:
-            bb_config_map = {
-                "1hour": [{"window": 3, "window_dev": 2},
-                          {"window": 6, "window_dev": 2},
-                          {"window": 12, "window_dev": 2},
-                          {"window": 24, "window_dev": 2}]}
-
-        resolution = "1hour"
-        df_0 = IndicatorDecorator.add_bollinger(df, resolution, bb_config_map)
-        df_1 = IndicatorDecorator.add_ema(df_0, resolution, ema_config_map)
-        df_2 = IndicatorDecorator.add_rsi(df_1, resolution, rsi_config_map)
-        df_3 = IndicatorDecorator.add_moneyflow(df_2, resolution, mfi_config_map)
-        df_4 = IndicatorDecorator.add_donchian(df_3, resolution, dc_config_map)
-        df_5 = IndicatorDecorator.add_keltner(df_4, resolution, kl_config_map)
-        df_6 = IndicatorDecorator.add_volume_ema(df_5, resolution, ema_config_map)
-        return df_6
+        return IndicatorDecorator.decorate_resolution_df(df, "1hour", bb_config_map, window_config_map)
 
     @staticmethod
     def decorate_5min_resolution_df(df, bb_config_map=None, window_config_map=None):
-        if window_config_map is None:
-            kl_config_map = dc_config_map = mfi_config_map = rsi_config_map = ema_config_map = {
-                "5min": [{"window": 3}, {"window": 6}, {"window": 12}, {"window": 24}]}
-        else:
-            kl_config_map = dc_config_map = mfi_config_map = rsi_config_map = ema_config_map = window_config_map
-        if bb_config_map is None:
-            bb_config_map = {
-                "5min": [{"window": 3, "window_dev": 2},
-                         {"window": 6, "window_dev": 2},
-                         {"window": 12, "window_dev": 2},
-                         {"window": 24, "window_dev": 2}]}
-
-        resolution = "5min"
-        df_0 = IndicatorDecorator.add_bollinger(df, resolution, bb_config_map)
-        df_1 = IndicatorDecorator.add_ema(df_0, resolution, ema_config_map)
-        df_2 = IndicatorDecorator.add_rsi(df_1, resolution, rsi_config_map)
-        df_3 = IndicatorDecorator.add_moneyflow(df_2, resolution, mfi_config_map)
-        df_4 = IndicatorDecorator.add_donchian(df_3, resolution, dc_config_map)
-        df_5 = IndicatorDecorator.add_keltner(df_4, resolution, kl_config_map)
-        df_6 = IndicatorDecorator.add_volume_ema(df_5, resolution, ema_config_map)
-        return df_6
-
-    @staticmethod
-    def decorate_and_merge(df_5min, df_1hour, df_1day):
-        rn_1day_df = df_1day.rename(columns={"open": "1day_open", "high": "1day_high", "low": "1day_low",
-                                             "close": "1day_close", "volume": "1day_volume", "average": "1day_average"})
-
-        rn_1hour_df = df_1hour.rename(columns={"open": "1hour_open", "high": "1hour_high", "low": "1hour_low",
-                                               "close": "1hour_close", "volume": "1hour_volume",
-                                               "average": "1hour_average"})
-
-        rn_5min_df = df_5min.rename(columns={"open": "5min_open", "high": "5min_high", "low": "5min_low",
-                                             "close": "5min_close", "volume": "5min_volume", "average": "5min_average"})
+        return IndicatorDecorator.decorate_resolution_df(df, "5min", bb_config_map, window_config_map)
+
+    @staticmethod
+    def decorate_resolution_df(df, resolution, bb_config_map=None, window_config_map=None, indicators=None,
+                               config_maps=None):
+        if indicators is None:
+            indicators = IndicatorDecorator.INDICATORS
+
+        for indicator in indicators:
+            config_kind, decorator_name = IndicatorDecorator.REFERENCE_DECORATORS[indicator]
+            config_map = IndicatorDecorator.get_config_map(config_kind, resolution, bb_config_map, window_config_map,
+                                                           config_maps)
+            df = getattr(IndicatorDecorator, decorator_name)(df, resolution, config_map)
+        return df
+
+    @staticmethod
+    def decorate_and_merge(df_5min, df_1hour, df_1day, align_mode=AlignModes.MERGE):
+        rn_1day_df = IndicatorDecorator.rename_ohlcv_columns(df_1day, "1day")
+        rn_1hour_df = IndicatorDecorator.rename_ohlcv_columns(df_1hour, "1hour")
+        rn_5min_df = IndicatorDecorator.rename_ohlcv_columns(df_5min, "5min")
         df_1day_decorated = IndicatorDecorator.decorate_1day_resolution_df(rn_1day_df)
         df_1hour_decorated = IndicatorDecorator.decorate_1hour_resolution_df(rn_1hour_df)
         df_5min_decorated = IndicatorDecorator.decorate_5min_resolution_df(rn_5min_df)
+        return IndicatorDecorator.align_decorated(df_5min_decorated, df_1hour_decorated, df_1day_decorated, align_mode)
+
+    # AlignModes.INDEX returns a lazy AlignedFrame instead of the merged DataFrame; call to_df() to materialize it
+    @staticmethod
+    def align_decorated(df_5min_decorated, df_1hour_decorated, df_1day_decorated, align_mode=AlignModes.MERGE):
+        if align_mode == AlignModes.INDEX:
+            return ResolutionAligner.align_decorated(df_5min_decorated, df_1hour_decorated, df_1day_decorated)
+        assert align_mode == AlignModes.MERGE, "Unknown align mode " + str(align_mode)
 
         df_1hour_merged = IndicatorDecorator.merge_two_df_based_on_date(df_1hour_decorated, df_1day_decorated)
         df_5min_merged = IndicatorDecorator.merge_two_df_based_on_date(df_5min_decorated, df_1hour_merged)
 
         return df_5min_merged
 
+    # "close" -> "1day_close"
+    @staticmethod
+    def rename_ohlcv_columns(df, resolution):
+        return df.rename(columns={Columns.OPEN: IndicatorDecorator.open(resolution),
+                                  Columns.HIGH: IndicatorDecorator.high(resolution),
+                                  Columns.LOW: IndicatorDecorator.low(resolution),
+                                  Columns.CLOSE: IndicatorDecorator.close(resolution),
+                                  Columns.VOLUME: IndicatorDecorator.volume(resolution),
+                                  Columns.AVG: IndicatorDecorator.average(resolution)})
+
     @staticmethod
     def round_to_decimal(input_val, decimal=3):
         return round(input_val, decimal)
@@ -204,9 +266,108 @@ class IndicatorDecorator:
             df[rsi_val] = IndicatorDecorator.round_to_decimal(indicator.rsi())
         return df
 
+    # {"1hour": [{"window_slow": 25, "window_fast": 13}]}
     @staticmethod
     def add_tsi(df, resolution, indicator_config_map):
-        pass
+        indicator_configs = indicator_config_map.get(resolution, [])
+        for indicator_config in indicator_configs:
+            window_slow = indicator_config.get("window_slow")
+            window_fast = indicator_config.get("window_fast")
+            # column names
+            current_close = IndicatorDecorator.close(resolution)
+            tsi_val = IndicatorDecorator.tsi(resolution, str(window_slow), str(window_fast))
+            indicator = TSIIndicator(close=df[current_close], window_slow=window_slow, window_fast=window_fast)
+            df[tsi_val] = IndicatorDecorator.round_to_decimal(indicator.tsi())
+        return df
+
+    # ta needs at least one full window of bars; shorter frames get NaN
+    @staticmethod
+    def add_atr(df, resolution, indicator_config_map):
+        indicator_configs = indicator_config_map.get(resolution, [])
+        for indicator_config in indicator_configs:
+            window = indicator_config.get("window")
+            # column names
+            current_high = IndicatorDecorator.high(resolution)
+            current_low = IndicatorDecorator.low(resolution)
+            current_close = IndicatorDecorator.close(resolution)
+            atr = IndicatorDecorator.atr(resolution, str(window))
+            if len(df) < window:
+                df[atr] = np.nan
+                continue
+            indicator = AverageTrueRange(high=df[current_high],
+                                         low=df[current_low],
+                                         close=df[current_close],
+                                         window=window)
+            df[atr] = IndicatorDecorator.round_to_decimal(indicator.average_true_range())
+        return df
+
+    # ta needs at least two full windows of bars; shorter frames get NaN
+    @staticmethod
+    def add_adx(df, resolution, indicator_config_map):
+        indicator_configs = indicator_config_map.get(resolution, [])
+        for indicator_config in indicator_configs:
+            window = indicator_config.get("window")
+            # column names
+            current_high = IndicatorDecorator.high(resolution)
+            current_low = IndicatorDecorator.low(resolution)
+            current_close = IndicatorDecorator.close(resolution)
+            adx = IndicatorDecorator.adx(resolution, str(window))
+            adx_pos = IndicatorDecorator.adx_pos(resolution, str(window))
+            adx_neg = IndicatorDecorator.adx_neg(resolution, str(window))
+            if len(df) < 2 * window:
+                df[adx] = df[adx_pos] = df[adx_neg] = np.nan
+                continue
+            indicator = ADXIndicator(high=df[current_high],
+                                     low=df[current_low],
+                                     close=df[current_close],
+                                     window=window)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                df[adx] = IndicatorDecorator.round_to_decimal(indicator.adx())
+                df[adx_pos] = IndicatorDecorator.round_to_decimal(indicator.adx_pos())
+                df[adx_neg] = IndicatorDecorator.round_to_decimal(indicator.adx_neg())
+        return df
+
+    # {"1hour": [{"window_slow": 26, "window_fast": 12, "window_sign": 9}]}
+    @staticmethod
+    def add_macd(df, resolution, indicator_config_map):
+        indicator_configs = indicator_config_map.get(resolution, [])
+        for indicator_config in indicator_configs:
+            window_slow = indicator_config.get("window_slow")
+            window_fast = indicator_config.get("window_fast")
+            window_sign = indicator_config.get("window_sign")
+            # column names
+            current_close = IndicatorDecorator.close(resolution)
+            macd = IndicatorDecorator.macd(resolution, str(window_fast), str(window_slow), str(window_sign))
+            macd_signal = IndicatorDecorator.macd_signal(resolution, str(window_fast), str(window_slow),
+                                                         str(window_sign))
+            macd_diff = IndicatorDecorator.macd_diff(resolution, str(window_fast), str(window_slow), str(window_sign))
+            indicator = MACD(close=df[current_close],
+                             window_slow=window_slow,
+                             window_fast=window_fast,
+                             window_sign=window_sign)
+            df[macd] = IndicatorDecorator.round_to_decimal(indicator.macd())
+            df[macd_signal] = IndicatorDecorator.round_to_decimal(indicator.macd_signal())
+            df[macd_diff] = IndicatorDecorator.round_to_decimal(indicator.macd_diff())
+        return df
+
+    @staticmethod
+    def add_vwap(df, resolution, indicator_config_map):
+        indicator_configs = indicator_config_map.get(resolution, [])
+        for indicator_config in indicator_configs:
+            window = indicator_config.get("window")
+            # column names
+            current_high = IndicatorDecorator.high(resolution)
+            current_low = IndicatorDecorator.low(resolution)
+            current_close = IndicatorDecorator.close(resolution)
+            current_volume = IndicatorDecorator.volume(resolution)
+            vwap = IndicatorDecorator.vwap(resolution, str(window))
+            indicator = VolumeWeightedAveragePrice(high=df[current_high],
+                                                   low=df[current_low],
+                                                   close=df[current_close],
+                                                   volume=df[current_volume],
+                                                   window=window)
+            df[vwap] = IndicatorDecorator.round_to_decimal(indicator.volume_weighted_average_price())
+        return df
 
     @staticmethod
     def add_moneyflow(df, resolution, indicator_config_map):
@@ -351,4 +512,40 @@ class IndicatorDecorator:
 
     @staticmethod
     def keltner_low(resolution, window):
-        return resolution + "_" + "kl_l" + "_" + window
\ No newline at end of file
+        return resolution + "_" + "kl_l" + "_" + window
+
+    @staticmethod
+    def tsi(resolution, window_slow, window_fast):
+        return resolution + "_" + "tsi" + "_" + window_slow + "_" + window_fast
+
+    @staticmethod
+    def atr(resolution, window):
+        return resolution + "_" + "atr" + "_" + window
+
+    @staticmethod
+    def adx(resolution, window):
+        return resolution + "_" + "adx" + "_" + window
+
+    @staticmethod
+    def adx_pos(resolution, window):
+        return resolution + "_" + "adx_pos" + "_" + window
+
+    @staticmethod
+    def adx_neg(resolution, window):
+        return resolution + "_" + "adx_neg" + "_" + window
+
+    @staticmethod
+    def macd(resolution, window_fast, window_slow, window_sign):
+        return resolution + "_" + "macd" + "_" + window_fast + "_" + window_slow + "_" + window_sign
+
+    @staticmethod
+    def macd_signal(resolution, window_fast, window_slow, window_sign):
+        return resolution + "_" + "macd_signal" + "_" + window_fast + "_" + window_slow + "_" + window_sign
+
+    @staticmethod
+    def macd_diff(resolution, window_fast, window_slow, window_sign):
+        return resolution + "_" + "macd_diff" + "_" + window_fast + "_" + window_slow + "_" + window_sign
+
+    @staticmethod
+    def vwap(resolution, window):
+        return resolution + "_" + "vwap" + "_" + window
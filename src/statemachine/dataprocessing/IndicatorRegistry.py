@@ -0,0 +1,587 @@
+import math
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.statemachine.dataprocessing.IndicatorDecorator import IndicatorDecorator, ResolutionRegistry
+
+
+# window primitives of the fused kernels, all matching the pandas reductions ta runs
+class WindowKernels:
+
+    # pandas' Kahan compensated rolling kernel; a plain prefix sum drifts far enough to flip exact .0005 ties
+    @staticmethod
+    def rolling_mean(block, window, min_periods=0):
+        return pd.DataFrame(block).rolling(window, min_periods=min_periods).mean().to_numpy()
+
+    @staticmethod
+    def rolling_std(values, window):
+        return pd.Series(values).rolling(window, min_periods=window).std(ddof=0).to_numpy()
+
+    # per-window np.sum, the same reduction ta runs through rolling().apply()
+    @staticmethod
+    def rolling_sum(values, window):
+        result = np.full(len(values), np.nan)
+        if len(values) >= window:
+            result[window - 1:] = sliding_window_view(values, window).sum(axis=1)
+        return result
+
+    @staticmethod
+    def rolling_max(values, window):
+        result = np.full(len(values), np.nan)
+        if len(values) >= window:
+            result[window - 1:] = sliding_window_view(values, window).max(axis=1)
+        return result
+
+    @staticmethod
+    def rolling_min(values, window):
+        result = np.full(len(values), np.nan)
+        if len(values) >= window:
+            result[window - 1:] = sliding_window_view(values, window).min(axis=1)
+        return result
+
+    # pandas' Kahan compensated rolling sum, the reduction behind ta's rolling().sum()
+    @staticmethod
+    def rolling_kahan_sum(block, window):
+        return pd.DataFrame(block).rolling(window, min_periods=window).sum().to_numpy()
+
+    # recursive filters cannot be vectorized with numpy alone; pandas' ewm kernel runs every column of the block
+    # in a single call, with the same min_periods ta uses
+    @staticmethod
+    def ewm_mean(block, min_periods, span=None, alpha=None):
+        return pd.DataFrame(block).ewm(span=span, alpha=alpha, min_periods=min_periods,
+                                       adjust=False).mean().to_numpy()
+
+    @staticmethod
+    def round_array(values):
+        return np.round(values, 3)
+
+
+# per-bar intermediates: name -> (dependencies, kernel over the dependency arrays)
+class Intermediates:
+
+    @staticmethod
+    def close_diff(close):
+        diff = np.empty(len(close))
+        diff[:1] = np.nan
+        np.subtract(close[1:], close[:-1], out=diff[1:])
+        return diff
+
+    @staticmethod
+    def up_move(close_diff):
+        return np.where(close_diff > 0, close_diff, 0.0)
+
+    @staticmethod
+    def down_move(close_diff):
+        return -np.where(close_diff < 0, close_diff, 0.0)
+
+    @staticmethod
+    def typical_price(high, low, close):
+        return (high + low + close) / 3.0
+
+    @staticmethod
+    def money_flow(typical_price, volume):
+        up_down = np.zeros(len(typical_price))
+        up_down[1:] = np.where(typical_price[1:] > typical_price[:-1], 1,
+                               np.where(typical_price[1:] < typical_price[:-1], -1, 0))
+        return typical_price * volume * up_down
+
+    @staticmethod
+    def positive_money_flow(money_flow):
+        return np.where(money_flow >= 0.0, money_flow, 0.0)
+
+    @staticmethod
+    def negative_money_flow(money_flow):
+        return np.where(money_flow < 0.0, money_flow, 0.0)
+
+    # the price lines the original keltner channel averages
+    @staticmethod
+    def keltner_high_price(high, low, close):
+        return ((4 * high) - (2 * low) + close) / 3.0
+
+    @staticmethod
+    def keltner_low_price(high, low, close):
+        return ((-2 * high) + (4 * low) + close) / 3.0
+
+    @staticmethod
+    def abs_close_diff(close_diff):
+        return np.abs(close_diff)
+
+    # previous close is NaN on the first bar, where ta's skipna max leaves high - low
+    @staticmethod
+    def true_range(high, low, close):
+        prev_close = np.empty(len(close))
+        prev_close[:1] = np.nan
+        prev_close[1:] = close[:-1]
+        return np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+    # directional movement as ta's ADX takes it, NaN on the first bar
+    @staticmethod
+    def plus_dm(high, low):
+        up, down = Intermediates.directional_moves(high, low)
+        return np.abs(((up > down) & (up > 0)) * up)
+
+    @staticmethod
+    def minus_dm(high, low):
+        up, down = Intermediates.directional_moves(high, low)
+        return np.abs(((down > up) & (down > 0)) * down)
+
+    @staticmethod
+    def directional_moves(high, low):
+        up = np.empty(len(high))
+        down = np.empty(len(low))
+        up[:1] = down[:1] = np.nan
+        np.subtract(high[1:], high[:-1], out=up[1:])
+        np.subtract(low[:-1], low[1:], out=down[1:])
+        return up, down
+
+    @staticmethod
+    def typical_price_volume(typical_price, volume):
+        return typical_price * volume
+
+    SPECS = {"close_diff": (["close"], close_diff.__func__),
+             "up_move": (["close_diff"], up_move.__func__),
+             "down_move": (["close_diff"], down_move.__func__),
+             "typical_price": (["high", "low", "close"], typical_price.__func__),
+             "money_flow": (["typical_price", "volume"], money_flow.__func__),
+             "positive_money_flow": (["money_flow"], positive_money_flow.__func__),
+             "negative_money_flow": (["money_flow"], negative_money_flow.__func__),
+             "keltner_high_price": (["high", "low", "close"], keltner_high_price.__func__),
+             "keltner_low_price": (["high", "low", "close"], keltner_low_price.__func__),
+             "abs_close_diff": (["close_diff"], abs_close_diff.__func__),
+             "true_range": (["high", "low", "close"], true_range.__func__),
+             "plus_dm": (["high", "low"], plus_dm.__func__),
+             "minus_dm": (["high", "low"], minus_dm.__func__),
+             "typical_price_volume": (["typical_price", "volume"], typical_price_volume.__func__)}
+
+
+# per-window intermediates: name -> (input, window op).
+# Inputs sharing a window and a pandas backed op ("sma", "ema", "wilder", "kahan_sum") are stacked into one 2D block, so e.g. the
+# close and volume EMAs of one window come out of a single ewm call.
+class WindowIntermediates:
+    STACKED_OPS = ["sma", "ema", "wilder", "kahan_sum"]
+
+    SPECS = {"close_sma": ("close", "sma"),
+             "close_std": ("close", "std"),
+             "close_ema": ("close", "ema"),
+             "volume_ema": ("volume", "ema"),
+             "up_move_wilder": ("up_move", "wilder"),
+             "down_move_wilder": ("down_move", "wilder"),
+             "positive_money_flow_sum": ("positive_money_flow", "sum"),
+             "negative_money_flow_sum": ("negative_money_flow", "sum"),
+             "high_max": ("high", "max"),
+             "low_min": ("low", "min"),
+             "keltner_high_sma": ("keltner_high_price", "sma"),
+             "keltner_low_sma": ("keltner_low_price", "sma"),
+             "close_diff_ema": ("close_diff", "ema"),
+             "abs_close_diff_ema": ("abs_close_diff", "ema"),
+             "typical_price_volume_sum": ("typical_price_volume", "kahan_sum"),
+             "volume_sum": ("volume", "kahan_sum")}
+
+    @staticmethod
+    def run_stacked(op, block, window):
+        # keltner bands use min_periods=0; bollinger is masked by its min_periods=window std
+        if op == "sma":
+            return WindowKernels.rolling_mean(block, window, 0)
+        if op == "ema":
+            return WindowKernels.ewm_mean(block, window, span=window)
+        if op == "wilder":
+            return WindowKernels.ewm_mean(block, window, alpha=1. / window)
+        if op == "kahan_sum":
+            return WindowKernels.rolling_kahan_sum(block, window)
+        assert False, "Unknown stacked op " + op
+
+    @staticmethod
+    def run_single(op, values, window):
+        if op == "std":
+            return WindowKernels.rolling_std(values, window)
+        if op == "sum":
+            return WindowKernels.rolling_sum(values, window)
+        if op == "max":
+            return WindowKernels.rolling_max(values, window)
+        if op == "min":
+            return WindowKernels.rolling_min(values, window)
+        assert False, "Unknown window op " + op
+
+
+class IndicatorSpec:
+    # config_kind: "bb" ({"window", "window_dev"} configs), "window" ({"window"} configs) or the name of a
+    #   ResolutionRegistry.DEFAULT_CONFIGS entry ("tsi", "macd")
+    # inputs(config) -> {kernel key: (intermediate, window)}, window None for a per-bar intermediate
+    # columns(resolution, config) -> output column names
+    # kernel(values, config) -> unrounded output arrays, one per column
+    # warm_up(config, tolerance) -> bars of history the kernel's own recursion needs, None if it has none
+    def __init__(self, name, config_kind, inputs, columns, kernel, warm_up=None):
+        self.name = name
+        self.config_kind = config_kind
+        self.inputs = inputs
+        self.columns = columns
+        self.kernel = kernel
+        self.warm_up = warm_up
+
+    # inputs of kernels that read window intermediates of the config window under their own name
+    @staticmethod
+    def at_window(*names):
+        return lambda config: {name: (name, config.get("window")) for name in names}
+
+
+class IndicatorKernels:
+
+    @staticmethod
+    def bollinger(values, config):
+        window_dev = config.get("window_dev")
+        # the std is NaN until a full window (min_periods=window), which masks the min_periods=0 mean as well
+        mavg = values["close_sma"]
+        mstd = values["close_std"]
+        return [mavg + window_dev * mstd, mavg - window_dev * mstd]
+
+    @staticmethod
+    def ema(values, config):
+        return [values["close_ema"]]
+
+    @staticmethod
+    def rsi(values, config):
+        emaup = values["up_move_wilder"]
+        emadn = values["down_move_wilder"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return [np.where(emadn == 0, 100, 100 - (100 / (1 + emaup / emadn)))]
+
+    @staticmethod
+    def mfi(values, config):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mfi_ratio = values["positive_money_flow_sum"] / np.abs(values["negative_money_flow_sum"])
+            return [100 - (100 / (1 + mfi_ratio))]
+
+    @staticmethod
+    def donchian(values, config):
+        return [values["high_max"], values["low_min"]]
+
+    @staticmethod
+    def keltner(values, config):
+        return [values["keltner_high_sma"], values["keltner_low_sma"]]
+
+    @staticmethod
+    def volume_ema(values, config):
+        return [values["volume_ema"]]
+
+    # the slow EMAs of the close diff are window intermediates, the fast EMA over them runs here on both in one call
+    @staticmethod
+    def tsi(values, config):
+        window_fast = config.get("window_fast")
+        smoothed = WindowKernels.ewm_mean(np.column_stack([values["diff_ema"], values["abs_diff_ema"]]),
+                                          window_fast, span=window_fast)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return [(smoothed[:, 0] / smoothed[:, 1]) * 100]
+
+    @staticmethod
+    def macd(values, config):
+        window_sign = config.get("window_sign")
+        macd = values["ema_fast"] - values["ema_slow"]
+        macd_signal = WindowKernels.ewm_mean(macd, window_sign, span=window_sign)[:, 0]
+        return [macd, macd_signal, macd - macd_signal]
+
+    # ta's recursion on python floats: seeded with the mean of the first window, zero before it
+    @staticmethod
+    def atr(values, config):
+        window = config.get("window")
+        true_range = values["true_range"]
+        if len(true_range) < window:
+            return [np.full(len(true_range), np.nan)]
+        atr = [0.0] * len(true_range)
+        atr[window - 1] = pd.Series(true_range[0:window]).mean()
+        for i in range(window, len(true_range)):
+            atr[i] = (atr[i - 1] * (window - 1) + true_range[i]) / float(window)
+        return [np.array(atr)]
+
+    # ta's ADX recursions on python floats; adx is zero before two windows, adx_pos/adx_neg before one
+    @staticmethod
+    def adx(values, config):
+        window = config.get("window")
+        size = len(values["true_range"])
+        if size < 2 * window:
+            return [np.full(size, np.nan)] * 3
+        trs = IndicatorKernels.wilder_sum(values["true_range"], window)
+        dip = IndicatorKernels.wilder_sum(values["plus_dm"], window)
+        din = IndicatorKernels.wilder_sum(values["minus_dm"], window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dip_pct = 100 * (dip / trs)
+            din_pct = 100 * (din / trs)
+            directional_index = 100 * np.abs((dip_pct - din_pct) / (dip_pct + din_pct))
+            adx_series = [0.0] * len(trs)
+            adx_series[window] = directional_index[0:window].mean()
+            for i in range(window + 1, len(trs)):
+                adx_series[i] = ((adx_series[i - 1] * (window - 1)) + directional_index[i - 1]) / float(window)
+            adx = np.concatenate((np.zeros(window - 1), adx_series))
+            adx_pos = np.zeros(size)
+            adx_neg = np.zeros(size)
+            adx_pos[window + 1:window + len(trs) - 1] = 100 * (dip[1:-1] / trs[1:-1])
+            adx_neg[window + 1:window + len(trs) - 1] = 100 * (din[1:-1] / trs[1:-1])
+        return [adx, adx_pos, adx_neg]
+
+    # Wilder's running sum as ADX keeps it: len(values) - window + 1 slots, seeded with the sum of bars 1..window,
+    # the last slot stays 0 like ta's
+    @staticmethod
+    def wilder_sum(values, window):
+        result = [0.0] * (len(values) - window + 1)
+        result[0] = pd.Series(values[1:window + 1]).sum()
+        for i in range(1, len(result) - 1):
+            result[i] = result[i - 1] - (result[i - 1] / float(window)) + values[window + i]
+        return np.array(result)
+
+    @staticmethod
+    def vwap(values, config):
+        return [values["typical_price_volume_sum"] / values["volume_sum"]]
+
+
+# bars of warm-up of the recursions run inside the kernels, on top of the window intermediates' own
+class KernelWarmUps:
+
+    @staticmethod
+    def tsi(config, tolerance):
+        window_slow = config.get("window_slow")
+        window_fast = config.get("window_fast")
+        return (window_slow + window_fast + IndicatorPlan.decay_bars(2. / (window_slow + 1), tolerance) +
+                IndicatorPlan.decay_bars(2. / (window_fast + 1), tolerance))
+
+    @staticmethod
+    def macd(config, tolerance):
+        window_slow = config.get("window_slow")
+        window_sign = config.get("window_sign")
+        return (window_slow + window_sign + IndicatorPlan.decay_bars(2. / (window_slow + 1), tolerance) +
+                IndicatorPlan.decay_bars(2. / (window_sign + 1), tolerance))
+
+    @staticmethod
+    def atr(config, tolerance):
+        window = config.get("window")
+        return window + IndicatorPlan.decay_bars(1. / window, tolerance)
+
+    # the smoothed sums and the adx smoothing over them
+    @staticmethod
+    def adx(config, tolerance):
+        window = config.get("window")
+        return 2 * window + 2 * IndicatorPlan.decay_bars(1. / window, tolerance)
+
+
+class IndicatorRegistry:
+    SPECS = {
+        "bollinger": IndicatorSpec(
+            "bollinger", "bb", IndicatorSpec.at_window("close_sma", "close_std"),
+            lambda res, c: [IndicatorDecorator.bollinger_high(res, str(c.get("window")), str(c.get("window_dev"))),
+                            IndicatorDecorator.bollinger_low(res, str(c.get("window")), str(c.get("window_dev")))],
+            IndicatorKernels.bollinger),
+        "ema": IndicatorSpec(
+            "ema", "window", IndicatorSpec.at_window("close_ema"),
+            lambda res, c: [IndicatorDecorator.ema(res, str(c.get("window")))],
+            IndicatorKernels.ema),
+        "rsi": IndicatorSpec(
+            "rsi", "window", IndicatorSpec.at_window("up_move_wilder", "down_move_wilder"),
+            lambda res, c: [IndicatorDecorator.rsi(res, str(c.get("window")))],
+            IndicatorKernels.rsi),
+        "mfi": IndicatorSpec(
+            "mfi", "window", IndicatorSpec.at_window("positive_money_flow_sum", "negative_money_flow_sum"),
+            lambda res, c: [IndicatorDecorator.mfi(res, str(c.get("window")))],
+            IndicatorKernels.mfi),
+        "donchian": IndicatorSpec(
+            "donchian", "window", IndicatorSpec.at_window("high_max", "low_min"),
+            lambda res, c: [IndicatorDecorator.donchian_high(res, str(c.get("window"))),
+                            IndicatorDecorator.donchian_low(res, str(c.get("window")))],
+            IndicatorKernels.donchian),
+        "keltner": IndicatorSpec(
+            "keltner", "window", IndicatorSpec.at_window("keltner_high_sma", "keltner_low_sma"),
+            lambda res, c: [IndicatorDecorator.keltner_high(res, str(c.get("window"))),
+                            IndicatorDecorator.keltner_low(res, str(c.get("window")))],
+            IndicatorKernels.keltner),
+        "volume_ema": IndicatorSpec(
+            "volume_ema", "window", IndicatorSpec.at_window("volume_ema"),
+            lambda res, c: [IndicatorDecorator.volume_ema(res, str(c.get("window")))],
+            IndicatorKernels.volume_ema),
+        "tsi": IndicatorSpec(
+            "tsi", "tsi",
+            lambda c: {"diff_ema": ("close_diff_ema", c.get("window_slow")),
+                       "abs_diff_ema": ("abs_close_diff_ema", c.get("window_slow"))},
+            lambda res, c: [IndicatorDecorator.tsi(res, str(c.get("window_slow")), str(c.get("window_fast")))],
+            IndicatorKernels.tsi, KernelWarmUps.tsi),
+        "atr": IndicatorSpec(
+            "atr", "window", lambda c: {"true_range": ("true_range", None)},
+            lambda res, c: [IndicatorDecorator.atr(res, str(c.get("window")))],
+            IndicatorKernels.atr, KernelWarmUps.atr),
+        "adx": IndicatorSpec(
+            "adx", "window",
+            lambda c: {"true_range": ("true_range", None), "plus_dm": ("plus_dm", None),
+                       "minus_dm": ("minus_dm", None)},
+            lambda res, c: [IndicatorDecorator.adx(res, str(c.get("window"))),
+                            IndicatorDecorator.adx_pos(res, str(c.get("window"))),
+                            IndicatorDecorator.adx_neg(res, str(c.get("window")))],
+            IndicatorKernels.adx, KernelWarmUps.adx),
+        "macd": IndicatorSpec(
+            "macd", "macd",
+            lambda c: {"ema_fast": ("close_ema", c.get("window_fast")),
+                       "ema_slow": ("close_ema", c.get("window_slow"))},
+            lambda res, c: [IndicatorDecorator.macd(res, str(c.get("window_fast")), str(c.get("window_slow")),
+                                                    str(c.get("window_sign"))),
+                            IndicatorDecorator.macd_signal(res, str(c.get("window_fast")), str(c.get("window_slow")),
+                                                           str(c.get("window_sign"))),
+                            IndicatorDecorator.macd_diff(res, str(c.get("window_fast")), str(c.get("window_slow")),
+                                                         str(c.get("window_sign")))],
+            IndicatorKernels.macd, KernelWarmUps.macd),
+        "vwap": IndicatorSpec(
+            "vwap", "window", IndicatorSpec.at_window("typical_price_volume_sum", "volume_sum"),
+            lambda res, c: [IndicatorDecorator.vwap(res, str(c.get("window")))],
+            IndicatorKernels.vwap),
+    }
+
+    # plans are keyed by resolution and config, so every symbol decorated with the same settings shares one
+    plan_cache = {}
+
+    # extra_configs: {config kind: configs} for the kinds other than "bb" and "window", defaulting to the
+    # ResolutionRegistry ones
+    @staticmethod
+    def get_plan(resolution, bb_configs, window_configs, indicators=None, extra_configs=None):
+        if indicators is None:
+            indicators = IndicatorDecorator.INDICATORS
+        configs_by_kind = {"bb": bb_configs, "window": window_configs}
+        for indicator in indicators:
+            assert indicator in IndicatorRegistry.SPECS, "Unknown indicator " + str(indicator)
+            config_kind = IndicatorRegistry.SPECS[indicator].config_kind
+            if config_kind not in configs_by_kind:
+                configs = (extra_configs or {}).get(config_kind)
+                if configs is None:
+                    configs = ResolutionRegistry.get_default_configs(resolution, config_kind)
+                configs_by_kind[config_kind] = configs
+        key = (resolution,
+               tuple((config_kind, tuple(tuple(sorted(config.items())) for config in configs))
+                     for config_kind, configs in sorted(configs_by_kind.items())),
+               tuple(indicators))
+        plan = IndicatorRegistry.plan_cache.get(key)
+        if plan is None:
+            plan = IndicatorPlan(resolution, configs_by_kind, indicators)
+            IndicatorRegistry.plan_cache[key] = plan
+        return plan
+
+    @staticmethod
+    def clear_plan_cache():
+        IndicatorRegistry.plan_cache = {}
+
+
+# Dependency resolved computation plan for one resolution and indicator config.
+# Built once: which per-bar intermediates to derive (in dependency order), which window ops to run per window and
+# which of them share a stacked call, and the output columns. execute() then only runs array kernels.
+class IndicatorPlan:
+    INPUTS = ["high", "low", "close", "volume"]
+    # pandas' rolling mean, std and sum carry running Kahan/Welford sums through the whole history, so their last
+    # bits depend on every earlier bar; a partial execute() still runs them over the full arrays
+    HISTORY_DEPENDENT_OPS = ["sma", "std", "kahan_sum"]
+    # seed weight below machine precision, by then a restarted ewm has converged to the same bits
+    WARM_UP_TOLERANCE = 1e-17
+
+    # configs_by_kind: {config kind: configs}
+    def __init__(self, resolution, configs_by_kind, indicators):
+        self.resolution = resolution
+        # (spec, config, column names, kernel inputs), in output column order
+        self.outputs = []
+        for indicator in indicators:
+            assert indicator in IndicatorRegistry.SPECS, "Unknown indicator " + str(indicator)
+            spec = IndicatorRegistry.SPECS[indicator]
+            for config in configs_by_kind.get(spec.config_kind, []):
+                self.outputs.append((spec, dict(config), spec.columns(resolution, config), spec.inputs(config)))
+
+        # window -> {window intermediate name}; per-bar intermediates read as they are
+        window_needs = {}
+        needed_inputs = []
+        for _, _, _, inputs in self.outputs:
+            for name, window in inputs.values():
+                if window is None:
+                    needed_inputs.append(name)
+                else:
+                    window_needs.setdefault(window, set()).add(name)
+
+        # window -> ([(op, [names])] stacked groups, [names] single ops)
+        self.window_steps = {}
+        for window in sorted(window_needs.keys()):
+            stacked = []
+            for op in WindowIntermediates.STACKED_OPS:
+                names = sorted(name for name in window_needs[window] if WindowIntermediates.SPECS[name][1] == op)
+                if len(names) > 0:
+                    stacked.append((op, names))
+            single = sorted(name for name in window_needs[window]
+                            if WindowIntermediates.SPECS[name][1] not in WindowIntermediates.STACKED_OPS)
+            self.window_steps[window] = (stacked, single)
+            for name in window_needs[window]:
+                needed_inputs.append(WindowIntermediates.SPECS[name][0])
+
+        # per-bar intermediates in dependency order, each computed once
+        self.steps = []
+        for name in sorted(set(needed_inputs)):
+            self.resolve(name)
+
+    def resolve(self, name):
+        if name in IndicatorPlan.INPUTS or name in self.steps:
+            return
+        dependencies, _ = Intermediates.SPECS[name]
+        for dependency in dependencies:
+            self.resolve(dependency)
+        self.steps.append(name)
+
+    # bars until the weight (1 - alpha)^n of a recursion's seed falls below tolerance
+    @staticmethod
+    def decay_bars(alpha, tolerance):
+        if alpha >= 1:
+            return 0
+        return int(math.ceil(math.log(tolerance) / math.log(1 - alpha)))
+
+    # bars of history a tail has to be recomputed with to reproduce the values of a full recompute: every rolling op
+    # needs its window, every ewm op enough bars for its seed to decay below tolerance, and kernels with recursions
+    # of their own (TSI, MACD, ATR, ADX) as many as they declare
+    def get_warm_up_bars(self, tolerance=WARM_UP_TOLERANCE):
+        warm_up = 0
+        for window, (stacked, _) in self.window_steps.items():
+            warm_up = max(warm_up, window)
+            for op, _ in stacked:
+                if op == "ema":
+                    warm_up = max(warm_up, window + IndicatorPlan.decay_bars(2. / (window + 1), tolerance))
+                elif op == "wilder":
+                    warm_up = max(warm_up, window + IndicatorPlan.decay_bars(1. / window, tolerance))
+        for spec, config, _, _ in self.outputs:
+            if spec.warm_up is not None:
+                warm_up = max(warm_up, spec.warm_up(config, tolerance))
+        return warm_up
+
+    def get_columns(self):
+        return [column for _, _, columns, _ in self.outputs for column in columns]
+
+    # returns {column_name: rounded float64 array} for the rows from start on; with start > 0 the history
+    # independent window ops and the kernels only run over the warm-up bars before start
+    def execute(self, high, low, close, volume, start=0):
+        arrays = {"high": high, "low": low, "close": close, "volume": volume}
+        for name in self.steps:
+            dependencies, kernel = Intermediates.SPECS[name]
+            arrays[name] = kernel(*[arrays[dependency] for dependency in dependencies])
+        warm_up_start = max(0, start - self.get_warm_up_bars()) if start > 0 else 0
+
+        # window values from warm_up_start on
+        window_values = {}
+        for window, (stacked, single) in self.window_steps.items():
+            values = {}
+            for op, names in stacked:
+                op_start = 0 if op in IndicatorPlan.HISTORY_DEPENDENT_OPS else warm_up_start
+                block = np.column_stack([arrays[WindowIntermediates.SPECS[name][0]][op_start:] for name in names])
+                result = WindowIntermediates.run_stacked(op, block, window)
+                for i, name in enumerate(names):
+                    values[name] = result[warm_up_start - op_start:, i]
+            for name in single:
+                input_name, op = WindowIntermediates.SPECS[name]
+                op_start = 0 if op in IndicatorPlan.HISTORY_DEPENDENT_OPS else warm_up_start
+                values[name] = WindowIntermediates.run_single(op, arrays[input_name][op_start:],
+                                                              window)[warm_up_start - op_start:]
+            window_values[window] = values
+
+        columns = {}
+        for spec, config, column_names, inputs in self.outputs:
+            values = {}
+            for key, (name, window) in inputs.items():
+                values[key] = arrays[name][warm_up_start:] if window is None else window_values[window][name]
+            results = spec.kernel(values, config)
+            for column_name, result in zip(column_names, results):
+                columns[column_name] = WindowKernels.round_array(result[start - warm_up_start:])
+        return columns
@@ -0,0 +1,131 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from src.statemachine.dataprocessing.FusedIndicatorKernel import FusedIndicatorKernel
+from src.statemachine.dataprocessing.IndicatorDecorator import IndicatorDecorator
+from src.statemachine.dataprocessing.ResolutionAligner import ResolutionAligner
+
+
+# Ships a DataFrame between processes as one shared memory block holding its numeric columns back to back.
+# Only the small layout dict is pickled; the date column travels as int64 epoch nanoseconds and object columns,
+# which can't live in shared memory, are pickled along with the layout.
+class SharedFrameCodec:
+    ALIGNMENT = 8
+
+    @staticmethod
+    def pack(df, date_col="date"):
+        arrays = []
+        for column_name in df.columns:
+            if column_name == date_col:
+                arrays.append((column_name, "date", ResolutionAligner.to_epoch_ns(df[column_name])))
+                continue
+            values = df[column_name].to_numpy()
+            kind = "object" if values.dtype.kind == "O" else "array"
+            arrays.append((column_name, kind, values if kind == "object" else np.ascontiguousarray(values)))
+
+        offset = 0
+        columns = []
+        for column_name, kind, values in arrays:
+            if kind == "object":
+                columns.append((column_name, kind, None, None, values))
+                continue
+            columns.append((column_name, kind, values.dtype.str, offset, None))
+            offset += -(-values.nbytes // SharedFrameCodec.ALIGNMENT) * SharedFrameCodec.ALIGNMENT
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (column_name, kind, values), (_, _, dtype, column_offset, _) in zip(arrays, columns):
+            if kind != "object":
+                np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=column_offset)[:] = values
+        layout = {"name": shm.name, "rows": len(df), "columns": columns}
+        return shm, layout
+
+    # copies the columns out, so the block can be released right after
+    @staticmethod
+    def unpack(layout):
+        shm = shared_memory.SharedMemory(name=layout.get("name"))
+        try:
+            data = {}
+            for column_name, kind, dtype, offset, values in layout.get("columns"):
+                if kind == "object":
+                    data[column_name] = values
+                    continue
+                view = np.ndarray((layout.get("rows"),), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                data[column_name] = view.view("datetime64[ns]").copy() if kind == "date" else view.copy()
+            return pd.DataFrame(data, columns=[column[0] for column in layout.get("columns")])
+        finally:
+            shm.close()
+
+    @staticmethod
+    def release(shm):
+        shm.close()
+        shm.unlink()
+
+    @staticmethod
+    def unlink(layout):
+        SharedFrameCodec.release(shared_memory.SharedMemory(name=layout.get("name")))
+
+
+# Fans decorate_and_merge out over a process pool for a whole watchlist.
+# symbol_frames: {symbol: (df_5min, df_1hour, df_1day)}; results are (symbol, merged df) pairs, yielded as they
+# finish or, with ordered=True, in the order of symbol_frames.
+class ParallelDecorator:
+    def __init__(self, max_workers=None, use_fused_kernel=True):
+        self.max_workers = max_workers
+        self.use_fused_kernel = use_fused_kernel
+
+    def decorate_and_merge_all(self, symbol_frames, ordered=False):
+        executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        futures = {}
+        input_blocks = {}
+        try:
+            for symbol, frames in symbol_frames.items():
+                packed = [SharedFrameCodec.pack(df) for df in frames]
+                input_blocks[symbol] = [shm for shm, _ in packed]
+                future = executor.submit(ParallelDecorator.decorate_packed, [layout for _, layout in packed],
+                                         self.use_fused_kernel)
+                futures[future] = symbol
+
+            finished = list(futures.keys()) if ordered else as_completed(futures)
+            for future in finished:
+                symbol = futures.pop(future)
+                # in ordered mode the worker may not have attached to its input blocks yet
+                try:
+                    layout = future.result()
+                finally:
+                    for shm in input_blocks.pop(symbol):
+                        SharedFrameCodec.release(shm)
+                try:
+                    merged = SharedFrameCodec.unpack(layout)
+                finally:
+                    SharedFrameCodec.unlink(layout)
+                yield symbol, merged
+        finally:
+            # the consumer stopped early or a worker failed: drop what is queued, then free every block left
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for future in futures:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    SharedFrameCodec.unlink(future.result())
+            for blocks in input_blocks.values():
+                for shm in blocks:
+                    SharedFrameCodec.release(shm)
+
+    # {symbol: merged df}, in the order of symbol_frames
+    def decorate_and_merge_dict(self, symbol_frames):
+        return dict(self.decorate_and_merge_all(symbol_frames, ordered=True))
+
+    # runs in the worker: unpack the three frames, decorate and merge, pack the result for the parent to unlink
+    @staticmethod
+    def decorate_packed(layouts, use_fused_kernel):
+        df_5min, df_1hour, df_1day = [SharedFrameCodec.unpack(layout) for layout in layouts]
+        if use_fused_kernel:
+            merged = FusedIndicatorKernel.decorate_and_merge(df_5min, df_1hour, df_1day)
+        else:
+            merged = IndicatorDecorator.decorate_and_merge(df_5min, df_1hour, df_1day)
+        shm, layout = SharedFrameCodec.pack(merged)
+        shm.close()
+        return layout
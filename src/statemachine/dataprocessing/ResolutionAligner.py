@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+
+class AlignModes:
+    # pd.merge_asof, materializes the widened frame
+    MERGE = "merge"
+    # np.searchsorted row indices, higher resolution columns are gathered on access
+    INDEX = "index"
+
+
+# Lazily merged view of frames of different resolutions.
+# The rows are the rows of the base (finest resolution) frame; every column maps to its source frame plus the row
+# indices to gather from it (-1 for rows without an earlier match, as merge_asof leaves them NaN). Nothing is
+# copied until a column is read, and each gathered column is cached. Dates of a tz-aware base frame come back in
+# its tz, like merge_asof keeps them.
+class AlignedFrame:
+    def __init__(self, epoch, column_sources, date_col="date", tz=None):
+        self.epoch = epoch
+        self.date_col = date_col
+        self.tz = tz
+        # column name -> (source df, source column name, row indices or None for the base frame itself)
+        self.column_sources = column_sources
+        self.cache = {}
+
+    @staticmethod
+    def from_df(df, date_col="date"):
+        epoch, tz = ResolutionAligner.to_epoch_ns_and_tz(df[date_col])
+        column_sources = {date_col: (None, date_col, None)}
+        for column in df.columns:
+            if column != date_col:
+                column_sources[column] = (df, column, None)
+        return AlignedFrame(epoch, column_sources, date_col, tz)
+
+    @property
+    def columns(self):
+        return list(self.column_sources.keys())
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def __contains__(self, column):
+        return column in self.column_sources
+
+    def __getitem__(self, column):
+        if isinstance(column, list):
+            return self.to_df(column)
+        return pd.Series(self.get_values(column), name=column)
+
+    def get_epoch(self):
+        return self.epoch
+
+    def get_values(self, column):
+        if column in self.cache:
+            return self.cache[column]
+        source_df, source_column, row_idx = self.column_sources[column]
+        if source_df is None:
+            values = ResolutionAligner.from_epoch_ns(self.epoch, self.tz)
+        elif row_idx is None:
+            values = source_df[source_column].to_numpy()
+        else:
+            values = ResolutionAligner.gather(source_df[source_column].to_numpy(), row_idx)
+        self.cache[column] = values
+        return values
+
+    def get_row_indices(self, column):
+        return self.column_sources[column][2]
+
+    # materialize only the requested columns (all of them by default)
+    def to_df(self, columns=None):
+        if columns is None:
+            columns = self.columns
+        return pd.DataFrame({column: self.get_values(column) for column in columns}, columns=columns)
+
+
+class ResolutionAligner:
+
+    # parse the dates once; every later as-of lookup works on the int64 epoch nanoseconds (UTC for tz-aware dates)
+    @staticmethod
+    def to_epoch_ns(dates):
+        return ResolutionAligner.to_epoch_ns_and_tz(dates)[0]
+
+    # (epoch nanoseconds, tz of the dates or None)
+    @staticmethod
+    def to_epoch_ns_and_tz(dates):
+        dates = pd.to_datetime(dates)
+        return dates.to_numpy(dtype="datetime64[ns]").view(np.int64), getattr(dates.dtype, "tz", None)
+
+    # datetime64 values of epoch nanoseconds, in tz if given
+    @staticmethod
+    def from_epoch_ns(epoch, tz=None):
+        values = epoch.view("datetime64[ns]")
+        if tz is None:
+            return values
+        return pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(tz).array
+
+    # index of the last right row with date <= left date, -1 if there is none (merge_asof direction="backward")
+    @staticmethod
+    def asof_indices(left_epoch, right_epoch):
+        assert np.all(right_epoch[1:] >= right_epoch[:-1]), "right dates must be sorted"
+        return np.searchsorted(right_epoch, left_epoch, side="right") - 1
+
+    @staticmethod
+    def gather(values, row_idx):
+        missing = row_idx < 0
+        if not missing.any():
+            return values.take(row_idx)
+        if values.dtype.kind in "iub":
+            values = values.astype(np.float64)
+        gathered = values.take(np.where(missing, 0, row_idx))
+        if gathered.dtype.kind == "M":
+            gathered[missing] = np.datetime64("NaT")
+        else:
+            gathered[missing] = np.nan
+        return gathered
+
+    # asof join of two aligned frames, mirroring pd.merge_asof(left, right, on=date_col) including the _x/_y
+    # suffixes of overlapping column names
+    @staticmethod
+    def asof_join(left, right):
+        join_idx = ResolutionAligner.asof_indices(left.get_epoch(), right.get_epoch())
+        overlap = set(left.columns) & set(right.columns) - {left.date_col}
+
+        column_sources = {}
+        for column, source in left.column_sources.items():
+            column_sources[column + "_x" if column in overlap else column] = source
+        for column, (source_df, source_column, row_idx) in right.column_sources.items():
+            # the right frame's own dates are not part of the merge_asof output
+            if column == right.date_col:
+                continue
+            if row_idx is None:
+                composed_idx = join_idx
+            else:
+                composed_idx = np.where(join_idx >= 0, row_idx.take(np.maximum(join_idx, 0)), -1)
+            column_sources[column + "_y" if column in overlap else column] = (source_df, source_column, composed_idx)
+        return AlignedFrame(left.get_epoch(), column_sources, left.date_col, left.tz)
+
+    # index based counterpart of the two merge_two_df_based_on_date calls in decorate_and_merge
+    @staticmethod
+    def align_decorated(df_5min_decorated, df_1hour_decorated, df_1day_decorated):
+        aligned_1hour = ResolutionAligner.asof_join(AlignedFrame.from_df(df_1hour_decorated),
+                                                    AlignedFrame.from_df(df_1day_decorated))
+        return ResolutionAligner.asof_join(AlignedFrame.from_df(df_5min_decorated), aligned_1hour)
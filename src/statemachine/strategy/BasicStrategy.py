@@ -2,7 +2,10 @@ from src.statemachine.strategy.TrendAnalyzer import *
 from src.statemachine.strategy.Trend import *
 from src.statemachine.strategy.TrendSeqGenerator import *
 from src.statemachine.strategy.TrendWave import *
+from src.statemachine.strategy.TrendWaveTable import TrendWaveTable
 from src.statemachine.strategy.TrendSummary import *
+from datetime import date
+
 import numpy as np
 
 
@@ -115,16 +118,84 @@ class BasicStrategy:
 
     # if we get an unclear trend, we want to find the last clear trend; missing signals after a strong signal is
     # detected also provides information. Return the trend summary dictionary, and the date
+    # Each uncertain cut-off moves the cut-off one day back. The trend waves are built once over the rows before the
+    # first cut-off and every earlier cut-off reads them as a prefix, instead of re-filtering and rebuilding them
     @staticmethod
     def find_last_certain_trend_signal(df, cut_off_date_string):
         if len(df) < 15:
             return {}
         df_filtered = df[(df['date'] < cut_off_date_string)]
-        _, sigma_trend_wave_tail = TrendAnalyzer.convert_weighted_trend_list_to_trendwaves(
-            df_filtered["rectified_weighted_trend"].values.tolist(), df_filtered["date"].values.tolist())
-        _, ema_trend_wave_tail = TrendAnalyzer.convert_weighted_trend_list_to_trendwaves(
-            df_filtered["ema_diff"].values.tolist(), df_filtered["date"].values.tolist())
+        if not df_filtered['date'].is_monotonic_increasing:
+            return BasicStrategy.find_last_certain_trend_signal_by_refiltering(df_filtered, cut_off_date_string)
+
+        date_list, day_ordinals, sigma_trend_wave_table, ema_trend_wave_table = \
+            BasicStrategy.get_trend_wave_tables(df_filtered)
+        return BasicStrategy.search_certain_trend_signal(sigma_trend_wave_table, ema_trend_wave_table, date_list,
+                                                         day_ordinals, len(df_filtered), cut_off_date_string)
 
+    # dates, day ordinals and the sigma and ema TrendWaveTables (with history) of a date sorted trend df; the trend
+    # waves carry day ordinals, so the dates are parsed once here rather than on every comparison
+    @staticmethod
+    def get_trend_wave_tables(df):
+        date_list = df["date"].to_numpy()
+        day_ordinals = TrendAnalyzer.to_day_ordinals(df["date"])
+        sigma_trend_wave_table = TrendWaveTable.build(df["rectified_weighted_trend"].values.tolist(), day_ordinals,
+                                                      keep_history=True)
+        ema_trend_wave_table = TrendWaveTable.build(df["ema_diff"].values.tolist(), day_ordinals, keep_history=True)
+        return date_list, day_ordinals, sigma_trend_wave_table, ema_trend_wave_table
+
+    # the backward search of find_last_certain_trend_signal over the first row_count rows of the tables, the rows
+    # before cut_off_date_string. trend_summary_cache ({row count: trend summary}) lets searches over the same tables
+    # share the summaries of the prefixes they both visit
+    @staticmethod
+    def search_certain_trend_signal(sigma_trend_wave_table, ema_trend_wave_table, date_list, day_ordinals, row_count,
+                                    cut_off_date_string, trend_summary_cache=None):
+        while True:
+            if trend_summary_cache is not None and row_count in trend_summary_cache:
+                trend_summary = dict(trend_summary_cache[row_count])
+            else:
+                trend_summary = BasicStrategy.get_trend_summary(
+                    sigma_trend_wave_table.get_prefix(row_count).get_tail(),
+                    ema_trend_wave_table.get_prefix(row_count).get_tail())
+                if trend_summary_cache is not None:
+                    trend_summary_cache[row_count] = dict(trend_summary)
+            if trend_summary["trend"] != BasicStrategy.UNCERTAIN:
+                trend_summary["date"] = cut_off_date_string
+                return trend_summary
+            if row_count < 15:
+                return {}
+            cut_off_date_string = TrendSummary.days_ago(cut_off_date_string, 1).strftime("%Y-%m-%d")
+            # no row drops out before the cut-off reaches the day of the last row, and the same rows give the same
+            # uncertain summary, so skip to that day
+            last_day = str(date_list[row_count - 1]).split(" ")[0]
+            if cut_off_date_string > last_day and \
+                    date.fromordinal(day_ordinals[row_count - 1]).strftime("%Y-%m-%d") == last_day:
+                cut_off_date_string = last_day
+            row_count = int(np.searchsorted(date_list[:row_count], cut_off_date_string, side="left"))
+            # same as the trend waves of no rows
+            assert row_count > 0
+
+    # find_last_certain_trend_signal for dates out of order, where the rows before a cut-off are not a prefix
+    @staticmethod
+    def find_last_certain_trend_signal_by_refiltering(df, cut_off_date_string):
+        while len(df) >= 15:
+            df_filtered = df[(df['date'] < cut_off_date_string)]
+            day_ordinals = TrendAnalyzer.to_day_ordinals(df_filtered["date"])
+            _, sigma_trend_wave_tail = TrendAnalyzer.convert_weighted_trend_list_to_trendwaves(
+                df_filtered["rectified_weighted_trend"].values.tolist(), day_ordinals)
+            _, ema_trend_wave_tail = TrendAnalyzer.convert_weighted_trend_list_to_trendwaves(
+                df_filtered["ema_diff"].values.tolist(), day_ordinals)
+            trend_summary = BasicStrategy.get_trend_summary(sigma_trend_wave_tail, ema_trend_wave_tail)
+            if trend_summary["trend"] != BasicStrategy.UNCERTAIN:
+                trend_summary["date"] = cut_off_date_string
+                return trend_summary
+            df = df_filtered
+            cut_off_date_string = TrendSummary.days_ago(cut_off_date_string, 1).strftime("%Y-%m-%d")
+        return {}
+
+    # reconciled trend summary of the sigma and ema trend waves up to the given tails
+    @staticmethod
+    def get_trend_summary(sigma_trend_wave_tail, ema_trend_wave_tail):
         sigma_positive_trend_list, sigma_negative_trend_list = TrendAnalyzer.analyze_occurrence_constraint_trend(
             sigma_trend_wave_tail, 50, 0.1)
         ema_positive_trend_list, ema_negative_trend_list = TrendAnalyzer.analyze_occurrence_constraint_trend(
@@ -136,15 +207,7 @@ class BasicStrategy:
         res_sigma = TrendSummary.get_trend_insight_from_past_n_days(sigma_positive_trend_list,
                                                                     sigma_negative_trend_list)
 
-        trend_summary = BasicStrategy.reconcile_ema_and_sigma_trend_segment_results(res_sigma, res_ema)
-
-        if trend_summary["trend"] == BasicStrategy.UNCERTAIN:
-            date_string = TrendSummary.days_ago(cut_off_date_string, 1).strftime("%Y-%m-%d")
-            return BasicStrategy.find_last_certain_trend_signal(df_filtered, date_string)
-
-        trend_summary["date"] = cut_off_date_string
-        return trend_summary
-
+        return BasicStrategy.reconcile_ema_and_sigma_trend_segment_results(res_sigma, res_ema)
 
     @staticmethod
     def strategize(preprocessed_df, one_day_price_df, days_from_today=10):
@@ -155,11 +218,16 @@ class BasicStrategy:
         if len(date_list) < 2:
             return 0
 
+        trend_summary = BasicStrategy.find_last_certain_trend_signal(preprocessed_df, date_list[-1])
+        return BasicStrategy.strategize_with_trend_summary(current_price_list, current_volume_list, trend_summary,
+                                                           days_from_today)
+
+    # strategize once the trend summary of the last date is known
+    @staticmethod
+    def strategize_with_trend_summary(current_price_list, current_volume_list, trend_summary, days_from_today=10):
         weighted_price_avg = BasicStrategy.volume_weighted_avg(current_price_list[-days_from_today:],
                                                                current_volume_list[-days_from_today:])
 
-        trend_summary = BasicStrategy.find_last_certain_trend_signal(preprocessed_df, date_list[-1])
-
         if len(trend_summary) == 0 or len(trend_summary.keys()) == 0:
             return 1.1 * weighted_price_avg
 
@@ -190,17 +258,24 @@ class BasicStrategy:
             print("no enough data points for analysis")
             return 0
 
+        trend_summary = BasicStrategy.find_last_certain_trend_signal(preprocessed_df, date_list[-1])
+        return BasicStrategy.strategize_2_with_trend_summary(current_price_list, current_volume_list, date_list,
+                                                             trend_summary, days_from_today, mark_up_factor)
+
+    # strategize_2 once the trend summary of the last date is known; verbose prints the reasoning
+    @staticmethod
+    def strategize_2_with_trend_summary(current_price_list, current_volume_list, date_list, trend_summary,
+                                        days_from_today=10, mark_up_factor=0.05, verbose=True):
         weighted_price_avg = BasicStrategy.volume_weighted_avg(current_price_list[-days_from_today:],
                                                                current_volume_list[-days_from_today:])
 
-        trend_summary = BasicStrategy.find_last_certain_trend_signal(preprocessed_df, date_list[-1])
-
         polynomial_price_prediction = BasicStrategy.polynomial_prediction(current_price_list[-days_from_today:], days_from_today)
         linear_price_prediction = BasicStrategy.linear_prediction(current_price_list[-days_from_today:], days_from_today)
         weighted_prediction_price = (weighted_price_avg + polynomial_price_prediction + linear_price_prediction)/3
 
         if len(trend_summary.keys()) == 0:
-            print("no strong signal in the past; Use weighted price avg as a prediction")
+            if verbose:
+                print("no strong signal in the past; Use weighted price avg as a prediction")
             return (1 + mark_up_factor) * weighted_price_avg
 
         trend_end_date = trend_summary["date"]
@@ -213,12 +288,14 @@ class BasicStrategy:
                                     polynomial_price_prediction,
                                     linear_price_prediction,
                                     weighted_prediction_price])
-        print("weighted_price_avg: " + str(weighted_price_avg) + " poly: " + str(polynomial_price_prediction) +
-              " linear: " + str(linear_price_prediction) + " avg_prediction: " + str(weighted_prediction_price))
+        if verbose:
+            print("weighted_price_avg: " + str(weighted_price_avg) + " poly: " + str(polynomial_price_prediction) +
+                  " linear: " + str(linear_price_prediction) + " avg_prediction: " + str(weighted_prediction_price))
 
         if trend_summary["trend"] != BasicStrategy.UNCERTAIN:
             if days_diff <= days_from_today:
-                print("found a clear trend signal in the past recent days")
+                if verbose:
+                    print("found a clear trend signal in the past recent days")
                 if trend_summary["trend"] == BasicStrategy.UPTREND and trend_summary["momentum"] == BasicStrategy.INCREASING:
                     # 1.15 * current_price < prediction_price < 1.3 * current_price
                     return max(min(1.3 * current_price_list[-1], sorted_price_list[-2]), 1.15 * current_price_list[-1])
@@ -232,7 +309,8 @@ class BasicStrategy:
                 elif trend_summary["trend"] == BasicStrategy.DOWNTREND:
                     return min(max(0.9 * current_price_list[-1], sorted_price_list[1]), 1.1 * current_price_list[-1])
             else:
-                print("last clear trend signal is a while ago. We need to analyze the price action during the absence of the signal")
+                if verbose:
+                    print("last clear trend signal is a while ago. We need to analyze the price action during the absence of the signal")
                 if trend_summary["trend"] == UPTREND:
                     # could be signalling a trend reversal. so 0.9 * current_price < prediction_price < 1.15 * current_price
                     if current_price_list[-1] <= price_at_the_last_trend_signal or weighted_price_avg <= price_at_the_last_trend_signal:
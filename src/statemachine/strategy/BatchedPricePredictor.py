@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+
+# BasicStrategy.linear_prediction, polynomial_prediction and volume_weighted_avg for many symbols at once, over a
+# (symbols x window_size) matrix of their last window_size prices. The least squares fit of a window and its value
+# days_from_today after the last price are linear in the prices, and the design matrix is the same for every
+# symbol, so each forecast is one dot product with weights computed once from the pseudo-inverse of the
+# Vandermonde matrix. The forecasts agree with np.polyfit up to rounding (~1e-12 relative), not bit for bit.
+class BatchedPricePredictor:
+    def __init__(self, window_size=10, days_from_today=10):
+        assert window_size >= 3, "The quadratic fit needs at least 3 prices"
+        self.window_size = window_size
+        self.days_from_today = days_from_today
+        # columns: linear and quadratic forecast weights
+        self.forecast_weights = np.column_stack([
+            BatchedPricePredictor.get_forecast_weights(window_size, days_from_today, 1),
+            BatchedPricePredictor.get_forecast_weights(window_size, days_from_today, 2)])
+
+    # (linear forecasts, quadratic forecasts) of every row of price_matrix
+    def predict(self, price_matrix):
+        price_matrix = np.asarray(price_matrix, dtype=np.float64)
+        assert price_matrix.ndim == 2 and price_matrix.shape[1] == self.window_size, \
+            "Expected a (symbols x " + str(self.window_size) + ") price matrix"
+        forecasts = price_matrix @ self.forecast_weights
+        return forecasts[:, 0], forecasts[:, 1]
+
+    # {symbol: one_day_price_df} -> df indexed by symbol with the price predictions of strategize_2; symbols with
+    # fewer than window_size prices get NaN
+    def predict_symbols(self, symbol_frames):
+        symbols = list(symbol_frames.keys())
+        price_matrix = BatchedPricePredictor.stack_windows(
+            [symbol_frames[symbol]["close"].to_numpy() for symbol in symbols], self.window_size)
+        volume_matrix = BatchedPricePredictor.stack_windows(
+            [symbol_frames[symbol]["volume"].to_numpy() for symbol in symbols], self.window_size)
+        linear_price_prediction, polynomial_price_prediction = self.predict(price_matrix)
+        weighted_price_avg = BatchedPricePredictor.volume_weighted_avg(price_matrix, volume_matrix)
+        return pd.DataFrame({"weighted_price_avg": weighted_price_avg,
+                             "polynomial_price_prediction": polynomial_price_prediction,
+                             "linear_price_prediction": linear_price_prediction,
+                             "weighted_prediction_price": (weighted_price_avg + polynomial_price_prediction +
+                                                           linear_price_prediction) / 3},
+                            index=pd.Index(symbols, name="symbol"))
+
+    # weights w such that prices @ w is the degree `degree` least squares fit of prices over x = 0..window_size-1,
+    # evaluated at x = window_size - 1 + days_from_today
+    @staticmethod
+    def get_forecast_weights(window_size, days_from_today, degree):
+        # centered x keeps the Vandermonde matrix well conditioned; the fit and its forecast don't change
+        center = (window_size - 1) / 2.
+        x = np.arange(window_size, dtype=np.float64) - center
+        vandermonde = np.vander(x, degree + 1)
+        forecast_powers = np.vander(np.array([window_size - 1 + days_from_today - center]), degree + 1)[0]
+        return forecast_powers @ np.linalg.pinv(vandermonde)
+
+    # volume_weighted_avg of every row; rows with no volume fall back to the sum of their prices like it does
+    @staticmethod
+    def volume_weighted_avg(price_matrix, volume_matrix):
+        price_matrix = np.asarray(price_matrix, dtype=np.float64)
+        volume_matrix = np.asarray(volume_matrix, dtype=np.float64)
+        assert price_matrix.shape == volume_matrix.shape
+        volume_sum = volume_matrix.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(volume_sum == 0, price_matrix.sum(axis=1),
+                            (price_matrix * volume_matrix).sum(axis=1) / volume_sum)
+
+    # last window_size values of each sequence as the rows of a matrix, NaN rows for the shorter ones
+    @staticmethod
+    def stack_windows(sequences, window_size):
+        matrix = np.full((len(sequences), window_size), np.nan)
+        for row, sequence in enumerate(sequences):
+            if len(sequence) >= window_size:
+                matrix[row] = np.asarray(sequence[len(sequence) - window_size:], dtype=np.float64)
+        return matrix
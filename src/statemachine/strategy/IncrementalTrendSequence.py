@@ -0,0 +1,62 @@
+from collections import deque
+from itertools import islice
+
+from src.statemachine.strategy.TrendSeqGenerator import TrendSeqGenerator
+
+
+# Streaming counterpart of the rolling columns of TrendSeqGenerator.generate_trend_sequence: one deduped hour in,
+# its avg_trend, noise_reduced_weighted_trend and rectified_weighted_trend out, identical to the batch values.
+# Keeps only the last lookback_window_size hours; each window is summed left to right like the batch sums.
+# The noise reduced trend is an input: reduce_level2_signal_noise looks at the whole sequence, so the caller decides
+# when to rerun it.
+class IncrementalTrendSequence:
+    def __init__(self, lookback_window_size):
+        self.lookback_window_size = lookback_window_size
+        self.window_size = float(lookback_window_size)
+        self.trend_signals = deque(maxlen=lookback_window_size)
+        self.weighted_rectifying_trends = deque(maxlen=lookback_window_size)
+        self.weighted_noise_reduced_trends = deque(maxlen=lookback_window_size)
+        self.hour_count = 0
+        self.latest_values = {}
+
+    def update(self, trend_signal, signal_rectifying_trend, noise_reduced_trend):
+        trend_signal = float(trend_signal)
+        self.trend_signals.append(trend_signal)
+        self.weighted_rectifying_trends.append(float(signal_rectifying_trend) * abs(trend_signal))
+        self.weighted_noise_reduced_trends.append(float(noise_reduced_trend) * abs(trend_signal))
+        self.hour_count += 1
+
+        values = {TrendSeqGenerator.AVG_TREND_COL: 0.,
+                  TrendSeqGenerator.NOISE_REDUCED_WEIGHTED_TREND_COL: 0.,
+                  TrendSeqGenerator.RECTIFIED_WEIGHTED_TREND_COL: 0.}
+        if self.hour_count >= self.lookback_window_size:
+            # the weighted trends leave out the current hour
+            previous_hours = self.lookback_window_size - 1
+            values[TrendSeqGenerator.AVG_TREND_COL] = \
+                IncrementalTrendSequence.sum_window(self.trend_signals, self.lookback_window_size) / self.window_size
+            values[TrendSeqGenerator.NOISE_REDUCED_WEIGHTED_TREND_COL] = IncrementalTrendSequence.sum_window(
+                self.weighted_noise_reduced_trends, previous_hours) / self.window_size
+            values[TrendSeqGenerator.RECTIFIED_WEIGHTED_TREND_COL] = IncrementalTrendSequence.sum_window(
+                self.weighted_rectifying_trends, previous_hours) / self.window_size
+        self.latest_values = values
+        return values
+
+    # replay the deduped hours of generate_trend_sequence so that the next update() continues after them
+    def warm_up(self, df_deduped, trend_signal_col, signal_rectifying_trend_col,
+                noise_reduced_trend_col="noise_reduced_trend"):
+        columns = [trend_signal_col, signal_rectifying_trend_col, noise_reduced_trend_col]
+        for trend_signal, signal_rectifying_trend, noise_reduced_trend in df_deduped[columns].itertuples(
+                index=False, name=None):
+            self.update(trend_signal, signal_rectifying_trend, noise_reduced_trend)
+        return self.latest_values
+
+    def get_latest_values(self):
+        return self.latest_values
+
+    # first terms of the window, summed from 0. left to right
+    @staticmethod
+    def sum_window(window, terms):
+        window_sum = 0.
+        for value in islice(window, 0, terms):
+            window_sum += value
+        return window_sum
@@ -0,0 +1,44 @@
+import numpy as np
+
+
+# Sparse table over a fixed sequence for O(1) range max/min queries after an O(n log n) build.
+# Queries return the index of the first occurrence of the extreme, like list.index(max(window)) does.
+class RangeExtremeTable:
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.max_levels = RangeExtremeTable.build(self.values, np.greater)
+        self.min_levels = RangeExtremeTable.build(self.values, np.less)
+
+    # levels[k][i]: index of the first extreme within values[i:i + 2^k]
+    @staticmethod
+    def build(values, is_better):
+        levels = [np.arange(len(values))]
+        # the extreme values of the last level, so building a level only compares two shifted arrays
+        extremes = values
+        span = 1
+        while 2 * span <= len(values):
+            left = extremes[:len(extremes) - span]
+            right = extremes[span:]
+            # ties keep the left index, which is always the earlier one
+            take_right = is_better(right, left)
+            levels.append(np.where(take_right, levels[-1][span:], levels[-1][:len(extremes) - span]))
+            extremes = np.where(take_right, right, left)
+            span *= 2
+        return levels
+
+    # index of the first max of values[start:end]
+    def argmax(self, start, end):
+        left, right = RangeExtremeTable.query(self.max_levels, start, end)
+        return right if self.values[right] > self.values[left] else left
+
+    # index of the first min of values[start:end]
+    def argmin(self, start, end):
+        left, right = RangeExtremeTable.query(self.min_levels, start, end)
+        return right if self.values[right] < self.values[left] else left
+
+    # the two overlapping power of two blocks covering [start, end); on a tie the left one holds the first index
+    @staticmethod
+    def query(levels, start, end):
+        assert end > start, "Empty range"
+        level = (end - start).bit_length() - 1
+        return int(levels[level][start]), int(levels[level][end - (1 << level)])
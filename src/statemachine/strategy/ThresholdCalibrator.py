@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.statemachine.strategy.TrendSeqGenerator import TrendSeqGenerator
+
+
+# Result of calibrating the level2 signal threshold of one symbol. Per threshold of the grid:
+#   density         share of rows with a non zero rectified signal
+#   positive_ratio  share of positive signals among them (NaN if there are none)
+# target_positive_ratio is the share of up closes of the stock itself, the ratio the signal should come closest to.
+class ThresholdCalibration:
+    def __init__(self, symbol, thresholds, density, positive_ratio, target_positive_ratio, best_index):
+        self.symbol = symbol
+        self.thresholds = thresholds
+        self.density = density
+        self.positive_ratio = positive_ratio
+        self.target_positive_ratio = target_positive_ratio
+        self.best_index = best_index
+
+    def get_best_threshold(self):
+        if self.best_index is None:
+            return None
+        return self.thresholds[self.best_index]
+
+    def to_df(self):
+        return pd.DataFrame({"threshold": self.thresholds,
+                             "density": self.density,
+                             "positive_ratio": self.positive_ratio,
+                             "ratio_error": np.abs(self.positive_ratio - self.target_positive_ratio)})
+
+
+# Sweeps a grid of generate_level2_signal thresholds in one pass per symbol: the parts of the signal that don't
+# depend on the threshold (abs(uptrend) - abs(downtrend), volume / volume_ema and the rectified bucket of either
+# sign) are computed once, and the signal signs of all thresholds come out of one (thresholds x rows) comparison.
+# The best threshold is the one whose positive ratio is closest to the stock's share of up closes, among the
+# thresholds with a density within [min_density, max_density] (all of them if none is).
+class ThresholdCalibrator:
+    # the 1day_close/x for x in range(5, 55, 5) of the TrendSeqGenerator notes, as a share of the price
+    DEFAULT_THRESHOLDS = [1. / x for x in range(5, 55, 5)]
+
+    def __init__(self, one_day_high_col, one_day_low_col, one_day_close_col, one_day_volume_col, volume_ema_col,
+                 bb_high_col, bb_low_col, thresholds=None, min_density=0., max_density=1., max_workers=None):
+        self.columns = [one_day_high_col, one_day_low_col, one_day_close_col, one_day_volume_col, volume_ema_col,
+                        bb_high_col, bb_low_col]
+        if thresholds is None:
+            thresholds = ThresholdCalibrator.DEFAULT_THRESHOLDS
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.min_density = min_density
+        self.max_density = max_density
+        self.max_workers = max_workers
+
+    def calibrate(self, df, symbol=None):
+        return ThresholdCalibrator.calibrate_arrays(symbol, self.get_arrays(df), self.thresholds, self.min_density,
+                                                    self.max_density)
+
+    # {symbol: df} -> {symbol: ThresholdCalibration}, symbols spread over a process pool
+    def calibrate_all(self, symbol_frames):
+        symbols = list(symbol_frames.keys())
+        arrays = [self.get_arrays(symbol_frames[symbol]) for symbol in symbols]
+        if len(symbols) <= 1 or self.max_workers == 1:
+            results = [ThresholdCalibrator.calibrate_arrays(symbol, symbol_arrays, self.thresholds, self.min_density,
+                                                            self.max_density)
+                       for symbol, symbol_arrays in zip(symbols, arrays)]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                count = len(symbols)
+                results = list(executor.map(ThresholdCalibrator.calibrate_arrays, symbols, arrays,
+                                            [self.thresholds] * count, [self.min_density] * count,
+                                            [self.max_density] * count))
+        return dict(zip(symbols, results))
+
+    # {symbol: best threshold}
+    def get_best_thresholds(self, symbol_frames):
+        return {symbol: calibration.get_best_threshold()
+                for symbol, calibration in self.calibrate_all(symbol_frames).items()}
+
+    def get_arrays(self, df):
+        return [df[column_name].to_numpy(dtype=np.float64) for column_name in self.columns]
+
+    @staticmethod
+    def calibrate_arrays(symbol, arrays, thresholds, min_density, max_density):
+        high, low, close, volume, volume_ema, bb_high, bb_low = arrays
+        density, positive_ratio = ThresholdCalibrator.sweep(high, low, volume, volume_ema, bb_high, bb_low,
+                                                            thresholds)
+        target_positive_ratio = ThresholdCalibrator.get_positive_close_ratio(close)
+        best_index = ThresholdCalibrator.pick_best(density, positive_ratio, target_positive_ratio, min_density,
+                                                   max_density)
+        return ThresholdCalibration(symbol, thresholds.tolist(), density, positive_ratio, target_positive_ratio,
+                                    best_index)
+
+    # (density, positive_ratio) per threshold, as generate_level2_signal would produce them one threshold at a time
+    @staticmethod
+    def sweep(high, low, volume, volume_ema, bb_high, bb_low, thresholds):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            abs_diff = np.abs(high - bb_low) - np.abs(low - bb_high)
+            ratio = volume / volume_ema
+        # rectified bucket of the signal if it turns out positive (ratio) or negative (-ratio)
+        positive_bucket = np.empty(len(ratio), dtype=np.int64)
+        negative_bucket = np.empty(len(ratio), dtype=np.int64)
+        mask = np.empty(len(ratio), dtype=bool)
+        TrendSeqGenerator.rectify_level2_signal(ratio, positive_bucket, mask)
+        TrendSeqGenerator.rectify_level2_signal(-ratio, negative_bucket, mask)
+
+        # thresholds x rows
+        price_thresholds = thresholds[:, None] * high[None, :]
+        is_up = abs_diff[None, :] > price_thresholds
+        is_down = abs_diff[None, :] < price_thresholds
+        positive = (is_up & (positive_bucket > 0)).sum(axis=1) + (is_down & (negative_bucket > 0)).sum(axis=1)
+        negative = (is_up & (positive_bucket < 0)).sum(axis=1) + (is_down & (negative_bucket < 0)).sum(axis=1)
+
+        signal_count = positive + negative
+        density = signal_count / float(max(len(high), 1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            positive_ratio = np.where(signal_count > 0, positive / signal_count, np.nan)
+        return density, positive_ratio
+
+    # share of up closes among the closes that moved
+    @staticmethod
+    def get_positive_close_ratio(close):
+        close_diff = np.diff(close)
+        moved = np.count_nonzero(close_diff > 0) + np.count_nonzero(close_diff < 0)
+        if moved == 0:
+            return np.nan
+        return np.count_nonzero(close_diff > 0) / float(moved)
+
+    # first threshold with the smallest ratio error, preferring the ones within the density bounds; None if no
+    # threshold produced a signal
+    @staticmethod
+    def pick_best(density, positive_ratio, target_positive_ratio, min_density, max_density):
+        error = np.abs(positive_ratio - target_positive_ratio)
+        if np.isnan(error).all():
+            return None
+        within_bounds = (density >= min_density) & (density <= max_density) & ~np.isnan(error)
+        candidates = error if not within_bounds.any() else np.where(within_bounds, error, np.nan)
+        return int(np.nanargmin(candidates))
@@ -2,8 +2,10 @@
 # output is the analysis of the current trend, namely
 # increasing uptrend/decreasing uptrend/increasing downtrend/decreasing downtrend
 from src.statemachine.strategy.TrendWave import *
+from src.statemachine.strategy.TrendWaveTable import TrendWaveTable, TrendWaveView
 from src.statemachine.strategy.Trend import Trend, INCREASING_TREND, NEUTRAL_TREND, DECREASING_TREND
 import numpy as np
+import pandas as pd
 
 INCREASING_UPTREND = "INCREASING_UPTREND"
 DECREASING_UPTREND = "DECREASING_UPTREND"
@@ -13,10 +15,23 @@ NEED_ADDITIONAL_FLAG = "NEED_ADDITIONAL_FLAG"
 
 
 class TrendAnalyzer:
+    # date(1970, 1, 1).toordinal()
+    EPOCH_DAY_ORDINAL = 719163
 
-    # return the head and the tail of the linked list
+    # return the head and the tail of the linked list; the nodes are TrendWaveView rows of a TrendWaveTable
     @staticmethod
     def convert_weighted_trend_list_to_trendwaves(weighted_trend_list, datetime_list):
+        trend_wave_table = TrendAnalyzer.convert_weighted_trend_list_to_trendwave_table(weighted_trend_list,
+                                                                                         datetime_list)
+        return trend_wave_table.get_head(), trend_wave_table.get_tail()
+
+    @staticmethod
+    def convert_weighted_trend_list_to_trendwave_table(weighted_trend_list, datetime_list):
+        return TrendWaveTable.build(weighted_trend_list, datetime_list)
+
+    # the linked list of TrendWave objects, e.g. to keep updating the tail trend wave
+    @staticmethod
+    def convert_weighted_trend_list_to_linked_trendwaves(weighted_trend_list, datetime_list):
         assert len(weighted_trend_list) == len(datetime_list)
         assert len(weighted_trend_list) > 0
         idx = 0
@@ -35,6 +50,10 @@ class TrendAnalyzer:
     # for back testing, this can take any node in the linked list, and test from there
     @staticmethod
     def get_sign_aligned_trend_waves(tail_trend: TrendWave):
+        # table rows are split by sign with a slice instead of a walk
+        if isinstance(tail_trend, TrendWaveView):
+            return tail_trend.table.get_sign_aligned_trend_waves(tail_trend.row)
+
         negative_trend_wave = []
         positive_trend_wave = []
         while tail_trend.get_prev_node() is not None:
@@ -245,13 +264,38 @@ class TrendAnalyzer:
                 trend_list.append(next_trend)
         return trend_list
 
-    # YYYY-MM-DD HH-MM-SS or YYYY-MM-DD HH; either way we are only interested in YYYY-MM-DD
+    # YYYY-MM-DD HH-MM-SS or YYYY-MM-DD HH; either way we are only interested in YYYY-MM-DD.
+    # Day ordinals (see to_day_ordinals) are subtracted as is, date strings are parsed on every call
     @staticmethod
     def days_diff(later_date, earlier_date):
-        from datetime import datetime
-        date1 = later_date.split(" ")[0]
-        date2 = earlier_date.split(" ")[0]
-        return (datetime.strptime(date1, "%Y-%m-%d") - datetime.strptime(date2, "%Y-%m-%d")).days
+        return TrendAnalyzer.to_day_ordinal(later_date) - TrendAnalyzer.to_day_ordinal(earlier_date)
+
+    # day ordinal (date.toordinal) of a day ordinal, a YYYY-MM-DD... string or a date/datetime/datetime64
+    @staticmethod
+    def to_day_ordinal(date):
+        if isinstance(date, (int, np.integer)):
+            return int(date)
+        if isinstance(date, str):
+            from datetime import datetime
+            return datetime.strptime(date.split(" ")[0], "%Y-%m-%d").toordinal()
+        return pd.Timestamp(date).toordinal()
+
+    # day ordinals of a whole date column, parsed once; the trend waves can carry these instead of the date strings
+    @staticmethod
+    def to_day_ordinals(dates):
+        dates = pd.Series(dates)
+        if len(dates) == 0:
+            return []
+        if pd.api.types.is_datetime64_any_dtype(dates):
+            days = dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        else:
+            day_strings = [date_str.split(" ")[0] for date_str in dates.astype(str).tolist()]
+            try:
+                # numpy parses zero padded ISO days much faster than strptime
+                days = np.array(day_strings, dtype="datetime64[D]")
+            except ValueError:
+                days = pd.to_datetime(pd.Series(day_strings), format="%Y-%m-%d").to_numpy().astype("datetime64[D]")
+        return (days.astype(np.int64) + TrendAnalyzer.EPOCH_DAY_ORDINAL).tolist()
 
     # Todo: this is a test/simulation
     # trendwave_list start with the latest trendwave
@@ -0,0 +1,45 @@
+import numpy as np
+
+from src.statemachine.strategy.TrendAnalyzer import TrendAnalyzer
+
+
+# Immutable run of trend waves (latest first, like the lists of TrendAnalyzer.get_trend_segments) whose
+# TrendSummary parameters are computed on first use and then reused, so a summary pass fits every segment once.
+class TrendSegment:
+    def __init__(self, trend_waves):
+        self.trend_waves = tuple(trend_waves)
+        self.params = None
+
+    def __len__(self):
+        return len(self.trend_waves)
+
+    def __iter__(self):
+        return iter(self.trend_waves)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return TrendSegment(self.trend_waves[item])
+        return self.trend_waves[item]
+
+    # same map as TrendSummary.get_trend_segment_params used to build; shared, so don't modify it
+    def get_params(self):
+        if self.params is None:
+            weighted_sum = 0
+            for tw in self.trend_waves:
+                weighted_sum += tw.get_max_amplitude() * TrendAnalyzer.days_diff(tw.get_end_time(),
+                                                                                 tw.get_start_time())
+            self.params = {"date_list": TrendAnalyzer.get_sorted_date_from_segment(self.trend_waves),
+                           "linear_gradient": self.get_linear_gradient(),
+                           "weighted_sum": weighted_sum}
+        return self.params
+
+    # TrendAnalyzer.linear_fit_trend_segment, fitted once per segment. Still np.polyfit: a closed form slope is 0
+    # exactly where polyfit leaves a +-1e-16 residue on flat runs, and the gradients are compared by sign
+    def get_linear_gradient(self):
+        if len(self.trend_waves) == 0:
+            return 0
+        # earliest first
+        y = np.array([tw.get_max_amplitude() for tw in self.trend_waves][::-1], dtype=np.float64)
+        if len(y) < 2:
+            return self.trend_waves[0].get_max_amplitude()
+        return np.polyfit(np.arange(len(y)), y, 1)[0]
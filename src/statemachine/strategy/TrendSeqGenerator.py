@@ -31,6 +31,8 @@ import pandas.core.series
 # to the underlying strategy.
 import pandas.core.series
 
+from src.statemachine.strategy.RangeExtremeTable import RangeExtremeTable
+
 UNCLEAR = 0.0
 UPTREND = 1.0
 DOWNTREND = -1.0
@@ -38,171 +40,207 @@ TRANSITION_TO_DOWNTREND = -0.5
 TRANSITION_TO_UPTREND = 0.5
 
 
-class TrendSeqGenerator:
-
-    @staticmethod
-    def generate_level2_signal(df: pd.Series, one_day_high_col, one_day_low_col, one_day_volume_col, volume_ema_col,
-                               bb_high_col, bb_low_col, threshold, trend_signal_col, signal_rectifying_trend_col):
-        uptrend_signal_col = "uptrend_signal"
-        downtrend_signal_col = "downtrend_signal"
-        df[uptrend_signal_col] = df[one_day_high_col] - df[bb_low_col]
-        df[downtrend_signal_col] = df[one_day_low_col] - df[bb_high_col]
+class DedupeModes:
+    # dates are parsed, formatted back to new_date_format strings and deduped on those strings; the deduped date
+    # column holds the strings
+    STRFTIME = "strftime"
+    # dates are floored to int64 buckets of bucket_size and the first row of each bucket is picked with np.unique;
+    # the deduped date column holds the bucket start as datetime64, no strings are built
+    EPOCH_BUCKET = "epoch_bucket"
 
-        abs_diff = abs(df[uptrend_signal_col]) - abs(df[downtrend_signal_col])
 
-        stock_price_based_threshold = df[one_day_high_col] * threshold
+# Preallocated arrays of TrendSeqGenerator.compute_level2_signal, so repeated calls don't allocate.
+# Sized for the longest frame; shorter frames use the leading part.
+class Level2SignalBuffers:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.trend_signal = np.empty(capacity, dtype=np.float64)
+        self.signal_rectifying_trend = np.empty(capacity, dtype=np.int64)
+        self.work = np.empty(capacity, dtype=np.float64)
+        self.up_mask = np.empty(capacity, dtype=bool)
+        self.down_mask = np.empty(capacity, dtype=bool)
 
-        df[trend_signal_col] = 0
-        df.loc[abs_diff > stock_price_based_threshold, trend_signal_col] = df[one_day_volume_col] / df[volume_ema_col]
-        df.loc[abs_diff < stock_price_based_threshold, trend_signal_col] = -df[one_day_volume_col] / df[volume_ema_col]
+    def get_views(self, size):
+        assert size <= self.capacity, "Level2SignalBuffers hold " + str(self.capacity) + " rows, got " + str(size)
+        return (self.trend_signal[:size], self.signal_rectifying_trend[:size], self.work[:size],
+                self.up_mask[:size], self.down_mask[:size])
 
-        TrendSeqGenerator.add_level2_signal_rectifying_column(df, trend_signal_col, signal_rectifying_trend_col)
 
+class TrendSeqGenerator:
+    # rolling trend columns of generate_trend_sequence
+    AVG_TREND_COL = "avg_trend"
+    NOISE_REDUCED_WEIGHTED_TREND_COL = "noise_reduced_weighted_trend"
+    RECTIFIED_WEIGHTED_TREND_COL = "rectified_weighted_trend"
+    # bin edges of the rectified level2 signal, 0.2 itself still rectifies to 0
+    RECTIFYING_EDGES = [-2, -1, -0.2, 0.2, 1, 2]
+
+    # out: Level2SignalBuffers to reuse across calls; only the trend signal and its rectified bucket are written to df
+    @staticmethod
+    def generate_level2_signal(df: pd.Series, one_day_high_col, one_day_low_col, one_day_volume_col, volume_ema_col,
+                               bb_high_col, bb_low_col, threshold, trend_signal_col, signal_rectifying_trend_col,
+                               out=None):
+        trend_signal, signal_rectifying_trend = TrendSeqGenerator.compute_level2_signal(
+            df[one_day_high_col].to_numpy(dtype=np.float64), df[one_day_low_col].to_numpy(dtype=np.float64),
+            df[one_day_volume_col].to_numpy(dtype=np.float64), df[volume_ema_col].to_numpy(dtype=np.float64),
+            df[bb_high_col].to_numpy(dtype=np.float64), df[bb_low_col].to_numpy(dtype=np.float64), threshold, out)
+        # pandas copies the buffers into the columns
+        df[trend_signal_col] = trend_signal
+        df[signal_rectifying_trend_col] = signal_rectifying_trend
         return
 
+    # the level2 signal of generate_level2_signal on plain arrays, in a fixed number of in-place passes:
+    # uptrend signal = 1day_high - bb_low, downtrend signal = 1day_low - bb_high; where
+    # abs(uptrend) - abs(downtrend) is above 1day_high * threshold the signal is volume / volume_ema, where it's below
+    # -volume / volume_ema, else 0.
+    # Returns (trend_signal, signal_rectifying_trend) views into out, which are overwritten by the next call with the
+    # same buffers.
+    @staticmethod
+    def compute_level2_signal(high, low, volume, volume_ema, bb_high, bb_low, threshold, out=None):
+        size = len(high)
+        if out is None:
+            out = Level2SignalBuffers(size)
+        trend_signal, signal_rectifying_trend, work, up_mask, down_mask = out.get_views(size)
+
+        np.subtract(high, bb_low, out=trend_signal)
+        np.abs(trend_signal, out=trend_signal)
+        np.subtract(low, bb_high, out=work)
+        np.abs(work, out=work)
+        # abs_diff
+        np.subtract(trend_signal, work, out=trend_signal)
+        # stock price based threshold
+        np.multiply(high, threshold, out=work)
+        np.greater(trend_signal, work, out=up_mask)
+        np.less(trend_signal, work, out=down_mask)
+
+        # a zero volume_ema gives inf/NaN silently, as the pandas division did
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(volume, volume_ema, out=work)
+        trend_signal.fill(0.)
+        np.copyto(trend_signal, work, where=up_mask)
+        np.negative(work, out=trend_signal, where=down_mask)
+
+        TrendSeqGenerator.rectify_level2_signal(trend_signal, signal_rectifying_trend, up_mask)
+        return trend_signal, signal_rectifying_trend
+
     # [-3, -2, -1, 0, 1, 2, 3] -> df[one_day_volume_col] / df[volume_ema_col]:
     # ratio of the today's volume over ema volumes of 5 days
     @staticmethod
     def add_level2_signal_rectifying_column(df, trend_signal_col, signal_rectifying_trend_col):
-        df[signal_rectifying_trend_col] = 0
-
-        df.loc[df[trend_signal_col] >= 2, signal_rectifying_trend_col] = 3
-        df[signal_rectifying_trend_col] = np.where((df[trend_signal_col] >= 1) & (df[trend_signal_col] < 2),
-                                                   2, df[signal_rectifying_trend_col])
-        df[signal_rectifying_trend_col] = np.where((df[trend_signal_col] > 0.2) & (df[trend_signal_col] < 1),
-                                                   1, df[signal_rectifying_trend_col])
-        df[signal_rectifying_trend_col] = np.where((df[trend_signal_col] >= -1) & (df[trend_signal_col] < -0.2),
-                                                   -1, df[signal_rectifying_trend_col])
-        df[signal_rectifying_trend_col] = np.where((df[trend_signal_col] >= -2) & (df[trend_signal_col] < -1),
-                                                   -2, df[signal_rectifying_trend_col])
-        df.loc[df[trend_signal_col] < -2, signal_rectifying_trend_col] = -3
+        trend_signal = df[trend_signal_col].to_numpy(dtype=np.float64)
+        signal_rectifying_trend = np.empty(len(trend_signal), dtype=np.int64)
+        TrendSeqGenerator.rectify_level2_signal(trend_signal, signal_rectifying_trend,
+                                                np.empty(len(trend_signal), dtype=bool))
+        df[signal_rectifying_trend_col] = signal_rectifying_trend
         return
 
-    # prioritize analyzing the highest amplitude signals first; use recursion to finish the analysis of entire signal seq
+    # bucket of every trend signal, digitized in place: -3 below -2, -2 in [-2, -1), -1 in [-1, -0.2), 0 in
+    # [-0.2, 0.2] and for NaN, 1 in (0.2, 1), 2 in [1, 2), 3 from 2 on. Each edge the signal reaches adds one.
+    @staticmethod
+    def rectify_level2_signal(trend_signal, out, mask):
+        out.fill(-3)
+        for edge in TrendSeqGenerator.RECTIFYING_EDGES:
+            if edge == 0.2:
+                np.greater(trend_signal, edge, out=mask)
+            else:
+                np.greater_equal(trend_signal, edge, out=mask)
+            np.add(out, mask, out=out)
+        np.isnan(trend_signal, out=mask)
+        np.copyto(out, 0, where=mask)
+        return out
+
+    # prioritize analyzing the highest amplitude signals first; the windows left of, between and right of the trends
+    # found are then analyzed the same way until the entire signal seq is covered
     # The noise reduction logic is that if the length of a uptrend/downtrend is shorter than the threshold, it's then treated as unclear trend
     # In the case of unclear trend, we assign penalty factor of -0.5/0.5; otherwise the trend is -1/1
+    # Windows are processed from an explicit stack: the max/min of a window come from a sparse table and the trend
+    # bounds from the precomputed previous/next sign change of every bar, so no window is rescanned or copied.
+    # Each window only labels the bars its sub-windows don't cover, and they are written straight into the result.
 
     @staticmethod
     def reduce_level2_signal_noise(signal_window_list, up_threshold, down_threshold):
-        res_list = [UNCLEAR] * len(signal_window_list)
-        if len(signal_window_list) <= 1:
-            return res_list
-
-        max_up_signal = max(signal_window_list)
-        min_down_signal = min(signal_window_list)
-
-        max_up_signal_index = signal_window_list.index(max_up_signal)
-        min_down_signal_index = signal_window_list.index(min_down_signal)
-
-        up_left_bound_index = None
-        up_right_bound_index = None
-
-        down_left_bound_index = None
-        down_right_bound_index = None
-
-        if max_up_signal > 0:
-            # perform analysis around the region from the left and right of this signal
-            up_left_bound_index = TrendSeqGenerator.find_first_negative_left(signal_window_list, max_up_signal_index)
-            up_right_bound_index = TrendSeqGenerator.find_first_negative_right(signal_window_list, max_up_signal_index)
-
-            meet_up_threshold = (up_right_bound_index - up_left_bound_index) >= up_threshold
-            for i in range(up_left_bound_index + 1, up_right_bound_index):
-                if meet_up_threshold:
-                    res_list[i] = UPTREND
-                else:
-                    res_list[i] = TRANSITION_TO_UPTREND
-        if min_down_signal < 0:
-            down_left_bound_index = TrendSeqGenerator.find_first_positive_left(signal_window_list,
-                                                                               min_down_signal_index)
-            down_right_bound_index = TrendSeqGenerator.find_first_positive_right(signal_window_list,
-                                                                                 min_down_signal_index)
-
-            meet_down_threshold = (down_right_bound_index - down_left_bound_index) >= down_threshold
-            for j in range(down_left_bound_index + 1, down_right_bound_index):
-                if meet_down_threshold:
-                    res_list[j] = DOWNTREND
-                else:
-                    res_list[j] = TRANSITION_TO_DOWNTREND
-
-        if up_left_bound_index is None and down_left_bound_index is None:
-            return res_list
-
-        if up_left_bound_index is None or down_left_bound_index is None:
-            return res_list
-
-        # Otherwise, uptrend and downtrend exist in the same window
-
-        if up_right_bound_index <= down_left_bound_index:
-            left_sub_window_list = signal_window_list[:up_left_bound_index + 1]
-            right_sub_window_list = signal_window_list[down_right_bound_index:]
-            mid_sub_window_list = signal_window_list[up_right_bound_index:down_left_bound_index + 1]
-            result_left_window = TrendSeqGenerator.reduce_level2_signal_noise(left_sub_window_list, up_threshold,
-                                                                              down_threshold)
-            result_right_window = TrendSeqGenerator.reduce_level2_signal_noise(right_sub_window_list, up_threshold,
-                                                                               down_threshold)
-            result_mid_window = TrendSeqGenerator.reduce_level2_signal_noise(mid_sub_window_list, up_threshold,
-                                                                             down_threshold)
-
-            final_result = result_left_window + res_list[up_left_bound_index + 1: up_right_bound_index] \
-                           + result_mid_window + res_list[down_left_bound_index + 1: down_right_bound_index] \
-                           + result_right_window
-            assert len(signal_window_list) == len(final_result)
-            return final_result
-
-        if up_left_bound_index >= down_right_bound_index:
-            left_sub_window_list = signal_window_list[:down_left_bound_index + 1]
-            right_sub_window_list = signal_window_list[up_right_bound_index:]
-            mid_sub_window_list = signal_window_list[down_right_bound_index:up_left_bound_index + 1]
-            result_left_window = TrendSeqGenerator.reduce_level2_signal_noise(left_sub_window_list, up_threshold,
-                                                                              down_threshold)
-            result_right_window = TrendSeqGenerator.reduce_level2_signal_noise(right_sub_window_list, up_threshold,
-                                                                               down_threshold)
-            result_mid_window = TrendSeqGenerator.reduce_level2_signal_noise(mid_sub_window_list, up_threshold,
-                                                                             down_threshold)
-
-            final_result = result_left_window + res_list[down_left_bound_index + 1: down_right_bound_index] \
-                           + result_mid_window + res_list[up_left_bound_index + 1: up_right_bound_index] \
-                           + result_right_window
-            assert len(signal_window_list) == len(final_result)
-            return final_result
-
-        if up_left_bound_index < down_left_bound_index < up_right_bound_index:
-            left_sub_window_list = signal_window_list[:up_left_bound_index + 1]
-            right_sub_window_list = signal_window_list[down_right_bound_index:]
-            result_left_window = TrendSeqGenerator.reduce_level2_signal_noise(left_sub_window_list, up_threshold,
-                                                                              down_threshold)
-            result_right_window = TrendSeqGenerator.reduce_level2_signal_noise(right_sub_window_list, up_threshold,
-                                                                               down_threshold)
-
-            final_result = result_left_window + res_list[
-                                                up_left_bound_index + 1:down_right_bound_index] + result_right_window
-
-            assert len(final_result) == len(signal_window_list)
-            return final_result
-
-        if down_left_bound_index < up_left_bound_index < down_right_bound_index:
-            left_sub_window_list = signal_window_list[:down_left_bound_index + 1]
-            right_sub_window_list = signal_window_list[up_right_bound_index:]
-            result_left_window = TrendSeqGenerator.reduce_level2_signal_noise(left_sub_window_list, up_threshold,
-                                                                              down_threshold)
-            result_right_window = TrendSeqGenerator.reduce_level2_signal_noise(right_sub_window_list, up_threshold,
-                                                                               down_threshold)
-
-            final_result = result_left_window + res_list[
-                                                down_left_bound_index + 1:up_right_bound_index] + result_right_window
-
-            assert len(final_result) == len(signal_window_list)
-            return final_result
-
-        return res_list
+        signals = np.asarray(signal_window_list, dtype=np.float64)
+        size = len(signals)
+        result = np.full(size, UNCLEAR)
+        if size <= 1:
+            return result.tolist()
+
+        extremes = RangeExtremeTable(signals)
+        signal_values = signals.tolist()
+        prev_negative = TrendSeqGenerator.get_previous_indices(signals < 0)
+        next_negative = TrendSeqGenerator.get_next_indices(signals < 0)
+        prev_positive = TrendSeqGenerator.get_previous_indices(signals > 0)
+        next_positive = TrendSeqGenerator.get_next_indices(signals > 0)
+
+        # [start, end) windows still to analyze
+        windows = [(0, size)]
+        while len(windows) > 0:
+            start, end = windows.pop()
+            if end - start <= 1:
+                continue
+            max_up_signal_index = extremes.argmax(start, end)
+            min_down_signal_index = extremes.argmin(start, end)
+            has_uptrend = signal_values[max_up_signal_index] > 0
+            has_downtrend = signal_values[min_down_signal_index] < 0
+
+            if has_uptrend:
+                # bounded by the closest negative signals around it, else by the window start/end
+                up_left_bound_index = max(prev_negative[max_up_signal_index], start)
+                up_right_bound_index = min(next_negative[max_up_signal_index], end)
+                meet_up_threshold = (up_right_bound_index - up_left_bound_index) >= up_threshold
+                result[up_left_bound_index + 1:up_right_bound_index] = \
+                    UPTREND if meet_up_threshold else TRANSITION_TO_UPTREND
+            if has_downtrend:
+                down_left_bound_index = max(prev_positive[min_down_signal_index], start)
+                down_right_bound_index = min(next_positive[min_down_signal_index], end)
+                meet_down_threshold = (down_right_bound_index - down_left_bound_index) >= down_threshold
+                # where both ranges overlap the downtrend wins
+                result[down_left_bound_index + 1:down_right_bound_index] = \
+                    DOWNTREND if meet_down_threshold else TRANSITION_TO_DOWNTREND
+
+            if not (has_uptrend and has_downtrend):
+                continue
+
+            # Otherwise, uptrend and downtrend exist in the same window
+            if up_right_bound_index <= down_left_bound_index:
+                windows.append((start, up_left_bound_index + 1))
+                windows.append((up_right_bound_index, down_left_bound_index + 1))
+                windows.append((down_right_bound_index, end))
+            elif up_left_bound_index >= down_right_bound_index:
+                windows.append((start, down_left_bound_index + 1))
+                windows.append((down_right_bound_index, up_left_bound_index + 1))
+                windows.append((up_right_bound_index, end))
+            elif up_left_bound_index < down_left_bound_index < up_right_bound_index:
+                windows.append((start, up_left_bound_index + 1))
+                windows.append((down_right_bound_index, end))
+            elif down_left_bound_index < up_left_bound_index < down_right_bound_index:
+                windows.append((start, down_left_bound_index + 1))
+                windows.append((up_right_bound_index, end))
+        return result.tolist()
+
+    # index of the last True strictly before every position, -1 if there is none
+    @staticmethod
+    def get_previous_indices(mask):
+        last = np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+        previous = np.empty(len(mask), dtype=np.int64)
+        previous[:1] = -1
+        previous[1:] = last[:-1]
+        return previous.tolist()
+
+    # index of the first True at or after every position, len(mask) if there is none
+    @staticmethod
+    def get_next_indices(mask):
+        indices = np.where(mask, np.arange(len(mask)), len(mask))
+        return np.minimum.accumulate(indices[::-1])[::-1].tolist()
 
     # level2_signal will be compressed to 1 day resolution
     # window_size and step_size is based on 1 hour
     # min_continuous_uptrend/min_continuous_downtrend is based on 5min resolution
     # trend_sequence generated is based on 1 hour resolution; lookback_window_size is based on 1 hour resolution
+    # dedupe_mode/bucket_size: see DedupeModes; bucket_size is a pandas timedelta string such as "1h" or "30min"
     @staticmethod
     def generate_trend_sequence(df: pandas.core.series.Series, trend_signal_col, signal_rectifying_trend_col,
-                                min_continuous_uptrend, min_continuous_downtrend, lookback_window_size, date_col="date"):
+                                min_continuous_uptrend, min_continuous_downtrend, lookback_window_size, date_col="date",
+                                dedupe_mode=DedupeModes.STRFTIME, bucket_size="1h"):
 
         # get noise reduced signals
         noise_reduced_trend_signal_list = TrendSeqGenerator.reduce_level2_signal_noise(
@@ -219,41 +257,91 @@ class TrendSeqGenerator:
                                                  date_col,
                                                  "%Y-%m-%d %H:%M:%S",
                                                  "%Y-%m-%d %H",
-                                                 [trend_signal_col, signal_rectifying_trend_col,noise_reduced_trend_col])
+                                                 [trend_signal_col, signal_rectifying_trend_col,noise_reduced_trend_col],
+                                                 dedupe_mode,
+                                                 bucket_size)
 
-        original_trend_signal_list = df_deduped[trend_signal_col].values.tolist()
+        original_trend_signal = df_deduped[trend_signal_col].to_numpy(dtype=np.float64)
         # original level2 is weighted by volume/volume_ema
-        rectifying_trend_signal_list = df_deduped[signal_rectifying_trend_col].values.tolist()
-        noise_reduced_trend_signal_list = df_deduped[noise_reduced_trend_col].values.tolist()
+        weighted_rectifying_trend = df_deduped[signal_rectifying_trend_col].to_numpy(dtype=np.float64) * np.abs(
+            original_trend_signal)
+        weighted_noise_reduced_trend = df_deduped[noise_reduced_trend_col].to_numpy(dtype=np.float64) * np.abs(
+            original_trend_signal)
 
-        trend_avg_list = [0] * (lookback_window_size - 1)
-        weighted_signal_rectifying_trend_list = [0] * (lookback_window_size - 1)
-        weighted_noise_reduced_trend_list = [0] * (lookback_window_size - 1)
+        # the average covers the current hour, the weighted trends only the lookback_window_size - 1 hours before it
         window_size = float(lookback_window_size)
-        for i in range(lookback_window_size - 1, len(original_trend_signal_list)):
-
-            trend_avg_list.append(sum(original_trend_signal_list[i - lookback_window_size + 1:i + 1]) / window_size)
-            weighted_rectifying_trend_sum = sum([(rectifying_trend_signal_list[k]) * abs(original_trend_signal_list[k])
-                                                for k in range(i - lookback_window_size + 1, i)])
-            weighted_noise_reduced_trend_sum = sum([(noise_reduced_trend_signal_list[k]) * abs(original_trend_signal_list[k])
-                                                    for k in range(i - lookback_window_size + 1, i)])
-            weighted_signal_rectifying_trend_list.append(weighted_rectifying_trend_sum / window_size)
-            weighted_noise_reduced_trend_list.append(weighted_noise_reduced_trend_sum/window_size)
-
-        assert len(trend_avg_list) == len(weighted_signal_rectifying_trend_list) == len(weighted_noise_reduced_trend_list)
-        df_deduped["avg_trend"] = trend_avg_list
-        df_deduped["noise_reduced_weighted_trend"] = weighted_noise_reduced_trend_list
-        df_deduped["rectified_weighted_trend"] = weighted_signal_rectifying_trend_list
+        df_deduped[TrendSeqGenerator.AVG_TREND_COL] = TrendSeqGenerator.get_rolling_window_sum(
+            original_trend_signal, lookback_window_size, True) / window_size
+        df_deduped[TrendSeqGenerator.NOISE_REDUCED_WEIGHTED_TREND_COL] = TrendSeqGenerator.get_rolling_window_sum(
+            weighted_noise_reduced_trend, lookback_window_size, False) / window_size
+        df_deduped[TrendSeqGenerator.RECTIFIED_WEIGHTED_TREND_COL] = TrendSeqGenerator.get_rolling_window_sum(
+            weighted_rectifying_trend, lookback_window_size, False) / window_size
 
         return df_deduped
 
+    # sum of values[i - window_size + 1:i + 1] (or [..:i] without the current value) for every i from
+    # window_size - 1 on, 0 before. Computed as one vectorized add per window offset, so every window is summed left to
+    # right exactly like sum() over the slice: a cumsum difference would leave +-1e-16 residues where the weighted
+    # trend should be exactly 0, and its sign is what splits the trend waves.
     @staticmethod
-    def dedupe_df(df, normalized_new_col, existing_date_col, original_date_format, new_date_format, columns_to_keep):
+    def get_rolling_window_sum(values, window_size, include_current=True):
+        sums = np.zeros(len(values))
+        window_count = len(values) - window_size + 1
+        if window_count <= 0:
+            return sums
+        terms = window_size if include_current else window_size - 1
+        window_sums = np.zeros(window_count)
+        for offset in range(terms):
+            window_sums += values[offset:offset + window_count]
+        sums[window_size - 1:] = window_sums
+        return sums
+
+    @staticmethod
+    def dedupe_df(df, normalized_new_col, existing_date_col, original_date_format, new_date_format, columns_to_keep,
+                  dedupe_mode=DedupeModes.STRFTIME, bucket_size="1h"):
+        if dedupe_mode == DedupeModes.EPOCH_BUCKET:
+            return TrendSeqGenerator.dedupe_df_by_bucket(df, existing_date_col, original_date_format, columns_to_keep,
+                                                         bucket_size)
         df[normalized_new_col] = pd.to_datetime(df[existing_date_col], format=original_date_format).dt.strftime(
             new_date_format)
         columns_to_keep_after_dedupe = [normalized_new_col] + columns_to_keep
         return df[columns_to_keep_after_dedupe].drop_duplicates(subset=normalized_new_col).rename(columns={normalized_new_col: existing_date_col})
 
+    # first row of every bucket_size bucket, in the original row order and with the original index
+    @staticmethod
+    def dedupe_df_by_bucket(df, existing_date_col, original_date_format, columns_to_keep, bucket_size="1h"):
+        dates = df[existing_date_col]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, format=original_date_format)
+        bucket_ns = pd.Timedelta(bucket_size).value
+        tz = dates.dt.tz
+        if tz is None:
+            buckets = dates.to_numpy(dtype="datetime64[ns]").view(np.int64) // bucket_ns * bucket_ns
+        else:
+            buckets = TrendSeqGenerator.get_local_bucket_starts(pd.DatetimeIndex(dates), bucket_ns)
+        _, first_index = np.unique(buckets, return_index=True)
+        first_index.sort()
+
+        bucket_dates = buckets[first_index].view("datetime64[ns]")
+        if tz is not None:
+            bucket_dates = pd.DatetimeIndex(bucket_dates).tz_localize("UTC").tz_convert(tz)
+        data = {existing_date_col: bucket_dates}
+        for column_name in columns_to_keep:
+            data[column_name] = df[column_name].to_numpy()[first_index]
+        return pd.DataFrame(data, index=df.index[first_index])
+
+    # UTC epoch ns of the start of the local wall time bucket of every tz-aware date, so a daily bucket is a local
+    # day. A bucket start in the hour repeated when DST ends is the one of the two the date isn't before.
+    @staticmethod
+    def get_local_bucket_starts(dates, bucket_ns):
+        epoch = dates.asi8
+        local_floor = pd.DatetimeIndex(dates.tz_localize(None).asi8 // bucket_ns * bucket_ns)
+        dst_starts = local_floor.tz_localize(dates.tz, ambiguous=np.ones(len(dates), dtype=bool),
+                                             nonexistent="shift_forward").asi8
+        standard_starts = local_floor.tz_localize(dates.tz, ambiguous=np.zeros(len(dates), dtype=bool),
+                                                  nonexistent="shift_forward").asi8
+        return np.where(standard_starts <= epoch, standard_starts, dst_starts)
+
     @staticmethod
     def find_first_negative_left(signal_window_list, pivot_index):
         for i in range(pivot_index - 1, -1, -1):
@@ -2,6 +2,7 @@ from src.statemachine.strategy.TrendAnalyzer import *
 from src.statemachine.strategy.TrendWave import *
 from src.statemachine.strategy.Trend import *
 from src.statemachine.strategy.TrendSeqGenerator import *
+from src.statemachine.strategy.TrendSegment import TrendSegment
 
 
 INCREASING_UPTREND = "INCREASING_UPTREND"
@@ -16,6 +17,9 @@ class TrendSummary:
     def get_trend_insight_from_past_n_days(up_trendwave_list, down_trendwave_list, days_ago=30):
         up_trendwave_segments, down_trendwave_segments = \
             TrendAnalyzer.get_trend_segments(up_trendwave_list, down_trendwave_list)
+        # each segment is fitted once, whichever of the checks below asks for its params first
+        up_trendwave_segments = [TrendSegment(seg) for seg in up_trendwave_segments]
+        down_trendwave_segments = [TrendSegment(seg) for seg in down_trendwave_segments]
 
         up_trendseg_idx = 0
         down_trendseg_idx = 0
@@ -36,7 +40,7 @@ class TrendSummary:
         else:
             latest_date = down_dates[-1][1]
 
-        comparison_start_date = TrendSummary.days_ago(latest_date, days_ago)
+        comparison_start_date = TrendSummary.days_ago_ordinal(latest_date, days_ago)
 
         eligible_up_segments = []
         eligible_down_segments = []
@@ -82,33 +86,30 @@ class TrendSummary:
             # accept the trend start date at most 5 days earlier to the comparison date
             if TrendSummary.days_after_start_date(comparison_start_date, [(tw.get_start_time(), tw.get_end_time())]) >= 1:
                 trimmed_segment.append(tw)
-        return trimmed_segment
+        return TrendSegment(trimmed_segment)
 
     @staticmethod
     def is_segment_eligible_for_analysis(comparison_start_date, segment):
         date_list = TrendSummary.get_trend_segment_params(segment)["date_list"]
         return TrendSummary.days_after_start_date(comparison_start_date, date_list) > 0
 
-    # trend_segment: subset of the entire trendwave list, divided by the local max/min point
+    # trend_segment: subset of the entire trendwave list, divided by the local max/min point; a TrendSegment keeps
+    # its params, a list is fitted on every call
     @staticmethod
     def get_trend_segment_params(trend_segment):
-        params_map = {"date_list": TrendAnalyzer.get_sorted_date_from_segment(trend_segment),
-                      "linear_gradient": TrendAnalyzer.linear_fit_trend_segment(trend_segment)}
-        weighted_sum = 0
-        for tw in trend_segment:
-            weighted_sum += tw.get_max_amplitude() * TrendAnalyzer.days_diff(tw.get_end_time(), tw.get_start_time())
-
-        params_map["weighted_sum"] = weighted_sum
-
-        return params_map
-
+        if not isinstance(trend_segment, TrendSegment):
+            trend_segment = TrendSegment(trend_segment)
+        return trend_segment.get_params()
 
     @staticmethod
     def days_ago(end_date, n_days_ago=20):
         import datetime
-        date1 = end_date.split(" ")[0]
-        delta = datetime.timedelta(days=n_days_ago)
-        return datetime.datetime.strptime(date1, "%Y-%m-%d") - delta
+        return datetime.datetime.fromordinal(TrendSummary.days_ago_ordinal(end_date, n_days_ago))
+
+    # day ordinal n_days_ago before end_date (a day ordinal or a date string)
+    @staticmethod
+    def days_ago_ordinal(end_date, n_days_ago=20):
+        return TrendAnalyzer.to_day_ordinal(end_date) - n_days_ago
 
     @staticmethod
     def str_date_to_datetime(date_str):
@@ -116,17 +117,19 @@ class TrendSummary:
         date1 = date_str.split(" ")[0]
         return datetime.strptime(date1, "%Y-%m-%d")
 
+    # comparison_start_date and the dates of the pairs can be day ordinals, date strings or datetimes at midnight
     @staticmethod
     def days_after_start_date(comparison_start_date, date_pair_list):
+        comparison_start_date = TrendAnalyzer.to_day_ordinal(comparison_start_date)
         days = 0
         for i in range(len(date_pair_list) - 1, -1, -1):
-            end_date = TrendSummary.str_date_to_datetime(date_pair_list[i][1])
-            start_date = TrendSummary.str_date_to_datetime(date_pair_list[i][0])
-            if (end_date - comparison_start_date).days <= 0:
+            end_date = TrendAnalyzer.to_day_ordinal(date_pair_list[i][1])
+            start_date = TrendAnalyzer.to_day_ordinal(date_pair_list[i][0])
+            if end_date - comparison_start_date <= 0:
                 return days
-            if (start_date - comparison_start_date).days >= 0:
-                days += (end_date - start_date).days
+            if start_date - comparison_start_date >= 0:
+                days += end_date - start_date
             else:
-                days += (end_date - comparison_start_date).days
+                days += end_date - comparison_start_date
                 return days
         return days
@@ -0,0 +1,65 @@
+from eventkit import Event
+
+from src.statemachine.strategy.TrendWave import TrendWave
+
+
+# Live counterpart of TrendAnalyzer.convert_weighted_trend_list_to_linked_trendwaves for one symbol: keeps the open
+# tail TrendWave and extends the linked list one weighted trend value at a time with the same update_trend_wave
+# rules, so appending the values one by one gives the same waves as converting the whole list.
+# completed_trend_wave_event emits (symbol, completed trend wave) each time a wave is closed, right after the new
+# tail is linked to it.
+class TrendWaveBuilder:
+    def __init__(self, symbol=None):
+        self.symbol = symbol
+        self.head = None
+        self.tail = None
+        self.trend_wave_count = 0
+        self.value_count = 0
+        # earliest first, the tail included
+        self.positive_trend_waves = []
+        self.negative_trend_waves = []
+        self.completed_trend_wave_event = Event("completed_trend_wave_event")
+
+    # returns the wave completed by the value, if any
+    def append(self, value, timestamp):
+        if self.tail is None:
+            self.head = self.add_trend_wave(value, timestamp, None)
+        completed_trend_wave = None
+        self.tail.update_trend_wave(value, timestamp)
+        if self.tail.is_current_trend_wave_completed():
+            completed_trend_wave = self.tail
+            completed_trend_wave.set_next_node(self.add_trend_wave(value, timestamp, completed_trend_wave))
+        self.value_count += 1
+        if completed_trend_wave is not None:
+            self.completed_trend_wave_event.emit(self.symbol, completed_trend_wave)
+        return completed_trend_wave
+
+    # returns the waves completed by the values
+    def extend(self, values, timestamps):
+        assert len(values) == len(timestamps)
+        completed_trend_waves = []
+        for value, timestamp in zip(values, timestamps):
+            completed_trend_wave = self.append(value, timestamp)
+            if completed_trend_wave is not None:
+                completed_trend_waves.append(completed_trend_wave)
+        return completed_trend_waves
+
+    def add_trend_wave(self, value, timestamp, prev):
+        trend_wave = TrendWave(value, timestamp, prev, value > 0)
+        if trend_wave.get_sign():
+            self.positive_trend_waves.append(trend_wave)
+        else:
+            self.negative_trend_waves.append(trend_wave)
+        self.tail = trend_wave
+        self.trend_wave_count += 1
+        return trend_wave
+
+    def get_head(self):
+        return self.head
+
+    def get_tail(self):
+        return self.tail
+
+    # same as TrendAnalyzer.get_sign_aligned_trend_waves(self.get_tail()) without walking the list
+    def get_sign_aligned_trend_waves(self):
+        return self.positive_trend_waves[::-1], self.negative_trend_waves[::-1]
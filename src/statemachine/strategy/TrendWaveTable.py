@@ -0,0 +1,189 @@
+import numpy as np
+
+
+# Columnar store of the trend waves of a weighted trend list, built in one pass with the same state machine as
+# TrendWave.update_trend_wave: row i holds the i-th wave from the earliest, and start_idx/end_idx point into the
+# weighted trend list (and datetime list) it was built from.
+# Every wave but the last one is completed; the last one is the tail that is still being updated.
+class TrendWaveTable:
+    def __init__(self, start_idx, end_idx, max_amplitude, tail_amplitude, sign, datetime_list):
+        self.start_idx = start_idx
+        self.end_idx = end_idx
+        self.max_amplitude = max_amplitude
+        self.tail_amplitude = tail_amplitude
+        self.sign = sign
+        self.datetime_list = datetime_list
+        # python values for the TrendWaveView getters, which read one row at a time
+        self.start_idx_values = start_idx.tolist()
+        self.end_idx_values = end_idx.tolist()
+        self.max_amplitude_values = max_amplitude.tolist()
+        self.tail_amplitude_values = tail_amplitude.tolist()
+        self.sign_values = sign.tolist()
+        # rows of either sign, earliest first; filtering by sign is slicing these
+        self.positive_rows = np.flatnonzero(sign)
+        self.negative_rows = np.flatnonzero(~sign)
+        self.nodes = [None] * len(sign)
+        # per value of the weighted trend list: row, end_idx, max_amplitude and tail_amplitude of the wave being
+        # updated right after it, see get_prefix
+        self.history = None
+
+    @staticmethod
+    def build(weighted_trend_list, datetime_list, keep_history=False):
+        assert len(weighted_trend_list) == len(datetime_list)
+        assert len(weighted_trend_list) > 0
+        values = np.asarray(weighted_trend_list, dtype=np.float64).tolist()
+        start_idx, end_idx, max_amplitude, tail_amplitude, sign = [], [], [], [], []
+        row_history, end_history, max_history, tail_history = [], [], [], []
+
+        wave_start = wave_end = 0
+        wave_max = wave_tail = values[0]
+        is_positive = wave_max > 0
+        for idx, value in enumerate(values):
+            is_completed = False
+            # go up, or keep going down without crossing 0: the wave continues; anything else completes it
+            if is_positive:
+                if value >= wave_max:
+                    wave_max = wave_tail = value
+                    wave_end = idx
+                elif 0 <= value <= wave_tail:
+                    wave_tail = value
+                    wave_end = idx
+                else:
+                    is_completed = True
+            else:
+                if value <= wave_max:
+                    wave_max = wave_tail = value
+                    wave_end = idx
+                elif wave_tail <= value <= 0:
+                    wave_tail = value
+                    wave_end = idx
+                else:
+                    is_completed = True
+            if is_completed:
+                # a new wave starts at the current value
+                start_idx.append(wave_start)
+                end_idx.append(wave_end)
+                max_amplitude.append(wave_max)
+                tail_amplitude.append(wave_tail)
+                sign.append(is_positive)
+                wave_start = wave_end = idx
+                wave_max = wave_tail = value
+                is_positive = value > 0
+            if keep_history:
+                row_history.append(len(sign))
+                end_history.append(wave_end)
+                max_history.append(wave_max)
+                tail_history.append(wave_tail)
+
+        start_idx.append(wave_start)
+        end_idx.append(wave_end)
+        max_amplitude.append(wave_max)
+        tail_amplitude.append(wave_tail)
+        sign.append(is_positive)
+        trend_wave_table = TrendWaveTable(np.array(start_idx, dtype=np.int64), np.array(end_idx, dtype=np.int64),
+                                          np.array(max_amplitude, dtype=np.float64),
+                                          np.array(tail_amplitude, dtype=np.float64), np.array(sign, dtype=bool),
+                                          datetime_list)
+        if keep_history:
+            trend_wave_table.history = (np.array(row_history, dtype=np.int64), np.array(end_history, dtype=np.int64),
+                                        np.array(max_history, dtype=np.float64),
+                                        np.array(tail_history, dtype=np.float64))
+        return trend_wave_table
+
+    # the table build() would return for the first length values, from a table built with keep_history: the waves
+    # completed by then are shared rows, the tail is the wave as it was after the last of those values
+    def get_prefix(self, length):
+        assert self.history is not None, "Build the table with keep_history"
+        assert length > 0
+        row_history, end_history, max_history, tail_history = self.history
+        tail_row = row_history[length - 1]
+        return TrendWaveTable(self.start_idx[:tail_row + 1],
+                              np.append(self.end_idx[:tail_row], end_history[length - 1]),
+                              np.append(self.max_amplitude[:tail_row], max_history[length - 1]),
+                              np.append(self.tail_amplitude[:tail_row], tail_history[length - 1]),
+                              self.sign[:tail_row + 1], self.datetime_list)
+
+    def __len__(self):
+        return len(self.sign)
+
+    # rows of the given sign up to last_row (the tail by default), latest first; a view of the sign rows
+    def get_sign_rows(self, is_positive, last_row=None):
+        rows = self.positive_rows if is_positive else self.negative_rows
+        if last_row is None:
+            return rows[::-1]
+        return rows[:np.searchsorted(rows, last_row, side="right")][::-1]
+
+    # same as TrendAnalyzer.get_sign_aligned_trend_waves from the wave at last_row
+    def get_sign_aligned_trend_waves(self, last_row=None):
+        return TrendWaveSequence(self, self.get_sign_rows(True, last_row)), \
+            TrendWaveSequence(self, self.get_sign_rows(False, last_row))
+
+    # TrendWave compatible node of a row, created on first access
+    def get_node(self, row):
+        if row < 0:
+            row += len(self.sign)
+        node = self.nodes[row]
+        if node is None:
+            node = TrendWaveView(self, row)
+            self.nodes[row] = node
+        return node
+
+    def get_head(self):
+        return self.get_node(0)
+
+    def get_tail(self):
+        return self.get_node(len(self.sign) - 1)
+
+
+# Read only TrendWave of a TrendWaveTable row, for the callers walking or reading trend waves
+class TrendWaveView:
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def is_current_trend_wave_completed(self):
+        return self.row < len(self.table) - 1
+
+    def get_max_amplitude(self):
+        return self.table.max_amplitude_values[self.row]
+
+    def get_tail_amplitude(self):
+        return self.table.tail_amplitude_values[self.row]
+
+    def get_sign(self):
+        return self.table.sign_values[self.row]
+
+    def get_start_time(self):
+        return self.table.datetime_list[self.table.start_idx_values[self.row]]
+
+    def get_end_time(self):
+        return self.table.datetime_list[self.table.end_idx_values[self.row]]
+
+    def get_prev_node(self):
+        if self.row == 0:
+            return None
+        return self.table.get_node(self.row - 1)
+
+    def get_next_node(self):
+        if self.row == len(self.table) - 1:
+            return None
+        return self.table.get_node(self.row + 1)
+
+
+# List like sequence of table rows handing out their TrendWaveView nodes
+class TrendWaveSequence:
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return TrendWaveSequence(self.table, self.rows[item])
+        return self.table.get_node(int(self.rows[item]))
+
+    def __iter__(self):
+        for row in self.rows.tolist():
+            yield self.table.get_node(row)
@@ -0,0 +1,143 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.statemachine.strategy.BasicStrategy import BasicStrategy
+
+
+class BacktestStrategies:
+    STRATEGIZE = "strategize"
+    STRATEGIZE_2 = "strategize_2"
+
+
+# Walk-forward predictions of one symbol, one row per day that the strategy gives a prediction for:
+#   prediction      what BasicStrategy.strategize(_2) returns with the price history up to that day (NaN if it raised)
+#   realized_close  close horizon_days rows later, max_close the highest close in between (both NaN past the end)
+#   hit             realized close within hit_tolerance of the prediction
+#   breach          realized close above the prediction, i.e. a call struck there expires in the money
+#   path_breach     some close up to horizon_days rows later is above the prediction
+class BacktestResult:
+    def __init__(self, symbol, df, error_count):
+        self.symbol = symbol
+        self.df = df
+        self.error_count = error_count
+
+    def get_scored_df(self):
+        return self.df[self.df["prediction"].notna() & self.df["realized_close"].notna()]
+
+    def get_summary(self):
+        scored_df = self.get_scored_df()
+        count = len(scored_df)
+        return {"symbol": self.symbol,
+                "prediction_count": int(self.df["prediction"].notna().sum()),
+                "scored_count": count,
+                "error_count": self.error_count,
+                "hit_rate": scored_df["hit"].mean() if count > 0 else np.nan,
+                "breach_rate": scored_df["breach"].mean() if count > 0 else np.nan,
+                "path_breach_rate": scored_df["path_breach"].mean() if count > 0 else np.nan}
+
+
+# Replays BasicStrategy.strategize / strategize_2 for every day of one_day_price_df in one sweep, giving the same
+# predictions as calling it with the price history up to each day. The trend waves of preprocessed_df are built
+# once and every day's backward trend signal search reads them as a prefix, sharing the summaries of the prefixes
+# the searches of earlier days already evaluated. Symbols are spread over a process pool.
+class WalkForwardBacktester:
+    def __init__(self, strategy=BacktestStrategies.STRATEGIZE_2, days_from_today=10, mark_up_factor=0.05,
+                 horizon_days=10, hit_tolerance=0.05, max_workers=None):
+        assert strategy in [BacktestStrategies.STRATEGIZE, BacktestStrategies.STRATEGIZE_2], \
+            "Unknown strategy " + str(strategy)
+        assert horizon_days > 0
+        self.strategy = strategy
+        self.days_from_today = days_from_today
+        self.mark_up_factor = mark_up_factor
+        self.horizon_days = horizon_days
+        self.hit_tolerance = hit_tolerance
+        self.max_workers = max_workers
+
+    # {symbol: (preprocessed_df, one_day_price_df)} -> {symbol: BacktestResult}
+    def backtest_all(self, symbol_frames):
+        symbols = list(symbol_frames.keys())
+        preprocessed_dfs = [symbol_frames[symbol][0] for symbol in symbols]
+        one_day_price_dfs = [symbol_frames[symbol][1] for symbol in symbols]
+        if len(symbols) <= 1 or self.max_workers == 1:
+            results = [self.backtest(preprocessed_df, one_day_price_df, symbol)
+                       for preprocessed_df, one_day_price_df, symbol in zip(preprocessed_dfs, one_day_price_dfs,
+                                                                             symbols)]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(self.backtest, preprocessed_dfs, one_day_price_dfs, symbols))
+        return dict(zip(symbols, results))
+
+    def backtest(self, preprocessed_df, one_day_price_df, symbol=None):
+        current_price_list = one_day_price_df["close"].values.tolist()
+        current_volume_list = one_day_price_df["volume"].values.tolist()
+        date_list = one_day_price_df["date"].values.tolist()
+
+        predictions = np.full(len(date_list), np.nan)
+        error_count = 0
+        search = WalkForwardBacktester.get_trend_signal_search(preprocessed_df)
+        # the first days the strategies return 0 for, as they don't have enough prices yet
+        first_day = 1 if self.strategy == BacktestStrategies.STRATEGIZE else 10
+        for day in range(first_day, len(date_list)):
+            try:
+                trend_summary = search(date_list[day])
+                if self.strategy == BacktestStrategies.STRATEGIZE:
+                    predictions[day] = BasicStrategy.strategize_with_trend_summary(
+                        current_price_list[:day + 1], current_volume_list[:day + 1], trend_summary,
+                        self.days_from_today)
+                else:
+                    predictions[day] = BasicStrategy.strategize_2_with_trend_summary(
+                        current_price_list[:day + 1], current_volume_list[:day + 1], date_list[:day + 1],
+                        trend_summary, self.days_from_today, self.mark_up_factor, verbose=False)
+            except Exception:
+                error_count += 1
+
+        df = self.score(date_list, current_price_list, predictions)
+        return BacktestResult(symbol, df.iloc[first_day:].reset_index(drop=True), error_count)
+
+    # cut-off date string -> BasicStrategy.find_last_certain_trend_signal(preprocessed_df, cut-off date string)
+    @staticmethod
+    def get_trend_signal_search(preprocessed_df):
+        if len(preprocessed_df) < 15 or not preprocessed_df["date"].is_monotonic_increasing:
+            return lambda cut_off_date_string: BasicStrategy.find_last_certain_trend_signal(preprocessed_df,
+                                                                                            cut_off_date_string)
+        date_list, day_ordinals, sigma_trend_wave_table, ema_trend_wave_table = \
+            BasicStrategy.get_trend_wave_tables(preprocessed_df)
+        trend_summary_cache = {}
+
+        def search(cut_off_date_string):
+            row_count = int(np.searchsorted(date_list, cut_off_date_string, side="left"))
+            return BasicStrategy.search_certain_trend_signal(sigma_trend_wave_table, ema_trend_wave_table,
+                                                             date_list, day_ordinals, row_count, cut_off_date_string,
+                                                             trend_summary_cache)
+        return search
+
+    def score(self, date_list, current_price_list, predictions):
+        close = np.asarray(current_price_list, dtype=np.float64)
+        horizon_days = self.horizon_days
+        realized_close = np.full(len(close), np.nan)
+        max_close = np.full(len(close), np.nan)
+        if len(close) > horizon_days:
+            realized_close[:-horizon_days] = close[horizon_days:]
+            # closes of the following horizon_days rows
+            max_close[:-horizon_days] = sliding_window_view(close[1:], horizon_days).max(axis=1)
+
+        with np.errstate(invalid="ignore"):
+            hit = np.abs(realized_close - predictions) <= self.hit_tolerance * realized_close
+            breach = realized_close > predictions
+            path_breach = max_close > predictions
+        return pd.DataFrame({"date": date_list,
+                             "close": close,
+                             "prediction": predictions,
+                             "realized_close": realized_close,
+                             "max_close": max_close,
+                             "hit": hit,
+                             "breach": breach,
+                             "path_breach": path_breach})
+
+    # one summary row per symbol, see BacktestResult.get_summary
+    @staticmethod
+    def get_summary_df(results):
+        return pd.DataFrame([result.get_summary() for result in results.values()])
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the covered call modules import their siblings by module name
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "coveredcalltrade"))
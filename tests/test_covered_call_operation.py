@@ -0,0 +1,76 @@
+from eventkit import Event
+from ib_insync import Option, Stock, Ticker
+
+from CoveredCallOperation import CoveredCallOperation
+from MarketDataSubscriptionManager import MarketDataSubscriptionManager, SubscriptionPriority
+
+
+class FakeIB:
+    def __init__(self):
+        self.is_connected = True
+        self.connectedEvent = Event("connectedEvent")
+        self.disconnectedEvent = Event("disconnectedEvent")
+
+    def isConnected(self):
+        return self.is_connected
+
+    def reqMktData(self, contract):
+        return Ticker(contract=contract)
+
+    def cancelMktData(self, contract):
+        return
+
+
+class FakeOpenOrderIndex:
+    def has_open_option_trade_within_dte(self, symbol, right, max_dte):
+        return False
+
+
+class FakeTradeManager:
+    def __init__(self):
+        self.trades = []
+
+    def is_trade_manager_busy(self):
+        return False
+
+    def execute_trade(self, symbol, option_contract, stock_ticker, quantity, min_price, max_price):
+        self.trades.append(stock_ticker)
+        return stock_ticker
+
+
+# an operation with only the parts placing orders; the constructor needs the account positions
+def get_operation(ib, market_data_manager):
+    operation = object.__new__(CoveredCallOperation)
+    operation.symbol = "AAPL"
+    operation.short_term_dte_limit = 30
+    operation.open_order_index = FakeOpenOrderIndex()
+    operation.trade_manager_to_sell_calls = FakeTradeManager()
+    operation.trade_manager_to_buyback_calls = FakeTradeManager()
+    operation.market_data_manager = market_data_manager
+    operation.stock_contract = Stock("AAPL", "SMART", currency="USD")
+    return operation
+
+
+def test_orders_use_the_current_stock_ticker_and_wait_for_a_line():
+    ib = FakeIB()
+    market_data_manager = MarketDataSubscriptionManager(ib, max_lines=1)
+    operation = get_operation(ib, market_data_manager)
+    call_contract = Option("AAPL", "20990101", 150, "C", "SMART")
+    call_callback = lambda ticker: None
+    market_data_manager.subscribe(call_contract, call_callback, SubscriptionPriority.OPEN_POSITION)
+
+    # over the budget the stock line waits
+    operation.subscribe_to_stock_data_streams()
+    assert operation.place_sell_order(call_contract, 100, 1.2, 1.1) is None
+    assert operation.trade_manager_to_sell_calls.trades == []
+
+    # the line freed by the call goes to the stock; after a reconnect the stock has a new ticker
+    market_data_manager.unsubscribe(call_contract, call_callback)
+    old_stock_ticker = market_data_manager.get_ticker(operation.stock_contract)
+    assert old_stock_ticker is not None
+    ib.disconnectedEvent.emit()
+    ib.connectedEvent.emit()
+    stock_ticker = market_data_manager.get_ticker(operation.stock_contract)
+    assert stock_ticker is not None and stock_ticker is not old_stock_ticker
+    assert operation.place_buy_order(call_contract, -1, 1.2, 1.1) is stock_ticker
+    assert operation.trade_manager_to_buyback_calls.trades == [stock_ticker]
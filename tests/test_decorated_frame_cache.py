@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.statemachine.dataprocessing.DecoratedFrameCache import DecoratedFrameCache
+from src.statemachine.dataprocessing.IndicatorDecorator import IndicatorDecorator
+
+
+def get_1hour_df(periods, tz=None, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=periods))
+    df = pd.DataFrame({"date": pd.date_range("2021-03-01 09:00", periods=periods, freq="1h", tz=tz),
+                       "open": close + rng.normal(scale=0.1, size=periods),
+                       "high": close + 1,
+                       "low": close - 1,
+                       "close": close,
+                       "volume": rng.integers(1000, 2000, size=periods).astype(np.float64)})
+    return IndicatorDecorator.rename_ohlcv_columns(df, "1hour")
+
+
+def test_hit_and_miss_return_the_same_tz_aware_dates(tmp_path):
+    df = get_1hour_df(300, "US/Eastern")
+    cache = DecoratedFrameCache(str(tmp_path))
+
+    missed = cache.get_decorated("AAPL", df, "1hour")
+    hit = cache.get_decorated("AAPL", df, "1hour")
+
+    assert str(missed["date"].dt.tz) == "US/Eastern"
+    pd.testing.assert_frame_equal(hit, missed, check_dtype=False)
+    assert hit["date"].dtype == missed["date"].dtype
+
+
+def test_append_drops_the_bytes_of_an_unfinished_append(tmp_path):
+    df = get_1hour_df(300)
+    cache = DecoratedFrameCache(str(tmp_path))
+    cache.get_decorated("AAPL", df.iloc[:250], "1hour")
+
+    # an append that wrote its column bytes but died before writing its meta
+    entry_dir = cache.entry_dir(next(iter(cache.get_index())))
+    for file_name in os.listdir(entry_dir):
+        if file_name.endswith(".bin"):
+            with open(os.path.join(entry_dir, file_name), "ab") as f:
+                f.write(b"\0" * 8 * 10)
+
+    appended = cache.get_decorated("AAPL", df, "1hour")
+    reloaded = cache.get_decorated("AAPL", df, "1hour")
+
+    pd.testing.assert_frame_equal(appended, reloaded)
+    pd.testing.assert_series_equal(reloaded["date"], pd.Series(df["date"].to_numpy(), name="date"))
+    pd.testing.assert_series_equal(reloaded["1hour_close"], df["1hour_close"].reset_index(drop=True),
+                                   check_dtype=False)
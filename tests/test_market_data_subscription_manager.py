@@ -0,0 +1,150 @@
+from eventkit import Event
+from ib_insync import Option, Stock, Ticker
+
+from MarketDataSubscriptionManager import MarketDataSubscriptionManager, SubscriptionPriority
+
+
+class FakeIB:
+    def __init__(self):
+        self.is_connected = True
+        self.line_map = {}
+        self.request_count = 0
+        self.connectedEvent = Event("connectedEvent")
+        self.disconnectedEvent = Event("disconnectedEvent")
+
+    def isConnected(self):
+        return self.is_connected
+
+    def reqMktData(self, contract):
+        key = MarketDataSubscriptionManager.get_contract_key(contract)
+        assert key not in self.line_map
+        self.line_map[key] = Ticker(contract=contract)
+        self.request_count += 1
+        return self.line_map[key]
+
+    def cancelMktData(self, contract):
+        del self.line_map[MarketDataSubscriptionManager.get_contract_key(contract)]
+
+    def disconnect(self):
+        self.is_connected = False
+        self.line_map = {}
+        self.disconnectedEvent.emit()
+
+    def connect(self):
+        self.is_connected = True
+        self.connectedEvent.emit()
+
+
+def get_option(strike):
+    return Option("AAPL", "20990101", strike, "C", "SMART")
+
+
+def get_line_strikes(ib):
+    return sorted(ticker.contract.strike for ticker in ib.line_map.values())
+
+
+class Subscriber:
+    def __init__(self):
+        self.updates = []
+
+    def __call__(self, ticker):
+        self.updates.append(ticker.contract.strike)
+
+
+def test_set_subscriptions_only_requests_and_cancels_the_difference():
+    ib = FakeIB()
+    manager = MarketDataSubscriptionManager(ib)
+    subscriber = Subscriber()
+
+    manager.set_subscriptions(subscriber, [get_option(150), get_option(155), get_option(160)])
+    kept_ticker = manager.get_ticker(get_option(155))
+    manager.set_subscriptions(subscriber, [get_option(155), get_option(160), get_option(165)])
+
+    assert get_line_strikes(ib) == [155, 160, 165]
+    assert manager.get_ticker(get_option(155)) is kept_ticker
+    assert manager.get_ticker(get_option(150)) is None
+    metrics = manager.get_churn_metrics()
+    assert (metrics["request_count"], metrics["cancel_count"]) == (4, 1)
+
+    kept_ticker.updateEvent.emit(kept_ticker)
+    assert subscriber.updates == [155]
+
+
+def test_lines_are_shared_until_the_last_subscriber_leaves():
+    ib = FakeIB()
+    manager = MarketDataSubscriptionManager(ib)
+    subscriber = Subscriber()
+    other_subscriber = Subscriber()
+
+    ticker = manager.subscribe(get_option(150), subscriber)
+    assert manager.subscribe(get_option(150), other_subscriber) is ticker
+    assert ib.request_count == 1
+    assert manager.get_churn_metrics()["reuse_count"] == 1
+
+    manager.unsubscribe(get_option(150), subscriber)
+    ticker.updateEvent.emit(ticker)
+    assert (subscriber.updates, other_subscriber.updates) == ([], [150])
+    assert get_line_strikes(ib) == [150]
+
+    manager.unsubscribe(get_option(150), other_subscriber)
+    assert get_line_strikes(ib) == []
+    assert manager.get_ticker(get_option(150)) is None
+
+
+def test_lowest_priority_latest_lines_wait_over_the_budget():
+    ib = FakeIB()
+    manager = MarketDataSubscriptionManager(ib, max_lines=3)
+    candidate_subscriber = Subscriber()
+    stock_subscriber = Subscriber()
+
+    manager.set_subscriptions(candidate_subscriber, [get_option(150), get_option(155), get_option(160)])
+    manager.subscribe(get_option(165), candidate_subscriber)
+    assert get_line_strikes(ib) == [150, 155, 160]
+    assert manager.get_ticker(get_option(165)) is None
+
+    # a higher priority line evicts the latest candidate
+    stock_ticker = manager.subscribe(Stock("AAPL", "SMART", "USD"), stock_subscriber, SubscriptionPriority.STOCK)
+    assert stock_ticker is not None
+    assert get_line_strikes(ib) == [0., 150, 155]
+    assert manager.get_churn_metrics()["eviction_count"] == 1
+    assert manager.get_churn_metrics()["waiting_count"] == 2
+
+    # freed lines go to the waiting ones, earliest first
+    manager.unsubscribe(get_option(150), candidate_subscriber)
+    assert get_line_strikes(ib) == [0., 155, 160]
+    assert manager.get_ticker(get_option(165)) is None
+    assert manager.get_churn_metrics()["peak_line_count"] == 3
+
+
+def test_active_lines_are_requested_again_after_a_reconnect():
+    ib = FakeIB()
+    manager = MarketDataSubscriptionManager(ib, max_lines=2)
+    subscriber = Subscriber()
+    manager.set_subscriptions(subscriber, [get_option(150), get_option(155), get_option(160)])
+    old_ticker = manager.get_ticker(get_option(150))
+
+    ib.disconnect()
+    assert manager.get_ticker(get_option(150)) is None
+    assert manager.get_churn_metrics()["active_line_count"] == 0
+    # changes while disconnected wait for the connection
+    manager.set_subscriptions(subscriber, [get_option(150), get_option(160)])
+    assert ib.line_map == {}
+
+    ib.connect()
+    assert get_line_strikes(ib) == [150, 160]
+    new_ticker = manager.get_ticker(get_option(150))
+    assert new_ticker is not old_ticker
+    old_ticker.updateEvent.emit(old_ticker)
+    new_ticker.updateEvent.emit(new_ticker)
+    assert subscriber.updates == [150]
+
+
+def test_shared_manager_is_one_per_client(monkeypatch):
+    monkeypatch.setattr(MarketDataSubscriptionManager, "shared_manager_map", {})
+    ib = FakeIB()
+    other_ib = FakeIB()
+
+    manager = MarketDataSubscriptionManager.get_shared_manager(ib)
+
+    assert MarketDataSubscriptionManager.get_shared_manager(ib) is manager
+    assert MarketDataSubscriptionManager.get_shared_manager(other_ib) is not manager
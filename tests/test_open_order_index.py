@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+from eventkit import Event
+from ib_insync import LimitOrder, Option, OrderStatus, Stock, Trade
+
+from OpenOrderIndex import OpenOrderIndex
+
+
+class FakeIB:
+    def __init__(self, open_trades=None):
+        self.open_trades = open_trades if open_trades is not None else []
+        self.newOrderEvent = Event("newOrderEvent")
+        self.openOrderEvent = Event("openOrderEvent")
+        self.orderStatusEvent = Event("orderStatusEvent")
+        self.execDetailsEvent = Event("execDetailsEvent")
+        self.connectedEvent = Event("connectedEvent")
+
+    def openTrades(self):
+        return self.open_trades
+
+
+def get_expiry(days):
+    return (date.today() + timedelta(days)).strftime("%Y%m%d")
+
+
+def get_trade(contract, status=OrderStatus.Submitted):
+    return Trade(contract=contract, order=LimitOrder("SELL", 1, 1.0), orderStatus=OrderStatus(status=status))
+
+
+def test_trades_are_added_and_removed_by_their_status():
+    ib = FakeIB()
+    index = OpenOrderIndex(ib)
+    expiry = get_expiry(10)
+    call_trade = get_trade(Option("AAPL", expiry, 150, "CALL", "SMART"), OrderStatus.PendingSubmit)
+    stock_trade = get_trade(Stock("AAPL", "SMART", "USD"))
+
+    ib.newOrderEvent.emit(call_trade)
+    ib.openOrderEvent.emit(stock_trade)
+    assert index.has_open_trade("AAPL", "C", expiry)
+    assert index.has_open_trade("AAPL", "", "")
+    assert index.get_open_option_trades("AAPL") == [call_trade]
+    assert index.has_open_option_trade_within_dte("AAPL", "C", 30)
+    assert not index.has_open_option_trade_within_dte("AAPL", "C", 5)
+    assert not index.has_open_option_trade_within_dte("AAPL", "P", 30)
+    assert index.has_open_option_trade_near("AAPL", expiry, 160)
+    assert not index.has_open_option_trade_near("AAPL", expiry, 170)
+
+    # a status update of a trade that is still working keeps it filed once
+    call_trade.orderStatus.status = OrderStatus.Submitted
+    ib.orderStatusEvent.emit(call_trade)
+    assert index.get_open_trades("AAPL", "CALL", expiry) == [call_trade]
+
+    for status in OrderStatus.DoneStates:
+        call_trade.orderStatus.status = status
+        ib.orderStatusEvent.emit(call_trade)
+        assert not index.has_open_trade("AAPL", "C", expiry)
+        assert index.get_open_option_trades("AAPL") == []
+        call_trade.orderStatus.status = OrderStatus.Submitted
+        ib.orderStatusEvent.emit(call_trade)
+        assert index.has_open_trade("AAPL", "C", expiry)
+
+    stock_trade.orderStatus.status = OrderStatus.Filled
+    ib.execDetailsEvent.emit(stock_trade, None)
+    assert not index.has_open_trade("AAPL", "", "")
+
+
+def test_refresh_on_connect_rebuilds_from_the_open_trades():
+    expiry = get_expiry(10)
+    old_trade = get_trade(Option("AAPL", expiry, 150, "C", "SMART"))
+    ib = FakeIB([old_trade])
+    index = OpenOrderIndex(ib)
+    assert index.has_open_trade("AAPL", "C", expiry)
+
+    new_trade = get_trade(Option("MSFT", expiry, 300, "P", "SMART"))
+    ib.open_trades = [new_trade]
+    ib.connectedEvent.emit()
+
+    assert not index.has_open_trade("AAPL", "C", expiry)
+    assert "AAPL" not in index.symbol_key_map
+    assert index.get_open_trades("MSFT", "PUT", expiry) == [new_trade]
+
+
+def test_shared_index_is_one_per_client(monkeypatch):
+    monkeypatch.setattr(OpenOrderIndex, "shared_index_map", {})
+    ib = FakeIB()
+    other_ib = FakeIB()
+
+    index = OpenOrderIndex.get_shared_index(ib)
+
+    assert OpenOrderIndex.get_shared_index(ib) is index
+    assert OpenOrderIndex.get_shared_index(other_ib) is not index
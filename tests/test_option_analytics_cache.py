@@ -0,0 +1,164 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from ib_insync import Option
+
+from OptionAnalyticsPrefetcher import OptionAnalyticsPrefetcher
+from OptionAnalyticsCache import OptionAnalyticsCache, OptionAnalyticsEntry, RollingMaxAvg, AVG_24HR, HIGH_24HR, \
+    AVG_15DAY, HIGH_15DAY, DTE
+
+
+class FakePrefetcher:
+    def __init__(self):
+        self.requests = []
+
+    def is_pending(self, option_contract):
+        return False
+
+    def prefetch(self, option_contracts, on_option_df, duration_str='15 D', on_failure=None):
+        self.requests.append(([option_contract.strike for option_contract in option_contracts], duration_str))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.
+
+    def monotonic(self):
+        return self.now
+
+
+def get_option(strike=150):
+    return Option("AAPL", (datetime.now() + timedelta(30)).strftime("%Y%m%d"), strike, "C", "SMART")
+
+
+# 7 regular trading hour bars per weekday
+def get_option_df(day_count, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = [datetime.combine(day.date(), datetime.min.time()) + timedelta(hours=hour)
+             for day in pd.bdate_range("2021-03-01", periods=day_count) for hour in range(9, 16)]
+    return pd.DataFrame({"date": dates, "high": rng.uniform(1, 5, size=len(dates))})
+
+
+def get_expected_analytics(option_df):
+    highs = option_df["high"].to_numpy()
+    window_start = OptionAnalyticsEntry.get_window_start(option_df["date"].iloc[-1])
+    highs_15day = highs[(option_df["date"] >= window_start).to_numpy()]
+    return {AVG_24HR: highs[-24:].mean(), HIGH_24HR: highs[-24:].max(),
+            AVG_15DAY: highs_15day.mean(), HIGH_15DAY: highs_15day.max()}
+
+
+def assert_analytics_equal(analytics, expected):
+    for name, value in expected.items():
+        assert np.isclose(analytics[name], value), name
+
+
+def test_rolling_max_avg_matches_the_window_recomputed():
+    rng = np.random.default_rng(0)
+    window = RollingMaxAvg()
+    values = []
+    for i in range(500):
+        value = float(rng.integers(0, 20))
+        window.push(i, value)
+        values.append((i, value))
+        if rng.random() < 0.3:
+            max_count = int(rng.integers(0, 30))
+            window.evict_to_count(max_count)
+            values = values[max(len(values) - max_count, 0):]
+        if rng.random() < 0.1:
+            window.evict_before(i - 10)
+            values = [(bar_date, value) for bar_date, value in values if bar_date >= i - 10]
+
+        window_values = [value for _, value in values]
+        assert len(window) == len(values)
+        assert window.get_max(-1.) == max(window_values + [-1.])
+        assert np.isclose(window.get_avg(3.), (sum(window_values) + 3.) / (len(window_values) + 1))
+
+
+def test_incremental_refreshes_match_a_full_recompute():
+    option_df = get_option_df(25)
+    full_entry = OptionAnalyticsEntry(get_option())
+    full_entry.add_bars(option_df)
+    assert_analytics_equal(full_entry.get_analytics(), get_expected_analytics(option_df))
+
+    entry = OptionAnalyticsEntry(get_option())
+    entry.add_bars(option_df.iloc[:70])
+    end = 70
+    while end < len(option_df):
+        # a refresh returns the newest cached bar again, with the high it reached since
+        start = end - 1
+        end = min(end + 5, len(option_df))
+        refresh_df = option_df.iloc[start:end].copy()
+        if end < len(option_df):
+            refresh_df.iloc[-1, refresh_df.columns.get_loc("high")] = 0.5
+        entry.add_bars(refresh_df)
+        assert_analytics_equal(entry.get_analytics(), get_expected_analytics(refresh_df.combine_first(
+            option_df.iloc[:end]).sort_values("date")))
+
+    assert_analytics_equal(entry.get_analytics(), full_entry.get_analytics())
+    assert entry.get_analytics()[DTE] == full_entry.get_analytics()[DTE]
+
+
+def test_expired_contract_has_no_analytics():
+    entry = OptionAnalyticsEntry(Option("AAPL", "20210305", 150, "C", "SMART"))
+    entry.add_bars(get_option_df(3))
+
+    assert entry.has_bars()
+    assert entry.get_analytics() is None
+
+
+def test_failed_refreshes_back_off_up_to_the_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, "monotonic", clock.monotonic)
+    entry = OptionAnalyticsEntry(get_option())
+    assert entry.is_expired(3600, 60)
+
+    for backoff_seconds in [60, 120, 240, 480, 960, 1920, 3600, 3600]:
+        entry.add_failure()
+        clock.now += backoff_seconds - 1
+        assert not entry.is_expired(3600, 60)
+        clock.now += 1
+        assert entry.is_expired(3600, 60)
+
+    entry.add_bars(get_option_df(3))
+    assert entry.failure_count == 0
+    clock.now += 3599
+    assert not entry.is_expired(3600, 60)
+    clock.now += 1
+    assert entry.is_expired(3600, 60)
+
+
+def test_cache_refreshes_only_the_expired_contracts_since_their_newest_bar(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, "monotonic", clock.monotonic)
+    prefetcher = FakePrefetcher()
+    cache = OptionAnalyticsCache(None, ttl_seconds=3600, prefetcher=prefetcher, retry_seconds=60)
+
+    assert cache.get_analytics(get_option(150)) is None
+    assert prefetcher.requests == [([150], '15 D')]
+
+    option_df = get_option_df(3)
+    option_df["date"] = [datetime.now() - timedelta(hours=len(option_df) - i) for i in range(len(option_df))]
+    cache.add_bars(get_option(150), option_df)
+    cache.add_failure(get_option(155))
+    cache.prefetch([get_option(150), get_option(155), get_option(160)])
+    assert prefetcher.requests[1:] == [([160], '15 D')]
+
+    clock.now += 3600
+    assert cache.get_analytics(get_option(150)) is not None
+    assert prefetcher.requests[2][1].endswith(' S')
+
+
+def test_shared_cache_is_one_per_client_and_symbol(monkeypatch):
+    monkeypatch.setattr(OptionAnalyticsCache, "shared_cache_map", {})
+    monkeypatch.setattr(OptionAnalyticsPrefetcher, "shared_prefetcher_map", {})
+    ib = object()
+    other_ib = object()
+
+    cache = OptionAnalyticsCache.get_shared_cache(ib, "AAPL")
+
+    assert OptionAnalyticsCache.get_shared_cache(ib, "AAPL") is cache
+    assert OptionAnalyticsCache.get_shared_cache(ib, "MSFT") is not cache
+    assert OptionAnalyticsCache.get_shared_cache(other_ib, "AAPL") is not cache
+    assert OptionAnalyticsCache.get_shared_cache(other_ib, "AAPL").prefetcher is not cache.prefetcher
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from ib_insync import BarData, Option
+
+from OptionAnalyticsPrefetcher import HistoricalDataPacer, OptionAnalyticsPrefetcher
+
+
+class FakeIB:
+    def __init__(self, bar_count_map):
+        # strike -> number of bars returned, None to raise
+        self.bar_count_map = bar_count_map
+        self.requests = []
+        self.running_count = 0
+        self.peak_running_count = 0
+
+    async def reqHistoricalDataAsync(self, contract, durationStr, endDateTime, barSizeSetting, whatToShow, useRTH):
+        self.requests.append((contract.strike, durationStr))
+        self.running_count += 1
+        self.peak_running_count = max(self.peak_running_count, self.running_count)
+        await asyncio.sleep(0.01)
+        self.running_count -= 1
+        bar_count = self.bar_count_map[contract.strike]
+        if bar_count is None:
+            raise ConnectionError("lost")
+        start = datetime(2021, 3, 1, 9)
+        return [BarData(date=start + timedelta(hours=i), open=1., high=2., low=0.5, close=1.5, volume=10)
+                for i in range(bar_count)]
+
+
+def get_option(strike):
+    return Option("AAPL", "20990101", strike, "C", "SMART")
+
+
+def test_prefetch_fetches_each_contract_once_and_calls_every_callback():
+    ib = FakeIB({150: 5, 155: 3, 160: 0, 165: None})
+    received = []
+    failed = []
+
+    async def run():
+        prefetcher = OptionAnalyticsPrefetcher(ib, max_concurrent_requests=2)
+        on_option_df = lambda option_contract, option_df: received.append((option_contract.strike, len(option_df)))
+        on_failure = lambda option_contract: failed.append(option_contract.strike)
+        task = prefetcher.prefetch([get_option(strike) for strike in [150, 155, 160, 165]], on_option_df, '2 D',
+                                   on_failure)
+        # already pending: no second request, the callback waits for the same bars
+        assert prefetcher.prefetch([get_option(150)], on_option_df) is None
+        assert prefetcher.is_pending(get_option(150))
+        await task
+        assert not prefetcher.is_pending(get_option(150))
+
+    asyncio.run(run())
+
+    assert sorted(ib.requests) == [(150, '2 D'), (155, '2 D'), (160, '2 D'), (165, '2 D')]
+    assert ib.peak_running_count == 2
+    assert sorted(received) == [(150, 5), (150, 5), (155, 3)]
+    assert sorted(failed) == [160, 165]
+
+
+def test_pacer_waits_once_the_period_is_full():
+    async def run():
+        pacer = HistoricalDataPacer(max_requests=2, period_seconds=0.05)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(3):
+            await pacer.wait()
+        return loop.time() - start
+
+    assert asyncio.run(run()) >= 0.04
+
+
+def test_shared_prefetcher_is_one_per_client(monkeypatch):
+    monkeypatch.setattr(OptionAnalyticsPrefetcher, "shared_prefetcher_map", {})
+    ib = FakeIB({})
+    other_ib = FakeIB({})
+
+    prefetcher = OptionAnalyticsPrefetcher.get_shared_prefetcher(ib)
+
+    assert OptionAnalyticsPrefetcher.get_shared_prefetcher(ib) is prefetcher
+    assert OptionAnalyticsPrefetcher.get_shared_prefetcher(other_ib) is not prefetcher
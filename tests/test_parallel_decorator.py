@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.statemachine.dataprocessing.IndicatorDecorator import IndicatorDecorator
+from src.statemachine.dataprocessing.ParallelDecorator import ParallelDecorator
+
+
+def get_bars(n, freq, start, seed, date_format="%Y-%m-%d %H:%M:%S"):
+    rng = np.random.default_rng(seed)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.01, n))), 2)
+    high = np.round(close * (1 + np.abs(rng.normal(0, 0.005, n))), 2)
+    low = np.round(close * (1 - np.abs(rng.normal(0, 0.005, n))), 2)
+    return pd.DataFrame({"date": pd.date_range(start, periods=n, freq=freq).strftime(date_format),
+                         "open": np.round((high + low) / 2, 2), "high": high, "low": low, "close": close,
+                         "volume": rng.integers(1000, 100000, n).astype(float)})
+
+
+def get_symbol_frames(symbol_count, n5=600):
+    return {"S" + str(i): (get_bars(n5, "5min", "2021-01-04 09:30:00", 3 * i),
+                           get_bars(n5 // 12 + 5, "1h", "2021-01-04 09:00:00", 3 * i + 1),
+                           get_bars(n5 // 78 + 30, "1D", "2020-12-01", 3 * i + 2, "%Y-%m-%d"))
+            for i in range(symbol_count)}
+
+
+def get_shared_memory_blocks():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+
+# ordered mode waits on the symbols in order, while workers may not have attached to their input blocks yet
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_decorate_and_merge_dict_with_more_symbols_than_workers(max_workers):
+    symbol_frames = get_symbol_frames(40, 200)
+    blocks_before = get_shared_memory_blocks()
+
+    merged_frames = ParallelDecorator(max_workers=max_workers, use_fused_kernel=False).decorate_and_merge_dict(symbol_frames)
+
+    assert list(merged_frames.keys()) == list(symbol_frames.keys())
+    for symbol, frames in symbol_frames.items():
+        expected = IndicatorDecorator.decorate_and_merge(*[df.copy() for df in frames])
+        pd.testing.assert_frame_equal(merged_frames[symbol], expected)
+    assert get_shared_memory_blocks() == blocks_before
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from src.statemachine.dataprocessing.IndicatorDecorator import IndicatorDecorator
+from src.statemachine.dataprocessing.ResolutionAligner import AlignModes
+
+
+def get_frame(start, periods, freq, tz, columns, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"date": pd.date_range(start, periods=periods, freq=freq, tz=tz)})
+    for column in columns:
+        df[column] = rng.normal(size=periods)
+    return df
+
+
+def test_index_and_merge_modes_agree_on_tz_aware_dates():
+    df_5min = get_frame("2021-03-12 09:30", 600, "5min", "US/Eastern", ["close", "5min_close"], 0)
+    df_1hour = get_frame("2021-03-12 09:00", 60, "1h", "US/Eastern", ["close", "1hour_close"], 1)
+    df_1day = get_frame("2021-03-01", 20, "1D", "US/Eastern", ["1day_close"], 2)
+
+    merged = IndicatorDecorator.align_decorated(df_5min.copy(), df_1hour.copy(), df_1day.copy(), AlignModes.MERGE)
+    aligned = IndicatorDecorator.align_decorated(df_5min.copy(), df_1hour.copy(), df_1day.copy(), AlignModes.INDEX)
+
+    assert str(aligned["date"].dt.tz) == "US/Eastern"
+    pd.testing.assert_frame_equal(aligned.to_df(), merged)
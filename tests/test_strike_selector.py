@@ -0,0 +1,112 @@
+import asyncio
+from datetime import date, timedelta
+
+import numpy as np
+from ib_insync import ContractDetails, Option, OptionChain
+
+from StrikeSelector import StrikeSelector
+
+
+class FakeIB:
+    def __init__(self, expiry_strikes_map, is_qualified=True):
+        self.expiry_strikes_map = expiry_strikes_map
+        self.is_qualified = is_qualified
+        self.contract_details_requests = []
+
+    async def qualifyContractsAsync(self, contract):
+        if self.is_qualified:
+            contract.conId = 1
+        return [contract]
+
+    async def reqSecDefOptParamsAsync(self, underlyingSymbol, futFopExchange, underlyingSecType, underlyingConId):
+        # the chain's strikes are the union over its expiries
+        strikes = sorted({strike for strikes in self.expiry_strikes_map.values() for strike in strikes})
+        return [OptionChain("CBOE", 1, underlyingSymbol, "100", list(self.expiry_strikes_map.keys()), strikes),
+                OptionChain("SMART", 1, underlyingSymbol, "100", list(self.expiry_strikes_map.keys()), strikes)]
+
+    async def reqContractDetailsAsync(self, contract):
+        self.contract_details_requests.append(contract.lastTradeDateOrContractMonth)
+        return [ContractDetails(contract=Option(contract.symbol, contract.lastTradeDateOrContractMonth, strike, "C",
+                                                "SMART"))
+                for strike in self.expiry_strikes_map[contract.lastTradeDateOrContractMonth]]
+
+
+def test_get_adaptive_prediction():
+    assert StrikeSelector.get_adaptive_prediction(np.ones(40)) is None
+    assert StrikeSelector.get_adaptive_prediction(np.full(41, 100.)) == 120.
+    # 20% over 10 days
+    closes = np.full(41, 100.)
+    closes[-10:] = 120.
+    assert np.isclose(StrikeSelector.get_adaptive_prediction(closes), 1.15 * 120.)
+    # 40% over 30 days, checked first
+    closes = np.full(41, 100.)
+    closes[-30:] = 140.
+    assert np.isclose(StrikeSelector.get_adaptive_prediction(closes), 1.1 * 140.)
+
+
+def test_get_listed_expiries_falls_back_to_the_days_before():
+    listed_expiries = ["20210305", "20210311", "20210319", "20210416"]
+
+    # 0312 moved to Thursday 0311; 0326 has no listed expiry within 4 days; 0416 listed as is
+    assert StrikeSelector.get_listed_expiries(["20210305", "20210312", "20210319", "20210326", "20210416"],
+                                              listed_expiries) == ["20210305", "20210311", "20210319", "20210416"]
+    assert StrikeSelector.get_listed_expiries(["20210301"], listed_expiries) == []
+    assert StrikeSelector.get_listed_expiries(["20210311", "20210312"], listed_expiries) == ["20210311"]
+
+
+def test_get_listed_strikes_rounds_up_without_repeats():
+    listed_strikes = [100., 105., 110., 120., 130.]
+
+    assert StrikeSelector.get_listed_strikes([105, 110, 115], listed_strikes) == [105., 110., 120.]
+    assert StrikeSelector.get_listed_strikes([111, 112, 125], listed_strikes) == [120., 130.]
+    assert StrikeSelector.get_listed_strikes([135], listed_strikes) == []
+
+
+def test_candidates_are_listed_strikes_of_each_expiry():
+    today = date.today()
+    expiries = [(today + timedelta(days)).strftime("%Y%m%d") for days in [7, 14]]
+    # the first expiry only lists strikes every 10
+    ib = FakeIB({expiries[0]: [100., 110., 120., 130., 140.],
+                 expiries[1]: [100., 105., 110., 115., 120., 125., 130., 135., 140.]})
+    selector = StrikeSelector(ib)
+    closes = np.full(41, 100.)
+    loaded = []
+
+    async def run():
+        assert selector.get_candidate_contracts("AAPL", closes, expiries, loaded.append) == []
+        # no second load while the first one runs
+        assert selector.get_candidate_contracts("AAPL", closes, expiries, loaded.append) == []
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+
+    assert loaded == ["AAPL"]
+    assert sorted(ib.contract_details_requests) == expiries
+    candidates = selector.get_candidate_contracts("AAPL", closes, expiries)
+    assert [(option.lastTradeDateOrContractMonth, option.strike) for option in candidates] == \
+        [(expiries[0], 130.), (expiries[0], 140.), (expiries[1], 125.), (expiries[1], 130.), (expiries[1], 135.)]
+
+
+def test_failed_load_is_not_retried_before_retry_seconds():
+    ib = FakeIB({}, is_qualified=False)
+    selector = StrikeSelector(ib, retry_seconds=3600)
+
+    async def run():
+        assert selector.get_option_chain("AAPL", ["20990101"]) is None
+        await asyncio.sleep(0.01)
+        assert "AAPL" in selector.failed_at_map
+        assert selector.get_option_chain("AAPL", ["20990101"]) is None
+        assert "AAPL" not in selector.loading_symbols
+
+    asyncio.run(run())
+
+
+def test_shared_selector_is_one_per_client(monkeypatch):
+    monkeypatch.setattr(StrikeSelector, "shared_selector_map", {})
+    ib = FakeIB({})
+    other_ib = FakeIB({})
+
+    selector = StrikeSelector.get_shared_selector(ib)
+
+    assert StrikeSelector.get_shared_selector(ib) is selector
+    assert StrikeSelector.get_shared_selector(other_ib) is not selector
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from src.statemachine.strategy.TrendSeqGenerator import TrendSeqGenerator, DedupeModes
+
+
+def test_dedupe_df_by_bucket_daily_buckets_are_local_days():
+    # 20:00 US/Eastern is 01:00 UTC of the next day; it belongs to the local day's bucket
+    dates = pd.to_datetime(["2021-03-01 09:30", "2021-03-01 20:00", "2021-03-02 09:30", "2021-03-02 20:00"])
+    df = pd.DataFrame({"date": dates.tz_localize("US/Eastern"), "value": [1, 2, 3, 4]})
+
+    deduped = TrendSeqGenerator.dedupe_df(df, "tmp", "date", None, None, ["value"], DedupeModes.EPOCH_BUCKET, "1D")
+
+    assert deduped["value"].tolist() == [1, 3]
+    assert str(deduped["date"].dt.tz) == "US/Eastern"
+    assert deduped["date"].tolist() == [pd.Timestamp("2021-03-01", tz="US/Eastern"),
+                                        pd.Timestamp("2021-03-02", tz="US/Eastern")]
+
+
+def test_dedupe_df_by_bucket_hourly_buckets_across_dst_fall_back():
+    # 01:xx happens twice on 2021-11-07; each hour is its own bucket with its own offset
+    dates = pd.date_range("2021-11-07 05:00", periods=8, freq="30min", tz="UTC").tz_convert("US/Eastern")
+    df = pd.DataFrame({"date": dates, "value": range(8)})
+
+    deduped = TrendSeqGenerator.dedupe_df(df, "tmp", "date", None, None, ["value"], DedupeModes.EPOCH_BUCKET, "1h")
+
+    assert deduped["value"].tolist() == [0, 2, 4, 6]
+    assert deduped["date"].tolist() == dates[::2].tolist()